@@ -0,0 +1,732 @@
+"""
+Reproducible benchmark suite for the studio pipelines.
+
+    python bench.py run --out bench_results.json
+    python bench.py run --sizes 1024 --repeat 5 --cases remove_logo:manual,upscale:fast
+    python bench.py compare baseline.json bench_results.json --threshold 0.10
+    python bench.py calibrate            # model_costs.json for routing.py
+    python bench.py accuracy             # watermark detectors vs. ground truth
+    python bench.py encode               # output formats: encode time vs. bytes
+
+Every case runs in a fresh child process so peak RSS is attributable to that
+case alone; one extra request per input runs under tracemalloc to report the
+transient memory a warm request allocates. The corpus is generated deterministically from the images that
+ship with the repo, so two runs on the same host are directly comparable.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import traceback
+
+import cv2
+import numpy as np
+
+STUDIO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(STUDIO_DIR)
+
+from metrics import record_stages, summarize_stages
+
+DEFAULT_SIZES = [512, 1024, 2048]
+SOURCE_IMAGES = [
+    os.path.join(STUDIO_DIR, "enhancer", "Eagle.jpeg"),
+    os.path.join(STUDIO_DIR, "Png_Imagi", "ironman.jpg"),
+]
+ALL_CASES = [
+    "remove_logo:manual",
+    "remove_logo:auto",
+    "upscale:fast",
+    "upscale:quality",
+    "rembg",
+    "rembg:webp",
+    "rembg:mask",
+    "rembg:full",
+    "video",
+]
+
+
+# --------------------------------------------------------------------------------
+# Corpus
+# --------------------------------------------------------------------------------
+def resize_long_side(img, size):
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=interp)
+
+
+def add_synthetic_watermark(img, text="SAMPLE", seed=0):
+    """Overlay a tiled, rotated, semi-transparent stock-style watermark.
+
+    Returns the watermarked image and the ground-truth watermark mask.
+    """
+    rng = np.random.default_rng(seed)
+    h, w = img.shape[:2]
+    diag = int(np.hypot(h, w))
+    layer = np.zeros((diag, diag), np.uint8)
+    font_scale = max(0.6, diag / 900)
+    thickness = max(1, int(font_scale * 2))
+    (tw, th), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    step_x, step_y = int(tw * 1.8), int(th * 4)
+    offset = int(rng.integers(0, step_x))
+    for row, y in enumerate(range(th, diag, step_y)):
+        for x in range(-offset + (row % 2) * step_x // 2, diag, step_x):
+            cv2.putText(layer, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, 255, thickness, cv2.LINE_AA)
+
+    rot = cv2.getRotationMatrix2D((diag / 2, diag / 2), 35, 1.0)
+    layer = cv2.warpAffine(layer, rot, (diag, diag))
+    y0, x0 = (diag - h) // 2, (diag - w) // 2
+    layer = layer[y0:y0 + h, x0:x0 + w]
+
+    alpha = (layer.astype(np.float32) / 255.0 * 0.45)[..., None]
+    marked = (img.astype(np.float32) * (1 - alpha) + 255.0 * alpha).clip(0, 255).astype(np.uint8)
+    _, mask = cv2.threshold(layer, 20, 255, cv2.THRESH_BINARY)
+    return marked, mask
+
+
+def generate_clip(path, size=(320, 240), frames=20, fps=10):
+    """Synthetic clip: a moving subject over a textured background."""
+    w, h = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    rng = np.random.default_rng(0)
+    background = rng.integers(60, 200, (h, w, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (0, 0), 6)
+    for i in range(frames):
+        frame = background.copy()
+        cx = int(w * 0.2 + (w * 0.6) * i / max(1, frames - 1))
+        cv2.circle(frame, (cx, h // 2), h // 5, (40, 90, 220), -1)
+        cv2.rectangle(frame, (cx - h // 10, h // 2 + h // 5), (cx + h // 10, h - 10), (30, 160, 60), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def build_corpus(corpus_dir, sizes):
+    """Write the benchmark inputs and return {size: {...paths}} plus the clip path."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    sources = [p for p in SOURCE_IMAGES if os.path.exists(p)]
+    sources += sorted(p for p in glob.glob(os.path.join(STUDIO_DIR, "Png_Imagi", "[0-9].jpg")))
+    if not sources:
+        raise FileNotFoundError("No corpus source images found")
+
+    corpus = {"images": {}, "clip": None}
+    for size in sizes:
+        entries = []
+        for i, src in enumerate(sources):
+            img = cv2.imread(src, cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            base = resize_long_side(img, size)
+            marked, mask = add_synthetic_watermark(base, seed=i)
+            stem = f"{size}_{i}"
+            entry = {
+                "source": os.path.relpath(src, STUDIO_DIR),
+                "clean": os.path.join(corpus_dir, f"{stem}_clean.jpg"),
+                "marked": os.path.join(corpus_dir, f"{stem}_marked.jpg"),
+                "mask": os.path.join(corpus_dir, f"{stem}_mask.png"),
+                "shape": list(base.shape[:2]),
+            }
+            cv2.imwrite(entry["clean"], base, [cv2.IMWRITE_JPEG_QUALITY, 92])
+            cv2.imwrite(entry["marked"], marked, [cv2.IMWRITE_JPEG_QUALITY, 92])
+            cv2.imwrite(entry["mask"], mask)
+            entries.append(entry)
+        corpus["images"][size] = entries
+
+    corpus["clip"] = generate_clip(os.path.join(corpus_dir, "clip.mp4"))
+    return corpus
+
+
+# --------------------------------------------------------------------------------
+# Cases
+# --------------------------------------------------------------------------------
+def _case_remove_logo(entry, out_dir, auto):
+    from logo_remover.remover import remove_logo
+    out = os.path.join(out_dir, "remove_logo.jpg")
+    result = remove_logo(entry["marked"], "AUTO" if auto else entry["mask"], out)
+    if not result:
+        raise RuntimeError("remove_logo failed")
+
+
+def _case_upscale(entry, out_dir, mode):
+    from enhancer.enhance import premium_ai_upscale
+    out = os.path.join(out_dir, "upscaled.jpg")
+    if not premium_ai_upscale(entry["clean"], out, mode=mode):
+        raise RuntimeError("premium_ai_upscale failed")
+
+
+def _case_rembg(entry, out_dir, output="png"):
+    from bg_remover.remover import remove_background, get_session, OUTPUT_FORMATS
+    with open(entry["clean"], "rb") as f:
+        data = f.read()
+    get_session("u2netp")
+    result = remove_background(data, "u2netp", output=output)
+    with open(os.path.join(out_dir, f"no_bg_{output}{OUTPUT_FORMATS[output][0]}"), "wb") as f:
+        f.write(result)
+
+
+def _case_rembg_full(entry, out_dir):
+    # Whole image through rembg.remove(): the pre-engine baseline
+    from rembg import remove, new_session
+    from metrics import stage
+    with open(entry["clean"], "rb") as f:
+        data = f.read()
+    with stage("rembg.load"):
+        session = new_session("u2netp")
+    with stage("rembg.remove"):
+        output = remove(data, session=session)
+    with open(os.path.join(out_dir, "no_bg_full.png"), "wb") as f:
+        f.write(output)
+
+
+def _case_video(clip, out_dir):
+    from video_remover.remove_video import remove_video_background
+    remove_video_background(clip, os.path.join(out_dir, "clip_no_bg.webm"))
+
+
+def resolve_case(case, entry, clip, out_dir):
+    if case == "remove_logo:manual":
+        return lambda: _case_remove_logo(entry, out_dir, auto=False)
+    if case == "remove_logo:auto":
+        return lambda: _case_remove_logo(entry, out_dir, auto=True)
+    if case == "upscale:fast":
+        return lambda: _case_upscale(entry, out_dir, "fast")
+    if case == "upscale:quality":
+        return lambda: _case_upscale(entry, out_dir, "quality")
+    if case == "rembg":
+        return lambda: _case_rembg(entry, out_dir)
+    if case in ("rembg:webp", "rembg:mask"):
+        return lambda: _case_rembg(entry, out_dir, case.split(":")[1])
+    if case == "rembg:full":
+        return lambda: _case_rembg_full(entry, out_dir)
+    if case == "video":
+        return lambda: _case_video(clip, out_dir)
+    raise ValueError(f"Unknown case: {case}")
+
+
+# --------------------------------------------------------------------------------
+# Runner
+# --------------------------------------------------------------------------------
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(np.floor(k)), int(np.ceil(k))
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _child(case, entries, clip, repeat, warmup, results):
+    """Runs inside a fresh process so ru_maxrss reflects this case only."""
+    out_dir = tempfile.mkdtemp(prefix="studio_bench_out_")
+    latencies, stage_totals, megapixels, alloc_peaks = [], {}, 0.0, []
+    try:
+        # Silence the pipelines' progress prints so the report stays readable
+        sys.stdout = open(os.devnull, "w")
+        for entry in entries:
+            fn = resolve_case(case, entry, clip, out_dir)
+            for _ in range(warmup):
+                fn()
+            for _ in range(repeat):
+                with record_stages() as log:
+                    start = time.perf_counter()
+                    fn()
+                    latencies.append(time.perf_counter() - start)
+                for name, seconds in summarize_stages(log).items():
+                    stage_totals[name] = stage_totals.get(name, 0.0) + seconds
+                if entry is not None:
+                    megapixels += entry["shape"][0] * entry["shape"][1] / 1e6
+            # One extra, untimed request under tracemalloc: the transient memory
+            # a steady-state request allocates (numpy/OpenCV arrays included)
+            tracemalloc.start()
+            fn()
+            alloc_peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        results.put({
+            "latencies": latencies,
+            "stages": stage_totals,
+            "megapixels": megapixels,
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "alloc_peak_bytes": max(alloc_peaks) if alloc_peaks else 0,
+        })
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()})
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def run_case(case, entries, clip, repeat, warmup):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(case, entries, clip, repeat, warmup, results))
+    proc.start()
+    proc.join()
+    if results.empty():
+        return {"error": f"child exited with code {proc.exitcode}"}
+    raw = results.get()
+    if "error" in raw:
+        return raw
+
+    latencies = raw["latencies"]
+    total = sum(latencies)
+    n = len(latencies)
+    return {
+        "iterations": n,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p90": percentile(latencies, 90) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "mean": total / n * 1000,
+            "min": min(latencies) * 1000,
+            "max": max(latencies) * 1000,
+        },
+        "throughput_per_s": n / total if total else None,
+        "megapixels_per_s": raw["megapixels"] / total if total and raw["megapixels"] else None,
+        "peak_rss_mb": raw["peak_rss_bytes"] / (1024 * 1024),
+        "alloc_peak_mb": raw["alloc_peak_bytes"] / (1024 * 1024),
+        "stages_ms": {name: seconds / n * 1000 for name, seconds in sorted(raw["stages"].items())},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=STUDIO_DIR, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else DEFAULT_SIZES
+    cases = args.cases.split(",") if args.cases else ALL_CASES
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="studio_bench_corpus_")
+
+    print(f"Building corpus in {corpus_dir} ...")
+    corpus = build_corpus(corpus_dir, sizes)
+
+    report = {
+        "meta": {
+            "timestamp": int(time.time()),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+        },
+        "cases": {},
+    }
+
+    for case in cases:
+        # The clip has a fixed size; every other case is measured per resolution
+        targets = [(None, [None])] if case == "video" else [(s, corpus["images"][s]) for s in sizes]
+        for size, entries in targets:
+            key = case if size is None else f"{case}@{size}"
+            print(f"Running {key} ...")
+            result = run_case(case, entries, corpus["clip"], args.repeat, args.warmup)
+            report["cases"][key] = result
+            if "error" in result:
+                print(f"  ERROR: {result['error']}")
+            else:
+                lat = result["latency_ms"]
+                print(f"  p50 {lat['p50']:.1f} ms  p90 {lat['p90']:.1f} ms  peak RSS {result['peak_rss_mb']:.0f} MB"
+                      f"  allocated/request {result['alloc_peak_mb']:.0f} MB")
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved benchmark report to: {args.out}")
+
+    if not args.corpus_dir:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+    return 0
+
+
+# --------------------------------------------------------------------------------
+# Compare
+# --------------------------------------------------------------------------------
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    regressions = []
+    print(f"{'case':<32} {'p50 base':>10} {'p50 new':>10} {'delta':>8} {'RSS base':>9} {'RSS new':>9} "
+          f"{'Alloc base':>10} {'Alloc new':>10}")
+    for key in sorted(set(baseline["cases"]) | set(candidate["cases"])):
+        old, new = baseline["cases"].get(key), candidate["cases"].get(key)
+        if not old or not new or "error" in old or "error" in new:
+            print(f"{key:<32} {'(missing or failed in one run)':>50}")
+            continue
+
+        old_p50, new_p50 = old["latency_ms"]["p50"], new["latency_ms"]["p50"]
+        latency_delta = new_p50 / old_p50 - 1 if old_p50 else 0.0
+        rss_delta = new["peak_rss_mb"] / old["peak_rss_mb"] - 1 if old["peak_rss_mb"] else 0.0
+        flag = ""
+        if latency_delta > args.threshold:
+            regressions.append(f"{key}: p50 latency +{latency_delta:.0%}")
+            flag = "  << latency"
+        if rss_delta > args.threshold:
+            regressions.append(f"{key}: peak RSS +{rss_delta:.0%}")
+            flag += "  << memory"
+        # (reports from before allocation tracking have no alloc_peak_mb)
+        alloc = ["%10.0f" % r["alloc_peak_mb"] if "alloc_peak_mb" in r else "%10s" % "-" for r in (old, new)]
+        print(f"{key:<32} {old_p50:>10.1f} {new_p50:>10.1f} {latency_delta:>+8.0%} "
+              f"{old['peak_rss_mb']:>9.0f} {new['peak_rss_mb']:>9.0f} {alloc[0]} {alloc[1]}{flag}")
+
+        # Point at the stage that moved the most
+        if flag:
+            stage_deltas = {
+                name: new["stages_ms"].get(name, 0.0) - old["stages_ms"].get(name, 0.0)
+                for name in set(old["stages_ms"]) | set(new["stages_ms"])
+            }
+            if stage_deltas:
+                worst = max(stage_deltas, key=stage_deltas.get)
+                print(f"{'':<32} largest stage increase: {worst} (+{stage_deltas[worst]:.1f} ms)")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}:")
+        for r in regressions:
+            print(f"  - {r}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+# --------------------------------------------------------------------------------
+# Calibrate (model cost table for routing.py)
+# --------------------------------------------------------------------------------
+# Each routed model is timed at two or more input sizes and a line
+# (overhead + per-megapixel cost) is fitted through the medians. The
+# megapixels are measured the way routing.py looks at them: the uploaded
+# image for rembg, the x4-equivalent SR work (enhance.plan_upscale) for
+# super-resolution.
+CALIBRATION_SIZES = {"rembg": [512, 2048], "sr": [256, 512]}
+
+
+def _calibrate_child(model, entries, repeat, results):
+    try:
+        sys.stdout = open(os.devnull, "w")
+        family, variant = model.split(":", 1)
+        out_dir = tempfile.mkdtemp(prefix="studio_calibrate_")
+        samples = []
+        for entry, size in entries:
+            if family == "rembg":
+                from bg_remover.remover import remove_background, get_session
+                get_session(variant)
+                with open(entry["clean"], "rb") as f:
+                    data = f.read()
+                fn = lambda: remove_background(data, variant)
+                megapixels = entry["shape"][0] * entry["shape"][1] / 1e6
+            else:
+                from enhancer.enhance import premium_ai_upscale, get_superres, sr_input_megapixels
+                get_superres(variant, 4)
+                out = os.path.join(out_dir, "sr.jpg")
+                # A x4 target makes the planner run exactly one x4 pass on the input
+                target = 4 * entry["shape"][1]
+                fn = lambda: premium_ai_upscale(entry["clean"], out, mode=variant, target_width=target)
+                megapixels = sr_input_megapixels(entry["shape"][1], entry["shape"][0], target)
+            fn()  # warm-up
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - start)
+            samples.append((megapixels, percentile(times, 50)))
+        shutil.rmtree(out_dir, ignore_errors=True)
+        results.put({"samples": samples})
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def calibrate(args):
+    import routing
+
+    models = args.models.split(",") if args.models else [m for f in routing.FAMILIES.values() for m in f]
+    corpus_dir = tempfile.mkdtemp(prefix="studio_bench_corpus_")
+    sizes = sorted({s for v in CALIBRATION_SIZES.values() for s in v})
+    corpus = build_corpus(corpus_dir, sizes)
+
+    table = {}
+    for model in models:
+        family = model.split(":", 1)[0]
+        if family not in CALIBRATION_SIZES:
+            print(f"Skipping unknown model {model}")
+            continue
+        entries = [(corpus["images"][size][0], size) for size in CALIBRATION_SIZES[family]]
+        print(f"Calibrating {model} ...")
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        proc = ctx.Process(target=_calibrate_child, args=(model, entries, args.repeat, results))
+        proc.start()
+        proc.join()
+        raw = results.get() if not results.empty() else {"error": f"child exited with code {proc.exitcode}"}
+        if "error" in raw:
+            # Typically a model that is not downloaded / not available offline
+            print(f"  skipped: {raw['error']}")
+            continue
+
+        mps = np.array([mp for mp, _ in raw["samples"]])
+        secs = np.array([t for _, t in raw["samples"]])
+        per_mp, overhead = np.polyfit(mps, secs, 1) if len(set(mps)) > 1 else (secs[0] / mps[0], 0.0)
+        table[model] = {
+            "overhead_s": round(max(0.0, float(overhead)), 4),
+            "per_mp_s": round(max(0.0, float(per_mp)), 4),
+            "samples": [[round(float(mp), 4), round(float(t), 4)] for mp, t in raw["samples"]],
+        }
+        print(f"  overhead {table[model]['overhead_s']:.3f} s + {table[model]['per_mp_s']:.3f} s/MP")
+
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    report = {
+        "meta": {
+            "timestamp": int(time.time()),
+            "git_revision": git_revision(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "models": table,
+    }
+    out = args.out or routing.COSTS_PATH
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved model cost table to: {out}")
+    return 0 if table else 1
+
+
+# --------------------------------------------------------------------------------
+# Accuracy (auto watermark detection)
+# --------------------------------------------------------------------------------
+# The corpus watermarks are synthetic, so their exact masks are known. Each
+# periodic detector is scored per image (IoU / precision / recall against the
+# ground truth, wall time) and on the clean originals, where anything it
+# flags is a false positive. --segment also scores the full auto mask with
+# each detector plugged into MultiScaleSegmenter.segment().
+def _score(mask, truth):
+    pred, truth = mask > 0, truth > 0
+    hit = np.count_nonzero(pred & truth)
+    union = np.count_nonzero(pred | truth)
+    return {
+        "iou": hit / union if union else 1.0,
+        "precision": hit / max(1, np.count_nonzero(pred)),
+        "recall": hit / max(1, np.count_nonzero(truth)),
+    }
+
+
+def _detect(detector, img):
+    from logo_remover.remover import MultiScaleSegmenter
+
+    segmenter = MultiScaleSegmenter(img)
+    start = time.perf_counter()
+    if detector == "fft":
+        mask = segmenter.get_fft_mask()
+        if mask is None:
+            mask = np.zeros_like(segmenter.gray)
+    else:
+        mask = segmenter.get_periodic_mask()
+    return mask, time.perf_counter() - start
+
+
+def _segment(detector, img):
+    import logo_remover.remover as remover
+
+    remover.PERIODIC_DETECTOR = detector
+    start = time.perf_counter()
+    mask = remover.MultiScaleSegmenter(img).segment()
+    return mask, time.perf_counter() - start
+
+
+def accuracy(args):
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else [1024, 2048]
+    corpus_dir = tempfile.mkdtemp(prefix="studio_bench_corpus_")
+    corpus = build_corpus(corpus_dir, sizes)
+    methods = [("periodic", "hough", _detect), ("periodic", "fft", _detect)]
+    if args.segment:
+        methods += [("segment", "hough", _segment), ("segment", "fft", _segment)]
+
+    rows = []
+    for size in sizes:
+        for entry in corpus["images"][size]:
+            marked = cv2.imread(entry["marked"], cv2.IMREAD_COLOR)
+            clean = cv2.imread(entry["clean"], cv2.IMREAD_COLOR)
+            truth = cv2.imread(entry["mask"], cv2.IMREAD_GRAYSCALE)
+            for kind, detector, fn in methods:
+                mask, seconds = fn(detector, marked)
+                clean_mask, _ = fn(detector, clean)
+                rows.append({
+                    "size": size,
+                    "source": entry["source"],
+                    "method": f"{kind}:{detector}",
+                    "seconds": round(seconds, 4),
+                    "clean_flagged": round(np.count_nonzero(clean_mask) / clean_mask.size, 4),
+                    **{k: round(v, 4) for k, v in _score(mask, truth).items()},
+                })
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    print(f"\n{'Method':<16} {'Size':>5} {'IoU':>6} {'Prec':>6} {'Recall':>7} {'Clean FP':>9} {'p50 ms':>8} {'max ms':>8}")
+    summary = {}
+    for kind, detector, _ in methods:
+        method = f"{kind}:{detector}"
+        for size in sizes:
+            group = [r for r in rows if r["method"] == method and r["size"] == size]
+            times = [r["seconds"] for r in group]
+            stats = {k: round(float(np.mean([r[k] for r in group])), 4) for k in ("iou", "precision", "recall", "clean_flagged")}
+            stats.update(p50_ms=round(percentile(times, 50) * 1000, 1), max_ms=round(max(times) * 1000, 1))
+            summary[f"{method}@{size}"] = stats
+            print(f"{method:<16} {size:>5} {stats['iou']:>6.3f} {stats['precision']:>6.3f} {stats['recall']:>7.3f} "
+                  f"{stats['clean_flagged']:>9.3f} {stats['p50_ms']:>8.1f} {stats['max_ms']:>8.1f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"meta": {"timestamp": int(time.time()), "git_revision": git_revision()},
+                       "summary": summary, "images": rows}, f, indent=2)
+        print(f"\nSaved accuracy report to: {args.out}")
+    return 0
+
+
+# --------------------------------------------------------------------------------
+# Encode (output formats, see encoding.py)
+# --------------------------------------------------------------------------------
+# Every option is timed on the clean corpus images (opaque results, e.g. a
+# cleaned or upscaled photo) and on cutouts with an alpha matte (background
+# removal). "default" marks the parameters encoding.py currently uses.
+def encode_options():
+    import encoding
+
+    options = [
+        ("jpg q100 (old logo remover)", "jpg", [cv2.IMWRITE_JPEG_QUALITY, 100]),
+        ("jpg q95 (old enhancer)", "jpg", [cv2.IMWRITE_JPEG_QUALITY, 95]),
+        ("jpg q90", "jpg", [cv2.IMWRITE_JPEG_QUALITY, 90]),
+        ("jpg q90 progressive", "jpg", [cv2.IMWRITE_JPEG_QUALITY, 90, cv2.IMWRITE_JPEG_PROGRESSIVE, 1]),
+        ("jpg q90 progressive optimized", "jpg", [cv2.IMWRITE_JPEG_QUALITY, 90, cv2.IMWRITE_JPEG_PROGRESSIVE, 1, cv2.IMWRITE_JPEG_OPTIMIZE, 1]),
+        ("png c1", "png", [cv2.IMWRITE_PNG_COMPRESSION, 1]),
+        ("png c3 (old cutouts)", "png", [cv2.IMWRITE_PNG_COMPRESSION, 3]),
+        ("png c6", "png", [cv2.IMWRITE_PNG_COMPRESSION, 6]),
+        ("webp q85", "webp", [cv2.IMWRITE_WEBP_QUALITY, 85]),
+        ("webp q90 (old cutouts)", "webp", [cv2.IMWRITE_WEBP_QUALITY, 90]),
+        ("webp lossless", "webp", [cv2.IMWRITE_WEBP_QUALITY, 101]),
+    ]
+    if "avif" in encoding.AVAILABLE:
+        for quality, speed in ((60, 9), (70, 9), (70, 10), (70, 6)):
+            options.append((f"avif q{quality} s{speed}", "avif",
+                            [cv2.IMWRITE_AVIF_QUALITY, quality, cv2.IMWRITE_AVIF_SPEED, speed]))
+    return options
+
+
+def _cutout(img):
+    # A soft-edged elliptical matte, like a product cutout
+    h, w = img.shape[:2]
+    alpha = np.zeros((h, w), np.uint8)
+    cv2.ellipse(alpha, (w // 2, h // 2), (w // 3, h // 3), 0, 0, 360, 255, -1)
+    alpha = cv2.GaussianBlur(alpha, (0, 0), 3)
+    out = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    out[:, :, 3] = alpha
+    return out
+
+
+def _visible(img):
+    # What a viewer sees: encoders may change the colour of fully
+    # transparent pixels, so compare premultiplied
+    if img.ndim == 3 and img.shape[2] == 4:
+        return (img[:, :, :3].astype(np.float32) * (img[:, :, 3:] / 255.0)).astype(np.uint8)
+    return img
+
+
+def encode_bench(args):
+    import encoding
+
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else [1024, 2048]
+    corpus_dir = tempfile.mkdtemp(prefix="studio_bench_corpus_")
+    corpus = build_corpus(corpus_dir, sizes)
+    results = {}
+    for size in sizes:
+        images = [cv2.imread(entry["clean"], cv2.IMREAD_COLOR) for entry in corpus["images"][size]]
+        for kind, frames in (("opaque", images), ("alpha", [_cutout(img) for img in images])):
+            print(f"\n{kind} @ {size}px ({len(frames)} images)")
+            print(f"  {'Option':<32} {'p50 ms':>8} {'KB/MP':>8} {'PSNR':>6}")
+            for name, fmt, params in encode_options():
+                if kind == "alpha" and not encoding.FORMATS[fmt]["alpha"]:
+                    continue
+                times, kb_per_mp, psnr = [], [], []
+                for img in frames:
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        ok, buf = cv2.imencode(encoding.FORMATS[fmt]["ext"], img, params)
+                        times.append(time.perf_counter() - start)
+                    kb_per_mp.append(len(buf) / 1024 / (img.shape[0] * img.shape[1] / 1e6))
+                    decoded = cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
+                    psnr.append(min(100.0, cv2.PSNR(_visible(img), _visible(decoded))))
+                default = params == encoding.params(fmt, kind == "alpha")
+                row = {
+                    "p50_ms": round(percentile(times, 50) * 1000, 1),
+                    "kb_per_mp": round(float(np.mean(kb_per_mp)), 1),
+                    "psnr": round(float(np.mean(psnr)), 2),
+                    "default": default,
+                }
+                results[f"{kind}@{size}:{name}"] = row
+                print(f"  {name + (' *' if default else ''):<32} {row['p50_ms']:>8.1f} {row['kb_per_mp']:>8.1f} {row['psnr']:>6.1f}")
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    print("\n* = current encoding.py setting (PSNR 100 = lossless)")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"meta": {"timestamp": int(time.time()), "git_revision": git_revision(),
+                                "opencv": cv2.__version__}, "options": results}, f, indent=2)
+        print(f"Saved encode report to: {args.out}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Studio pipeline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run the benchmark suite")
+    p_run.add_argument("--out", default="bench_results.json")
+    p_run.add_argument("--sizes", help="Comma-separated long-side resolutions (default 512,1024,2048)")
+    p_run.add_argument("--cases", help=f"Comma-separated subset of: {','.join(ALL_CASES)}")
+    p_run.add_argument("--repeat", type=int, default=3)
+    p_run.add_argument("--warmup", type=int, default=1)
+    p_run.add_argument("--corpus-dir", help="Keep the generated corpus in this directory")
+    p_run.set_defaults(func=run)
+
+    p_cmp = sub.add_parser("compare", help="Compare two benchmark reports")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("candidate")
+    p_cmp.add_argument("--threshold", type=float, default=0.10, help="Relative increase flagged as regression")
+    p_cmp.set_defaults(func=compare)
+
+    p_cal = sub.add_parser("calibrate", help="Measure per-model costs for latency-budget routing")
+    p_cal.add_argument("--models", help="Comma-separated subset, e.g. sr:fast,rembg:u2netp (default: all routed models)")
+    p_cal.add_argument("--repeat", type=int, default=3)
+    p_cal.add_argument("--out", help="Where to write the table (default: routing.COSTS_PATH)")
+    p_cal.set_defaults(func=calibrate)
+
+    p_acc = sub.add_parser("accuracy", help="Score the auto watermark detectors on the synthetic corpus")
+    p_acc.add_argument("--sizes", help="Comma-separated long-side resolutions (default 1024,2048)")
+    p_acc.add_argument("--segment", action="store_true", help="Also score the full auto-detect mask (slow)")
+    p_acc.add_argument("--out", help="Also write per-image results as JSON")
+    p_acc.set_defaults(func=accuracy)
+
+    p_enc = sub.add_parser("encode", help="Encode time vs. size for the output formats")
+    p_enc.add_argument("--sizes", help="Comma-separated long-side resolutions (default 1024,2048)")
+    p_enc.add_argument("--repeat", type=int, default=3)
+    p_enc.add_argument("--out", help="Also write the results as JSON")
+    p_enc.set_defaults(func=encode_bench)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+from rembg import new_session
+
+import decoding
+import encoding
+from metrics import stage, MODEL_LOADS
+from progress import report
+from runtime import ort_session_options
+
+# Use lightweight model for memory efficiency
+DEFAULT_MODEL = "u2netp"
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(model_name=DEFAULT_MODEL):
+    """
+    Cached rembg session per model; new_session() re-reads the ONNX file
+    every call, which used to happen on every request.
+    """
+    if model_name not in _sessions:
+        with _sessions_lock:
+            if model_name not in _sessions:
+                with stage("rembg.load"):
+                    _sessions[model_name] = new_session(model_name, sess_opts=ort_session_options())
+                    MODEL_LOADS.inc(model=model_name)
+    return _sessions[model_name]
+
+# --------------------------------------------------------------------------------
+# Resolution-limited Cutout Engine
+# --------------------------------------------------------------------------------
+# The segmentation nets run at 320px anyway, so feeding them a 24 MP photo only
+# costs memory (PIL decode, float conversions, full-size LANCZOS of the mask).
+# The image is segmented at a bounded working resolution and the coarse alpha
+# is brought back to full size with a fast guided filter that uses the
+# full-resolution image as guide, so edges snap to the real object outline.
+WORK_SIZE = int(os.environ.get("STUDIO_BG_WORK_SIZE", "1024"))   # long side fed to the net
+GUIDED_RADIUS = 4       # at working resolution
+GUIDED_EPS = 1e-3
+
+OUTPUT_FORMATS = {
+    # format: (extension, media type); every format that keeps transparency
+    # (encoding.py sets the parameters), plus the bare alpha matte
+    **{name: (f["ext"], f["media_type"]) for name, f in encoding.FORMATS.items()
+       if f["alpha"] and name in encoding.AVAILABLE},
+    "mask": (".png", "image/png"),
+}
+
+def guided_upsample(alpha_small, guide, radius=GUIDED_RADIUS, eps=GUIDED_EPS):
+    """
+    Fast guided filter (He & Sun): the per-pixel linear model alpha = a*I + b
+    is fitted at low resolution and only the coefficients are upsampled, so
+    the full-resolution cost is two resizes and one multiply-add.
+    """
+    h, w = guide.shape[:2]
+    sh, sw = alpha_small.shape[:2]
+    gray = cv2.cvtColor(guide, cv2.COLOR_BGR2GRAY) if guide.ndim == 3 else guide
+    I_full = gray.astype(np.float32)
+    I_full *= 1.0 / 255
+    I = cv2.resize(I_full, (sw, sh), interpolation=cv2.INTER_AREA)
+    p = alpha_small.astype(np.float32) * (1.0 / 255)
+
+    ksize = (2 * radius + 1, 2 * radius + 1)
+    mean_I = cv2.boxFilter(I, -1, ksize)
+    mean_p = cv2.boxFilter(p, -1, ksize)
+    cov_Ip = cv2.boxFilter(I * p, -1, ksize) - mean_I * mean_p
+    var_I = cv2.boxFilter(I * I, -1, ksize) - mean_I * mean_I
+    a = cov_Ip / (var_I + eps)
+    b = mean_p - a * mean_I
+    a = cv2.boxFilter(a, -1, ksize)
+    b = cv2.boxFilter(b, -1, ksize)
+
+    a = cv2.resize(a, (w, h), interpolation=cv2.INTER_LINEAR)
+    b = cv2.resize(b, (w, h), interpolation=cv2.INTER_LINEAR)
+    # q = a * I + b, written into a (no extra full-size float buffers)
+    cv2.multiply(a, I_full, dst=a)
+    cv2.add(a, b, dst=a)
+    cv2.multiply(a, 255.0, dst=a)
+    return np.clip(a, 0, 255, out=a).astype(np.uint8)
+
+def segment_alpha(img, model_name=DEFAULT_MODEL, work_size=WORK_SIZE):
+    """Full-resolution alpha (uint8) for a decoded BGR image."""
+    from PIL import Image
+
+    session = get_session(model_name)
+    h, w = img.shape[:2]
+    scale = min(1.0, work_size / float(max(h, w)))
+    with stage("rembg.resize"):
+        if scale < 1.0:
+            small = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        else:
+            small = img
+        small_rgb = Image.fromarray(cv2.cvtColor(small, cv2.COLOR_BGR2RGB))
+
+    report("rembg", "Segmenting subject...", percent=20)
+    with stage("rembg.predict"):
+        alpha_small = np.asarray(session.predict(small_rgb)[0].convert("L"))
+
+    report("rembg", "Refining edges...", percent=60)
+    with stage("rembg.refine"):
+        if scale < 1.0:
+            return guided_upsample(alpha_small, img)
+        return np.ascontiguousarray(alpha_small)
+
+def compose_cutout(img, alpha):
+    # BGR -> BGRA straight into one preallocated buffer, then drop the alpha in
+    with stage("rembg.composite"):
+        out = np.empty(img.shape[:2] + (4,), np.uint8)
+        cv2.cvtColor(img, cv2.COLOR_BGR2BGRA, dst=out)
+        out[:, :, 3] = alpha
+        return out
+
+def encode_cutout(img, alpha, output="png"):
+    if output == "mask":
+        return encoding.encode(alpha, "png")
+    return encoding.encode(compose_cutout(img, alpha), output)
+
+def remove_background(input_data, model_name=DEFAULT_MODEL, output="png"):
+    """
+    Cutout of encoded image bytes. output: "png" / "webp" / "avif" (RGBA) or "mask"
+    (the alpha matte alone as a grayscale PNG). Returns the encoded bytes.
+    """
+    if output not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output}' (use one of {', '.join(OUTPUT_FORMATS)})")
+    report("load", "Loading background removal model...", percent=5)
+    get_session(model_name)
+    img = decoding.decode(input_data)
+    alpha = segment_alpha(img, model_name)
+    report("encode", "Saving cutout...", percent=90)
+    return encode_cutout(img, alpha, output)
+
+def cutout_image(img, model_name=DEFAULT_MODEL):
+    """BGRA cutout of a decoded image (e.g. one step of a pipeline, see pipeline.py)."""
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    prior_alpha = None
+    if img.shape[2] == 4:
+        # Already partly transparent: keep what an earlier step cut away
+        prior_alpha = img[:, :, 3]
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    alpha = segment_alpha(img, model_name)
+    if prior_alpha is not None:
+        alpha = cv2.min(alpha, prior_alpha)
+    return compose_cutout(img, alpha)
+
+def warmup(model_name=DEFAULT_MODEL):
+    get_session(model_name)
+    ok, buf = cv2.imencode(".png", np.zeros((64, 64, 3), np.uint8))
+    remove_background(buf.tobytes(), model_name)
+
+if __name__ == "__main__":
+    print("Background Remover Module ready.")
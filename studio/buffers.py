@@ -0,0 +1,86 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from metrics import Counter, Gauge
+
+# --------------------------------------------------------------------------------
+# Scratch Buffer Pool
+# --------------------------------------------------------------------------------
+# The post-processing steps (upscale fusion, LaMa compositing) need a few
+# full-resolution scratch frames per request; at 4K that is ~25 MB each.
+# Allocating them fresh every time makes the allocator hand memory back and
+# forth with the OS and drives peak RSS up under concurrency. Instead they are
+# borrowed from a pool keyed by (shape, dtype) and filled with OpenCV's dst=
+# outputs, so a steady stream of same-sized requests allocates nothing.
+#
+# Only scratch space goes through the pool: never return a borrowed array (or
+# a view of one) to a caller.
+
+POOL_MB = int(os.environ.get("STUDIO_BUFFER_POOL_MB", "256"))
+
+POOL_REQUESTS = Counter(
+    "studio_buffer_pool_requests_total",
+    "Scratch buffer requests by outcome (hit = reused a pooled buffer).",
+    ["outcome"],
+)
+
+_free = {}          # (shape, dtype) -> [arrays]
+_free_bytes = 0
+_lock = threading.Lock()
+
+POOL_BYTES = Gauge("studio_buffer_pool_bytes", "Memory held by idle pooled scratch buffers.", function=lambda: _free_bytes)
+
+
+def take(shape, dtype=np.uint8):
+    """An uninitialized array of shape/dtype, reused if one is pooled."""
+    global _free_bytes
+    key = (tuple(shape), np.dtype(dtype).str)
+    with _lock:
+        arrays = _free.get(key)
+        if arrays:
+            buf = arrays.pop()
+            _free_bytes -= buf.nbytes
+            POOL_REQUESTS.inc(outcome="hit")
+            return buf
+    POOL_REQUESTS.inc(outcome="miss")
+    return np.empty(shape, dtype)
+
+
+def give(buf):
+    """Return a buffer from take(); dropped instead if the pool is full."""
+    global _free_bytes
+    key = (buf.shape, buf.dtype.str)
+    with _lock:
+        if _free_bytes + buf.nbytes > POOL_MB * 1024 * 1024:
+            # Make room by dropping buffers of other sizes first: the sizes in
+            # use right now are the ones worth keeping
+            for other in list(_free):
+                while _free[other] and other != key and _free_bytes + buf.nbytes > POOL_MB * 1024 * 1024:
+                    _free_bytes -= _free[other].pop().nbytes
+                if not _free[other]:
+                    del _free[other]
+            if _free_bytes + buf.nbytes > POOL_MB * 1024 * 1024:
+                return
+        _free.setdefault(key, []).append(buf)
+        _free_bytes += buf.nbytes
+
+
+@contextmanager
+def borrowed(*shapes, dtype=np.uint8):
+    """with borrowed(shape_a, shape_b) as (a, b): ... -- returned to the pool afterwards."""
+    bufs = [take(shape, dtype) for shape in shapes]
+    try:
+        yield bufs
+    finally:
+        for buf in bufs:
+            give(buf)
+
+
+def clear():
+    global _free_bytes
+    with _lock:
+        _free.clear()
+        _free_bytes = 0
@@ -0,0 +1,360 @@
+"""
+Offline batch processing: run a studio pipeline over a directory or glob
+without going through the HTTP server.
+
+    python cli.py remove-logo photos/ --out cleaned/                  # auto-detect
+    python cli.py remove-logo "shoot/*.jpg" --out cleaned/ --mask-spec '{"boxes": [[0.8, 0.9, 0.2, 0.1]]}'
+    python cli.py upscale catalog/ --out catalog_4k/ --recursive --mode fast --target-width 3840
+    python cli.py remove-bg products/ --out cutouts/ --model u2netp --format webp
+    python cli.py video clips/ --out clips_no_bg/
+
+Inputs are spread over a process pool (--workers, default one per core);
+every worker loads its models once when it starts. Outputs mirror the input
+layout under --out. Each finished input is appended to a JSONL manifest
+(default <out>/manifest.jsonl) as soon as it completes, so after a crash or
+Ctrl-C the same command picks up where it stopped: inputs already done with
+the same options (and unchanged since) are skipped, failed ones are retried.
+--force redoes everything.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+
+STUDIO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(STUDIO_DIR)
+
+import encoding
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+VIDEO_EXTS = {".mp4", ".mov", ".webm", ".avi", ".mkv"}
+
+
+# --------------------------------------------------------------------------------
+# Commands (run inside the workers)
+# --------------------------------------------------------------------------------
+# Each command: which inputs it takes, the output extension, how a worker
+# loads its models and how one input is processed. Everything heavy is
+# imported inside the functions so the parent process stays light.
+def _load_remove_logo(options):
+    from logo_remover import remover
+    remover.warmup()
+
+
+def _run_remove_logo(src, dst, options):
+    from logo_remover.remover import remove_logo
+    mask = options.get("mask_spec") or options.get("mask") or "AUTO"
+    return remove_logo(src, mask, dst)
+
+
+def _load_upscale(options):
+    from enhancer import enhance
+    enhance.warmup(options["mode"])
+
+
+def _run_upscale(src, dst, options):
+    from enhancer.enhance import premium_ai_upscale
+    return premium_ai_upscale(src, dst, mode=options["mode"], target_width=options["target_width"])
+
+
+def _load_remove_bg(options):
+    from bg_remover import remover
+    remover.warmup(options["model"])
+
+
+def _run_remove_bg(src, dst, options):
+    from bg_remover.remover import remove_background
+    with open(src, "rb") as f:
+        data = f.read()
+    result = remove_background(data, options["model"], output=options["format"])
+    with open(dst, "wb") as f:
+        f.write(result)
+    return dst
+
+
+def _load_video(options):
+    from bg_remover.remover import get_session
+    get_session("u2net")
+
+
+def _run_video(src, dst, options):
+    from video_remover.remove_video import remove_video_background
+    return remove_video_background(src, dst)
+
+
+COMMANDS = {
+    "remove-logo": {"exts": IMAGE_EXTS, "load": _load_remove_logo, "run": _run_remove_logo},
+    "upscale": {"exts": IMAGE_EXTS, "load": _load_upscale, "run": _run_upscale},
+    "remove-bg": {"exts": IMAGE_EXTS, "load": _load_remove_bg, "run": _run_remove_bg},
+    "video": {"exts": VIDEO_EXTS, "load": _load_video, "run": _run_video},
+}
+
+
+def output_ext(command, options, src):
+    if command == "upscale":
+        return "." + options["format"]
+    if command == "remove-bg":
+        return ".png" if options["format"] == "mask" else "." + options["format"]
+    if command == "video":
+        return "." + options["format"]
+    # Keep the input's format where there is an encoder for it (BMP / TIFF -> PNG)
+    ext = os.path.splitext(src)[1]
+    if encoding.EXTENSIONS.get(ext.lower()) in encoding.AVAILABLE:
+        return ext
+    return encoding.FORMATS[encoding.same_as(src)]["ext"]
+
+
+# --------------------------------------------------------------------------------
+# Worker Process
+# --------------------------------------------------------------------------------
+_worker = {"command": None, "options": None, "error": None, "verbose": False}
+
+
+def _init_worker(command, options, verbose):
+    # A failing initializer would make multiprocessing.Pool respawn the worker
+    # forever, so a load error is kept and reported by every task instead
+    _worker.update(command=command, options=options, verbose=verbose)
+    # Ctrl-C is handled by the parent, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if not verbose:
+        # The pipelines print per-stage chatter; with N workers it is unreadable
+        sys.stdout = open(os.devnull, "w")
+    try:
+        from runtime import configure_threads
+        configure_threads()
+        COMMANDS[command]["load"](options)
+    except Exception as e:
+        _worker["error"] = f"Model load failed: {type(e).__name__}: {e}"
+
+
+def _process(task):
+    src, dst = task
+    record = {"input": src, "output": dst, "worker": os.getpid()}
+    started = time.perf_counter()
+    if _worker["error"]:
+        record.update(status="error", error=_worker["error"], seconds=0.0)
+        return record
+
+    # The pipeline functions report failure by printing and returning None;
+    # keep what they printed so the manifest can say why
+    captured = io.StringIO()
+    try:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        with contextlib.redirect_stdout(captured):
+            result = COMMANDS[_worker["command"]]["run"](src, dst, _worker["options"])
+        if result is None or not os.path.exists(dst):
+            lines = [line for line in captured.getvalue().splitlines() if line.strip()]
+            raise RuntimeError(lines[-1] if lines else "No output written")
+        record["status"] = "ok"
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+        if _worker["verbose"]:
+            traceback.print_exc()
+    if _worker["verbose"]:
+        sys.stdout.write(captured.getvalue())
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+# --------------------------------------------------------------------------------
+# Inputs & Manifest
+# --------------------------------------------------------------------------------
+def collect_inputs(patterns, exts, recursive):
+    """Files matching the directories / globs, as (absolute path, path relative to its root)."""
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            root = pattern
+            walk = os.path.join(pattern, "**", "*") if recursive else os.path.join(pattern, "*")
+            paths = glob.glob(walk, recursive=recursive)
+        else:
+            root = None
+            paths = glob.glob(pattern, recursive=recursive)
+        for path in paths:
+            if not os.path.isfile(path) or os.path.splitext(path)[1].lower() not in exts:
+                continue
+            rel = os.path.relpath(path, root) if root else os.path.basename(path)
+            found.setdefault(os.path.abspath(path), rel)
+    return sorted(found.items())
+
+
+def load_manifest(path):
+    """{input: last record}; a line torn by a crash mid-write is ignored."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record["input"]] = record
+    return records
+
+
+def is_done(record, options, stat):
+    return (
+        record is not None
+        and record.get("status") == "ok"
+        and record.get("options") == options
+        and record.get("size") == stat.st_size
+        and record.get("mtime") == stat.st_mtime
+        and os.path.exists(record["output"])
+    )
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+# --------------------------------------------------------------------------------
+# Batch Run
+# --------------------------------------------------------------------------------
+def command_options(args):
+    """What the output depends on; resume only skips inputs done with the same options."""
+    options = {"command": args.command}
+    if args.command == "remove-logo":
+        if args.mask_spec:
+            from logo_remover.masks import parse_mask_spec
+            options["mask_spec"] = parse_mask_spec(args.mask_spec)
+        elif args.mask:
+            options["mask"] = os.path.abspath(args.mask)
+    elif args.command == "upscale":
+        options.update(mode=args.mode, target_width=args.target_width, format=args.format)
+    elif args.command == "remove-bg":
+        options.update(model=args.model, format=args.format)
+    elif args.command == "video":
+        options.update(format=args.format)
+    return options
+
+
+def run_batch(args):
+    try:
+        options = command_options(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    if args.command == "remove-logo" and args.mask and not os.path.exists(args.mask):
+        print(f"Error: mask file not found: {args.mask}")
+        return 2
+
+    inputs = collect_inputs(args.inputs, COMMANDS[args.command]["exts"], args.recursive)
+    if not inputs:
+        print("No input files found.")
+        return 1
+
+    out_dir = os.path.abspath(args.out)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = args.manifest or os.path.join(out_dir, "manifest.jsonl")
+    previous = {} if args.force else load_manifest(manifest_path)
+
+    tasks, skipped = [], 0
+    for src, rel in inputs:
+        stat = os.stat(src)
+        if is_done(previous.get(src), options, stat):
+            skipped += 1
+            continue
+        dst = os.path.join(out_dir, os.path.splitext(rel)[0] + output_ext(args.command, options, src))
+        tasks.append((src, dst, stat))
+    # Biggest first, so one large straggler does not hold up the end of the run
+    tasks.sort(key=lambda t: -t[2].st_size)
+
+    total = len(tasks)
+    print(f"{len(inputs)} inputs: {skipped} already done, {total} to process")
+    print(f"Manifest: {manifest_path}")
+    if not total:
+        return 0
+    workers = max(1, min(args.workers or os.cpu_count() or 1, total))
+
+    # N processes x N library threads would oversubscribe the cores: each
+    # worker gets its share (runtime.py), unless set explicitly
+    os.environ.setdefault("STUDIO_THREADS_PER_WORKER", str(max(1, (os.cpu_count() or 1) // workers)))
+
+    print(f"Starting {workers} workers ...")
+    stats = {task[0]: task[2] for task in tasks}
+    done = failed = 0
+    started = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")
+    pool = ctx.Pool(workers, initializer=_init_worker, initargs=(args.command, options, args.verbose))
+    try:
+        with open(manifest_path, "a") as manifest:
+            for record in pool.imap_unordered(_process, [(src, dst) for src, dst, _ in tasks]):
+                stat = stats[record["input"]]
+                record.update(options=options, size=stat.st_size, mtime=stat.st_mtime, finished_at=round(time.time(), 3))
+                # One durable line per input: this is the resume checkpoint
+                manifest.write(json.dumps(record) + "\n")
+                manifest.flush()
+                os.fsync(manifest.fileno())
+
+                done += 1
+                if record["status"] != "ok":
+                    failed += 1
+                elapsed = time.perf_counter() - started
+                rate = done / elapsed
+                eta = (total - done) / rate if rate > 0 else 0
+                status = "ok" if record["status"] == "ok" else f"FAILED ({record['error']})"
+                print(f"[{done:>{len(str(total))}}/{total}] {rate:5.2f}/s  ETA {format_duration(eta):>7}  "
+                      f"{os.path.relpath(record['input'])} {record['seconds']:.1f}s {status}", flush=True)
+        pool.close()
+    except KeyboardInterrupt:
+        print("\nInterrupted; finished inputs are in the manifest, run the same command again to resume.")
+        pool.terminate()
+        return 130
+    finally:
+        pool.join()
+
+    elapsed = time.perf_counter() - started
+    print(f"\nDone: {done - failed} ok, {failed} failed, {skipped} skipped in {format_duration(elapsed)} "
+          f"({done / elapsed:.2f} inputs/s, {elapsed / done:.2f} s/input wall)")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="studio", description="Batch-process images and videos with the studio pipelines")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("inputs", nargs="+", help="Input directories and/or glob patterns")
+    common.add_argument("--out", required=True, help="Output directory (mirrors the input layout)")
+    common.add_argument("--recursive", action="store_true", help="Descend into subdirectories (and ** in globs)")
+    common.add_argument("--workers", type=int, help="Worker processes (default: one per core; each loads its own models)")
+    common.add_argument("--manifest", help="Manifest path (default: <out>/manifest.jsonl)")
+    common.add_argument("--force", action="store_true", help="Ignore the manifest and process everything again")
+    common.add_argument("--verbose", action="store_true", help="Show the pipelines' own output")
+
+    p_logo = sub.add_parser("remove-logo", parents=[common], help="Remove watermarks / logos")
+    p_logo.add_argument("--mask", help="Mask image applied to every input (default: auto-detect)")
+    p_logo.add_argument("--mask-spec", help="Mask as JSON boxes/strokes/rle, see logo_remover/masks.py")
+
+    p_up = sub.add_parser("upscale", parents=[common], help="AI upscale (premium_ai_upscale)")
+    p_up.add_argument("--mode", default="fast", choices=["quality", "fast", "lite"])
+    p_up.add_argument("--target-width", type=int, default=3840)
+    p_up.add_argument("--format", default="jpg", choices=encoding.AVAILABLE)
+
+    p_bg = sub.add_parser("remove-bg", parents=[common], help="Background removal")
+    p_bg.add_argument("--model", default="u2netp", help="rembg model (default u2netp)")
+    p_bg.add_argument("--format", default="png",
+                      choices=[f for f in encoding.AVAILABLE if encoding.FORMATS[f]["alpha"]] + ["mask"])
+
+    p_vid = sub.add_parser("video", parents=[common], help="Video background removal")
+    p_vid.add_argument("--format", default="webm", choices=["webm", "mov", "mp4", "gif"])
+
+    args = parser.parse_args(argv)
+    return run_batch(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import io
+import os
+import warnings
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import profiling
+from metrics import stage, Counter
+
+# --------------------------------------------------------------------------------
+# Image Decoding
+# --------------------------------------------------------------------------------
+# Every pipeline used to cv2.imread/imdecode the upload straight away, so a
+# 100 MP photo (or a few-KB decompression bomb) was fully in memory before
+# anything looked at its size. decode() reads the header first (Pillow parses
+# no pixels for that) and enforces a pixel budget:
+#   - JPEGs over STUDIO_MAX_MEGAPIXELS are decoded at 1/2, 1/4 or 1/8 scale
+#     (IMREAD_REDUCED_*: libjpeg DCT scaling, so the full-size frame is never
+#     allocated), STUDIO_OVERSIZE=reject refuses them instead
+#   - anything else over the budget is refused with ImageTooLarge
+# A consumer that only needs a certain width (min_width) gets the largest
+# reduction that still covers it.
+#
+# EXIF orientation is applied here, for every flag: OpenCV applies it for
+# IMREAD_COLOR but not for IMREAD_UNCHANGED, so before this the logo remover
+# (UNCHANGED) and the enhancer (COLOR) saw the same photo rotated differently.
+
+MAX_MEGAPIXELS = float(os.environ.get("STUDIO_MAX_MEGAPIXELS", "50"))
+OVERSIZE = os.environ.get("STUDIO_OVERSIZE", "reduce").lower()  # reduce | reject
+
+# Formats OpenCV can decode at reduced size without a full decode first
+REDUCIBLE_FORMATS = {"JPEG", "MPO"}
+REDUCED_FLAGS = {
+    cv2.IMREAD_COLOR: {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8},
+    cv2.IMREAD_GRAYSCALE: {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8},
+}
+
+DECODES = Counter(
+    "studio_decode_total",
+    "Image decodes by outcome (full, reduced = DCT-scaled read, rejected = over the pixel budget).",
+    ["outcome"],
+)
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def probe(source):
+    """
+    Header-only look at an image (bytes or a path): format, size after EXIF
+    orientation, the orientation tag and whether it has an alpha channel
+    (as IMREAD_UNCHANGED reads it). Raises ValueError if unreadable.
+    """
+    try:
+        # Pillow warns above ~89 MP and refuses above ~179 MP (raised here as
+        # ImageTooLarge); the budget below is the limit that matters
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            im = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source)
+        with im:
+            width, height = im.size
+            orientation = 1
+            # getexif() on formats that keep EXIF after the pixel data
+            # (e.g. PNG) would decode the whole image to find it
+            if im.format == "TIFF" or "exif" in im.info:
+                orientation = im.getexif().get(0x0112, 1) or 1
+            fmt = im.format
+            # Palette / grey images with a transparent colour (tRNS) decode as BGRA too
+            alpha = im.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in im.info
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except (OSError, SyntaxError) as e:
+        raise ValueError(f"Could not read image: {e}")
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    return {"format": fmt, "width": width, "height": height, "orientation": orientation, "alpha": alpha}
+
+
+def reduction(info, min_width=None):
+    """
+    The scale-down factor (1, 2, 4 or 8) decode() will use for this image, or
+    ImageTooLarge if it does not fit the pixel budget.
+    """
+    megapixels = info["width"] * info["height"] / 1e6
+    reducible = info["format"] in REDUCIBLE_FORMATS
+    factor = 1
+    if megapixels > MAX_MEGAPIXELS:
+        factor = next((f for f in (2, 4, 8) if megapixels / (f * f) <= MAX_MEGAPIXELS), None)
+        if not reducible or OVERSIZE != "reduce" or factor is None:
+            raise ImageTooLarge(
+                f"Image is {info['width']}x{info['height']} ({megapixels:.0f} MP); the limit is {MAX_MEGAPIXELS:g} MP"
+            )
+    if min_width and reducible:
+        # libjpeg rounds the scaled size up
+        while factor < 8 and -(-info["width"] // (factor * 2)) >= min_width:
+            factor *= 2
+    return factor
+
+
+def output_size(info, min_width=None):
+    """(width, height) decode() returns for this image."""
+    factor = reduction(info, min_width)
+    return -(-info["width"] // factor), -(-info["height"] // factor)
+
+
+def apply_orientation(img, orientation):
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(img), -1)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+
+def decode(source, flags=cv2.IMREAD_COLOR, min_width=None):
+    """
+    cv2.imread / imdecode (source: path or bytes) behind the pixel budget,
+    with reduced-resolution reads and EXIF orientation. flags: IMREAD_COLOR,
+    IMREAD_GRAYSCALE or IMREAD_UNCHANGED. Raises ImageTooLarge / ValueError.
+    """
+    try:
+        info = probe(source)
+        factor = reduction(info, min_width)
+    except ImageTooLarge:
+        DECODES.inc(outcome="rejected")
+        raise
+
+    read_flags = flags
+    if factor > 1:
+        # A JPEG has no alpha: UNCHANGED reads as colour
+        read_flags = REDUCED_FLAGS.get(flags, REDUCED_FLAGS[cv2.IMREAD_COLOR])[factor]
+    if read_flags != cv2.IMREAD_UNCHANGED:
+        # Orientation is applied below, the same way for every flag
+        read_flags |= cv2.IMREAD_IGNORE_ORIENTATION
+
+    with stage("decode"):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            img = cv2.imdecode(np.frombuffer(source, np.uint8), read_flags)
+        else:
+            img = cv2.imread(source, read_flags)
+    if img is None:
+        raise ValueError("Could not decode image")
+    DECODES.inc(outcome="reduced" if factor > 1 else "full")
+    profiling.tag_input(info["width"], info["height"], info["format"], scale=f"1/{factor}")
+    if factor > 1:
+        print(f"[INFO] Decoded {info['width']}x{info['height']} {info['format']} at 1/{factor} scale")
+    return apply_orientation(img, info["orientation"])
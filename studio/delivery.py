@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+import anyio
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from metrics import Counter
+
+# --------------------------------------------------------------------------------
+# Artifact Delivery (/uploads)
+# --------------------------------------------------------------------------------
+# Outputs never change once written, but the plain StaticFiles mount sent them
+# with no Cache-Control and an ETag made of mtime + size, so browsers and CDNs
+# fetched 4K results again and again. Now:
+#   - endpoints hand out /uploads/<name>?v=<content hash> (artifact_url). A
+#     request whose v matches the file's current content is served as
+#     immutable for a year; any other request (no v, an old v, a file
+#     overwritten since) must revalidate (no-cache)
+#   - the ETag is the content hash (strong), so If-None-Match gives a 304
+#     even after a restart or on another worker, and If-Range resumes safely
+#   - Range requests (206) come from Starlette's FileResponse, so videos
+#     can be seeked / previewed before they are fully downloaded
+#   - zero-copy: servers that implement the ASGI pathsend extension send the
+#     file themselves; behind nginx / Apache, STUDIO_SENDFILE_HEADER
+#     (X-Accel-Redirect / X-Sendfile) hands the body to the proxy's sendfile.
+#     Under plain uvicorn the file is streamed in CHUNK_SIZE reads (1 MB;
+#     Starlette's default is 64 KB) to cut the thread hops per large file.
+# Content hashes are cached per (path, size, mtime), so each file is read for
+# hashing at most once; write_artifact() records it while the bytes are
+# still in memory.
+
+MOUNT_PATH = "/uploads"
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+VERSION_LENGTH = 16
+CHUNK_SIZE = int(os.environ.get("STUDIO_DELIVERY_CHUNK_KB", "1024")) * 1024
+# e.g. X-Accel-Redirect with an nginx `internal` location at SENDFILE_PREFIX
+SENDFILE_HEADER = os.environ.get("STUDIO_SENDFILE_HEADER", "")
+SENDFILE_PREFIX = os.environ.get("STUDIO_SENDFILE_PREFIX", "/protected-uploads/")
+DIGEST_CACHE_SIZE = 4096
+
+ARTIFACT_RESPONSES = Counter(
+    "studio_artifact_responses_total",
+    "/uploads responses (full, range, not_modified, offloaded = sent by the front proxy).",
+    ["outcome"],
+)
+
+_digests = OrderedDict()   # (path, size, mtime_ns) -> sha256 hex
+_lock = threading.Lock()
+
+
+def _key(path, stat_result):
+    return (os.path.abspath(path), stat_result.st_size, stat_result.st_mtime_ns)
+
+
+def _remember(key, digest):
+    with _lock:
+        _digests[key] = digest
+        _digests.move_to_end(key)
+        while len(_digests) > DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+
+
+def content_digest(path, stat_result=None):
+    """SHA-256 (hex) of a file's content, cached until it changes. Blocking."""
+    key = _key(path, stat_result or os.stat(path))
+    with _lock:
+        digest = _digests.get(key)
+        if digest is not None:
+            _digests.move_to_end(key)
+            return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _remember(key, digest)
+    return digest
+
+
+def write_artifact(path, data):
+    """Write an output and record its content hash without reading it back."""
+    with open(path, "wb") as f:
+        f.write(data)
+    _remember(_key(path, os.stat(path)), hashlib.sha256(data).hexdigest())
+    return path
+
+
+async def artifact_url(path):
+    """Content-versioned URL of a file in the uploads directory."""
+    digest = await asyncio.to_thread(content_digest, path)
+    return f"{MOUNT_PATH}/{os.path.basename(path)}?v={digest[:VERSION_LENGTH]}"
+
+
+class ArtifactFileResponse(FileResponse):
+    chunk_size = CHUNK_SIZE
+
+
+class ArtifactFiles(StaticFiles):
+    async def get_response(self, path, scope):
+        if scope["method"] in ("GET", "HEAD"):
+            try:
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            except (OSError, ValueError):
+                # StaticFiles turns these into the right error below
+                stat_result = None
+            if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+                digest = await anyio.to_thread.run_sync(content_digest, full_path, stat_result)
+                return self.artifact_response(path, full_path, stat_result, digest, scope)
+        return await super().get_response(path, scope)
+
+    def artifact_response(self, path, full_path, stat_result, digest, scope):
+        request_headers = Headers(scope=scope)
+        version = QueryParams(scope.get("query_string", b"")).get("v")
+        headers = {
+            "etag": f'"{digest[:32]}"',
+            "cache-control": IMMUTABLE if version == digest[:VERSION_LENGTH] else REVALIDATE,
+        }
+        response = ArtifactFileResponse(full_path, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            ARTIFACT_RESPONSES.inc(outcome="not_modified")
+            return NotModifiedResponse(response.headers)
+
+        if SENDFILE_HEADER and scope["method"] == "GET":
+            # The proxy sends the body (sendfile) and answers Range itself
+            ARTIFACT_RESPONSES.inc(outcome="offloaded")
+            offload = {k: v for k, v in response.headers.items() if k != "content-length"}
+            offload[SENDFILE_HEADER] = SENDFILE_PREFIX + path.lstrip("/")
+            return Response(headers=offload)
+
+        ARTIFACT_RESPONSES.inc(outcome="range" if "range" in request_headers else "full")
+        return response
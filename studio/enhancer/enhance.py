@@ -1,103 +1,349 @@
+import itertools
 import os
+import threading
 import cv2
 import numpy as np
 import requests
 
+import buffers
+import decoding
+import encoding
+from metrics import stage, MODEL_LOADS
+from progress import report
+
 # AI Models Configuration
+# Each model family ships x2/x3/x4 variants; plan_upscale() picks the ones to run
 MODELS = {
     "fast": {
         "name": "fsrcnn",
-        "filename": "fscrcnn_x4.pb", # Note: Kept typo to match existing file on disk if present
-        "url": "https://github.com/Saafke/FSRCNN_Tensorflow/raw/master/models/FSRCNN_x4.pb",
-        "scale": 4,
-        "desc": "Fast AI (FSRCNN)"
+        "files": {
+            2: ("fsrcnn_x2.pb", "https://github.com/Saafke/FSRCNN_Tensorflow/raw/master/models/FSRCNN_x2.pb"),
+            3: ("fsrcnn_x3.pb", "https://github.com/Saafke/FSRCNN_Tensorflow/raw/master/models/FSRCNN_x3.pb"),
+            4: ("fscrcnn_x4.pb", "https://github.com/Saafke/FSRCNN_Tensorflow/raw/master/models/FSRCNN_x4.pb"), # Note: Kept typo to match existing file on disk if present
+        },
+        "desc": "Fast AI (FSRCNN)",
+        "tile_pad": 12,
+    },
+    "lite": {
+        "name": "espcn",
+        "files": {
+            2: ("espcn_x2.pb", "https://github.com/fannymonori/TF-ESPCN/raw/master/export/ESPCN_x2.pb"),
+            3: ("espcn_x3.pb", "https://github.com/fannymonori/TF-ESPCN/raw/master/export/ESPCN_x3.pb"),
+            4: ("espcn_x4.pb", "https://github.com/fannymonori/TF-ESPCN/raw/master/export/ESPCN_x4.pb"),
+        },
+        "desc": "Lite AI (ESPCN)",
+        "tile_pad": 12,
     },
     "quality": {
         "name": "edsr",
-        "filename": "edsr_x4.pb",
-        "url": "https://github.com/Saafke/EDSR_Tensorflow/raw/master/models/EDSR_x4.pb",
-        "scale": 4,
-        "desc": "Premium AI (EDSR)"
+        "files": {
+            2: ("edsr_x2.pb", "https://github.com/Saafke/EDSR_Tensorflow/raw/master/models/EDSR_x2.pb"),
+            3: ("edsr_x3.pb", "https://github.com/Saafke/EDSR_Tensorflow/raw/master/models/EDSR_x3.pb"),
+            4: ("edsr_x4.pb", "https://github.com/Saafke/EDSR_Tensorflow/raw/master/models/EDSR_x4.pb"),
+        },
+        "desc": "Premium AI (EDSR)",
+        # The residual body is dozens of 3x3 convs deep, so its receptive
+        # field is far wider than FSRCNN's / ESPCN's. Larger tiles keep the
+        # recomputed border at ~1.5x the work instead of ~2.3x at 256.
+        "tile_pad": 64,
+        "tile": 512,
     }
 }
 
-def download_model(mode="fast"):
-    config = MODELS[mode]
-    model_path = os.path.join(os.path.dirname(__file__), config["filename"])
+# Scales the planner may use (e.g. "4" to keep a single model per mode in memory)
+SR_SCALES = sorted(int(s) for s in os.environ.get("STUDIO_SR_SCALES", "2,3,4").split(",") if s.strip())
+# Scales loaded at startup (warm-up / pre-fork); the others load on first use,
+# so a boot keeps one net per mode resident instead of one per scale
+SR_PRELOAD_SCALES = [
+    int(s) for s in os.environ.get("STUDIO_SR_PRELOAD_SCALES", "4").split(",") if s.strip() and int(s) in SR_SCALES
+] or SR_SCALES[-1:]
+
+def is_valid_model(model_path):
+    # Guard against truncated downloads and un-fetched Git LFS pointer files
+    if not os.path.exists(model_path) or os.path.getsize(model_path) < 1024:
+        return False
+    with open(model_path, "rb") as f:
+        return not f.read(64).startswith(b"version https://git-lfs")
+
+def download_model(mode="fast", scale=4):
+    filename, url = MODELS[mode]["files"][scale]
+    model_path = os.path.join(os.path.dirname(__file__), filename)
     
-    if not os.path.exists(model_path):
-        print(f"Downloading {config['desc']} model...")
-        response = requests.get(config["url"], stream=True)
-        with open(model_path, "wb") as f:
+    if not is_valid_model(model_path):
+        print(f"Downloading {MODELS[mode]['desc']} x{scale} model...")
+        response = requests.get(url, stream=True, timeout=60)
+        response.raise_for_status()
+        # Write to a temp file first so a concurrent reader never sees a partial model
+        tmp_path = f"{model_path}.{os.getpid()}.part"
+        with open(tmp_path, "wb") as f:
             for chunk in response.iter_content(chunk_size=8192):
                 f.write(chunk)
+        os.replace(tmp_path, model_path)
         print("Model downloaded successfully.")
     return model_path
 
+_sr_models = {}
+_sr_models_lock = threading.Lock()
+
+def get_superres(mode="fast", scale=4):
+    """
+    Cached super-resolution net per (mode, scale), returned with a lock: a
+    single cv2.dnn net must not run forward passes from two threads at once.
+    """
+    key = (mode, scale)
+    if key not in _sr_models:
+        with _sr_models_lock:
+            if key not in _sr_models:
+                with stage("sr.download"):
+                    model_path = download_model(mode, scale)
+                with stage("sr.load"):
+                    sr = cv2.dnn_superres.DnnSuperResImpl_create()
+                    sr.readModel(model_path)
+                    sr.setModel(MODELS[mode]["name"], scale)
+                    MODEL_LOADS.inc(model=f"{MODELS[mode]['name']}_x{scale}")
+                _sr_models[key] = (sr, threading.Lock())
+    return _sr_models[key]
+
+# Upsample in tiles so long runs can report progress and be cancelled between
+# tiles. Each tile carries pad pixels of context that are cropped off again;
+# the pad has to cover the net's receptive field (MODELS[mode]["tile_pad"])
+# for the seams to match a single full-frame pass.
+SR_TILE = int(os.environ.get("STUDIO_SR_TILE", "256"))
+SR_TILE_PAD = 12
+
+def tile_settings(mode):
+    """(tile, pad) for upsample_tiled with this mode's net."""
+    model = MODELS[mode]
+    tile = max(SR_TILE, model.get("tile", 0)) if SR_TILE > 0 else 0
+    return tile, model.get("tile_pad", SR_TILE_PAD)
+
+def upsample_tiled(sr, img, scale, tile=SR_TILE, pad=SR_TILE_PAD, span=(15, 85), out=None):
+    # span: the overall percent range this pass reports progress in
+    # out: optional preallocated (h * scale, w * scale) destination
+    h, w = img.shape[:2]
+    if tile <= 0 or (h <= tile and w <= tile):
+        report("sr", "Applying AI Super-Resolution...", percent=span[0])
+        if out is None:
+            return sr.upsample(img)
+        out[:] = sr.upsample(img)
+        return out
+
+    rows = range(0, h, tile)
+    cols = range(0, w, tile)
+    total = len(rows) * len(cols)
+    if out is None:
+        out = np.empty((h * scale, w * scale) + img.shape[2:], dtype=img.dtype)
+    done = 0
+    for y in rows:
+        for x in cols:
+            report("sr", f"Applying AI Super-Resolution (tile {done + 1}/{total})",
+                   percent=span[0] + (span[1] - span[0]) * done / total, done=done, total=total)
+            y0, x0 = max(0, y - pad), max(0, x - pad)
+            y1, x1 = min(h, y + tile + pad), min(w, x + tile + pad)
+            up = sr.upsample(np.ascontiguousarray(img[y0:y1, x0:x1]))
+            th, tw = min(tile, h - y), min(tile, w - x)
+            oy, ox = (y - y0) * scale, (x - x0) * scale
+            out[y * scale:(y + th) * scale, x * scale:(x + tw) * scale] = up[oy:oy + th * scale, ox:ox + tw * scale]
+            done += 1
+    return out
+
+def warmup(mode="fast"):
+    # Tiny forward pass to trigger OpenCV DNN's lazy layer initialization
+    for scale in SR_PRELOAD_SCALES:
+        sr, lock = get_superres(mode, scale)
+        with lock:
+            sr.upsample(np.zeros((16, 16, 3), np.uint8))
+
+# --------------------------------------------------------------------------------
+# Scale Planner
+# --------------------------------------------------------------------------------
+# Instead of always squeezing the input to target_width / 4 and running the x4
+# net, look at how far the image actually has to grow:
+#   - already at (or close to) the target: no AI pass at all
+#   - otherwise the cheapest way to reach the factor with the x2/x3/x4 nets,
+#     either one pass that overshoots slightly (then an area downscale), a
+#     chain of passes, or a cubic pre-upscale followed by a pass for tiny
+#     inputs. The input is never shrunk before the AI, so no detail is lost.
+# Cost is counted in "x4-equivalent" input megapixels, the unit of the sr:*
+# entries in routing.py's cost table.
+SR_MIN_FACTOR = float(os.environ.get("STUDIO_SR_MIN_FACTOR", "1.15"))  # below this a Lanczos resize is enough
+SR_MAX_PASSES = int(os.environ.get("STUDIO_SR_MAX_PASSES", "2"))
+# Relative cost per input megapixel of the x2/x3 nets vs x4 (the
+# reconstruction layers grow with the output size, the rest does not)
+SR_SCALE_COST = {2: 0.6, 3: 0.8, 4: 1.0}
+
+def plan_upscale(width, height, target_width=3840):
+    factor = target_width / float(width)
+    out_w, out_h = target_width, max(1, int(round(height * factor)))
+    plan = {
+        "input": [width, height],
+        "output": [out_w, out_h],
+        "factor": round(factor, 3),
+        "pre_scale": 1.0,
+        "passes": [],
+        "cost_mp": 0.0,
+    }
+    if factor <= 1.0:
+        # Already meets the target: no AI pass, only denoise (and an area
+        # downscale to the target width if it is wider)
+        plan["strategy"] = "skip"
+        return plan
+    if factor < SR_MIN_FACTOR:
+        plan["strategy"] = "resize"
+        return plan
+
+    best = None
+    for n in range(1, SR_MAX_PASSES + 1):
+        for chain in itertools.product(SR_SCALES, repeat=n):
+            total = int(np.prod(chain))
+            # Chains that fall short start from a cubic pre-upscale (never a downscale)
+            pre = max(1.0, factor / total)
+            mp = width * height * pre * pre / 1e6
+            cost = 0.0
+            for scale in chain:
+                cost += mp * SR_SCALE_COST.get(scale, 1.0)
+                mp *= scale * scale
+            # Cheapest first; on a tie the smaller overshoot
+            key = (round(cost, 6), total * pre)
+            if best is None or key < best[0]:
+                best = (key, chain, pre, cost)
+
+    _, chain, pre, cost = best
+    w, h = int(round(width * pre)), int(round(height * pre))
+    for scale in chain:
+        plan["passes"].append({"scale": scale, "input": [w, h]})
+        w, h = w * scale, h * scale
+    plan["pre_scale"] = round(pre, 3)
+    plan["cost_mp"] = round(cost, 4)
+    plan["strategy"] = "chain" if len(chain) > 1 else "single"
+    return plan
+
+def sr_input_megapixels(width, height, target_width=3840):
+    # What routing.py charges an upscale with: the planned AI work in x4-equivalent MP
+    return plan_upscale(width, height, target_width)["cost_mp"]
+
 def premium_ai_upscale(input_path, output_path, mode="fast", target_width=3840):
     # Default to fast if invalid mode provided
     if mode not in MODELS:
         mode = "fast"
         
     print(f"Starting Enhancement using {MODELS[mode]['desc']}...")
-    model_path = download_model(mode)
     
     # 1. Load Image
-    img = cv2.imread(input_path)
-    if img is None:
-        print(f"Error: Could not read image at {input_path}")
+    report("load", "Loading image...", percent=2)
+    # Inputs well past the target width are read at a reduced JPEG scale
+    # that still covers it
+    try:
+        img = decoding.decode(input_path, min_width=target_width)
+    except ValueError as e:
+        print(f"Error: Could not read image at {input_path}: {e}")
         return
 
-    # 2. Pre-processing
-    print("Pre-processing: Cleaning image noise...")
-    if mode == "fast":
-        # Lighter denoising for speed
-        denoised = cv2.bilateralFilter(img, d=5, sigmaColor=30, sigmaSpace=30)
-    else:
-        # Stronger denoising for quality (EDSR)
-        denoised = cv2.bilateralFilter(img, d=7, sigmaColor=50, sigmaSpace=50)
-
-    # 3. Scale Calculation
-    h, w = denoised.shape[:2]
-    model_scale = MODELS[mode]["scale"]
-    required_input_width = target_width // model_scale
-    
-    if w != required_input_width:
-        scale = required_input_width / w
-        img_for_ai = cv2.resize(denoised, (required_input_width, int(h * scale)), interpolation=cv2.INTER_CUBIC)
-    else:
-        img_for_ai = denoised
-
-    # 4. AI Upscale
-    print(f"Applying AI Super-Resolution ({MODELS[mode]['name']})...")
-    sr = cv2.dnn_superres.DnnSuperResImpl_create()
-    sr.readModel(model_path)
-    sr.setModel(MODELS[mode]["name"], model_scale)
-    
-    # Process AI upscale
-    ai_output = sr.upsample(img_for_ai)
-
-    # 5. Fusion Pipeline
-    print("Fusion Stage: Blending for natural photorealistic quality...")
-    traditional_upscale = cv2.resize(img_for_ai, (ai_output.shape[1], ai_output.shape[0]), interpolation=cv2.INTER_LANCZOS4)
-    
-    if mode == "fast":
-        # Simple blend for speed
-        final_output = cv2.addWeighted(ai_output, 0.80, traditional_upscale, 0.20, 0)
-    else:
-        # Detailed blend for quality
-        final_output = cv2.addWeighted(ai_output, 0.85, traditional_upscale, 0.15, 0)
-        
-        # Extra sharpening for quality mode
-        gaussian_blur = cv2.GaussianBlur(final_output, (0, 0), 3)
-        final_output = cv2.addWeighted(final_output, 1.2, gaussian_blur, -0.2, 0)
+    def save(final_output):
+        # 7. Save output
+        print(f"Final Output Resolution: {final_output.shape[1]}x{final_output.shape[0]}")
+        report("encode", "Saving enhanced image...", percent=95)
+        # Format from the extension (.jpg unless the caller asked otherwise)
+        encoding.write(output_path, final_output)
 
-    # 7. Save output
-    print(f"Final Output Resolution: {final_output.shape[1]}x{final_output.shape[0]}")
-    cv2.imwrite(output_path, final_output, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    upscale_image(img, mode, target_width, consume=save)
     print(f"Success! Saved Enhanced Image to: {output_path}")
     return output_path
 
+def upscale_image(img, mode="fast", target_width=3840, consume=np.copy):
+    """
+    Plan, denoise, AI passes and fusion on a decoded BGR image. The result
+    lives in pooled scratch memory, so it is handed to consume() (encode it,
+    copy it) before the buffers go back; returns what consume returns.
+    """
+    if mode not in MODELS:
+        mode = "fast"
+
+    # 2. Plan the passes for this input size
+    h, w = img.shape[:2]
+    plan = plan_upscale(w, h, target_width)
+    print(f"Upscale plan: {w}x{h} -> {plan['output'][0]}x{plan['output'][1]} "
+          f"({plan['strategy']}, passes {[p['scale'] for p in plan['passes']]}, pre-scale {plan['pre_scale']})")
+    if plan["passes"]:
+        report("load", f"Loading {MODELS[mode]['desc']} model...", percent=4)
+        nets = [get_superres(mode, p["scale"]) for p in plan["passes"]]
+
+    # 3. Pre-processing
+    print("Pre-processing: Cleaning image noise...")
+    report("denoise", "Pre-processing: Cleaning image noise...", percent=8)
+    with stage("sr.denoise"):
+        if mode == "fast":
+            # Lighter denoising for speed
+            denoised = cv2.bilateralFilter(img, d=5, sigmaColor=30, sigmaSpace=30)
+        else:
+            # Stronger denoising for quality (EDSR)
+            denoised = cv2.bilateralFilter(img, d=7, sigmaColor=50, sigmaSpace=50)
+
+    out_w, out_h = plan["output"]
+    # Full-size intermediates come from the scratch pool (buffers.py) and
+    # every step writes into them via dst=; they go back after encoding
+    scratch = []
+    try:
+        if not plan["passes"]:
+            # Nothing for the AI to do: denoise, then a Lanczos resize if
+            # slightly short or an area downscale if wider than the target
+            final_output = denoised
+            if (out_w, out_h) != (w, h):
+                with stage("sr.resize"):
+                    final_output = buffers.take((out_h, out_w, 3))
+                    scratch.append(final_output)
+                    interpolation = cv2.INTER_AREA if out_w < w else cv2.INTER_LANCZOS4
+                    cv2.resize(denoised, (out_w, out_h), dst=final_output, interpolation=interpolation)
+        else:
+            # 4. AI Upscale
+            img_for_ai = denoised
+            if plan["pre_scale"] > 1.0:
+                first = plan["passes"][0]["input"]
+                img_for_ai = cv2.resize(denoised, (first[0], first[1]), interpolation=cv2.INTER_CUBIC)
+
+            print(f"Applying AI Super-Resolution ({MODELS[mode]['name']})...")
+            ai_output = img_for_ai
+            span = 70.0 / len(plan["passes"])
+            with stage("sr.upsample"):
+                for i, (p, (sr, sr_lock)) in enumerate(zip(plan["passes"], nets)):
+                    ph, pw = ai_output.shape[:2]
+                    out = buffers.take((ph * p["scale"], pw * p["scale"], 3))
+                    scratch.append(out)
+                    with sr_lock:
+                        ai_output = upsample_tiled(sr, ai_output, p["scale"], *tile_settings(mode),
+                                                   span=(15 + i * span, 15 + (i + 1) * span), out=out)
+            if ai_output.shape[:2] != (out_h, out_w):
+                # Overshoot (or pre-scale rounding): bring it to the exact target
+                interpolation = cv2.INTER_AREA if ai_output.shape[1] > out_w else cv2.INTER_CUBIC
+                resized = buffers.take((out_h, out_w, 3))
+                scratch.append(resized)
+                ai_output = cv2.resize(ai_output, (out_w, out_h), dst=resized, interpolation=interpolation)
+
+            # 5. Fusion Pipeline
+            print("Fusion Stage: Blending for natural photorealistic quality...")
+            report("fusion", "Fusion Stage: Blending for natural photorealistic quality...", percent=85)
+            with stage("sr.fusion"):
+                # The blend (and the unsharp mask) accumulate in place in this one frame
+                final_output = buffers.take((out_h, out_w, 3))
+                scratch.append(final_output)
+                cv2.resize(denoised, (out_w, out_h), dst=final_output, interpolation=cv2.INTER_LANCZOS4)
+                
+                if mode == "fast":
+                    # Simple blend for speed
+                    cv2.addWeighted(ai_output, 0.80, final_output, 0.20, 0, dst=final_output)
+                else:
+                    # Detailed blend for quality
+                    cv2.addWeighted(ai_output, 0.85, final_output, 0.15, 0, dst=final_output)
+                    
+                    # Extra sharpening for quality mode (the AI frame is free again: blur into it)
+                    gaussian_blur = cv2.GaussianBlur(final_output, (0, 0), 3, dst=ai_output)
+                    cv2.addWeighted(final_output, 1.2, gaussian_blur, -0.2, 0, dst=final_output)
+
+        return consume(final_output)
+    finally:
+        for buf in scratch:
+            buffers.give(buf)
+
 if __name__ == "__main__":
     # Test block handled via args if needed, but primarily used as module
     pass
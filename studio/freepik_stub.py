@@ -0,0 +1,133 @@
+"""
+Local stand-in for Freepik pages and the img.freepik.com CDN.
+
+    python freepik_stub.py --port 9100
+
+Serves asset pages carrying og:image / twitter:image meta tags (the tags
+resolve_with_browser looks for) and the image bytes they point at, so the
+/api/freepik resolve + download path can be exercised offline and repeatably.
+
+    GET /premium-photo/<slug>_<id>.htm   -> HTML asset page
+    GET /cdn/<slug>_<id>.jpg?w=2000      -> JPEG of the requested width
+"""
+import argparse
+import asyncio
+import random
+
+import cv2
+import numpy as np
+from aiohttp import web
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<title>{title} | Freepik</title>
+<meta property="og:image" content="{image_url}">
+<meta property="og:image:secure_url" content="{image_url}">
+<meta name="twitter:image" content="{image_url}">
+</head>
+<body>
+<div class="image-container"><img src="{thumb_url}" data-cy="image-viewer-content"></div>
+</body>
+</html>
+"""
+
+
+def render_image(width, seed):
+    """Deterministic photo-like JPEG so downloads have realistic entropy."""
+    rng = np.random.default_rng(seed)
+    height = width * 2 // 3
+    small = rng.integers(0, 255, (max(2, height // 32), max(2, width // 32), 3), dtype=np.uint8)
+    img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 8, img.shape)
+    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buf.tobytes()
+
+
+def create_app(page_delay=0.0, cdn_delay=0.0, error_rate=0.0, bandwidth=0, default_width=2000):
+    image_cache = {}
+
+    async def maybe_fail():
+        if error_rate and random.random() < error_rate:
+            raise web.HTTPServiceUnavailable(text="stub: injected failure")
+
+    async def asset_page(request):
+        await maybe_fail()
+        if page_delay:
+            await asyncio.sleep(page_delay)
+        slug = request.match_info["slug"]
+        base = f"{request.scheme}://{request.host}/cdn/{slug}.jpg"
+        html = PAGE_TEMPLATE.format(
+            title=slug.replace("-", " ").replace("_", " "),
+            image_url=f"{base}?w={default_width}",
+            thumb_url=f"{base}?w=626",
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    async def cdn_image(request):
+        await maybe_fail()
+        if cdn_delay:
+            await asyncio.sleep(cdn_delay)
+        slug = request.match_info["slug"]
+        width = max(16, min(int(request.query.get("w", default_width)), 8000))
+        key = (slug, width)
+        if key not in image_cache:
+            seed = sum(slug.encode()) % (2 ** 32)
+            image_cache[key] = await asyncio.to_thread(render_image, width, seed)
+        data = image_cache[key]
+
+        if not bandwidth:
+            return web.Response(body=data, content_type="image/jpeg")
+
+        # Throttle to emulate CDN transfer time on large originals
+        response = web.StreamResponse(headers={"Content-Type": "image/jpeg", "Content-Length": str(len(data))})
+        await response.prepare(request)
+        chunk = 64 * 1024
+        for i in range(0, len(data), chunk):
+            await response.write(data[i:i + chunk])
+            await asyncio.sleep(chunk / bandwidth)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/{kind}/{slug}.htm", asset_page)
+    app.router.add_get("/cdn/{slug}.jpg", cdn_image)
+    return app
+
+
+async def start_stub(host="127.0.0.1", port=9100, **options):
+    """Start the stub inside the running event loop; returns the runner (call .cleanup())."""
+    runner = web.AppRunner(create_app(**options))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def page_url(base_url, index):
+    return f"{base_url}/premium-photo/stub-asset_{index}.htm"
+
+
+def direct_image_url(base_url, index, width=2000):
+    return f"{base_url}/cdn/stub-asset_{index}.jpg?w={width}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Freepik stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--page-delay", type=float, default=0.0, help="Seconds before serving an asset page")
+    parser.add_argument("--cdn-delay", type=float, default=0.0, help="Seconds before serving image bytes")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--bandwidth", type=int, default=0, help="Bytes/second per image download (0 = unlimited)")
+    parser.add_argument("--width", type=int, default=2000, help="Width of the og:image original")
+    args = parser.parse_args()
+
+    app = create_app(args.page_delay, args.cdn_delay, args.error_rate, args.bandwidth, args.width)
+    print(f"[INFO] Freepik stub listening on http://{args.host}:{args.port}")
+    print(f"[INFO] Example page: {page_url(f'http://{args.host}:{args.port}', 1)}")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import gc
+import os
+import sys
+import tempfile
+
+# --------------------------------------------------------------------------------
+# Multi-worker serving (gunicorn + uvicorn workers)
+# --------------------------------------------------------------------------------
+#   gunicorn -c gunicorn.conf.py server:app
+#
+# WEB_CONCURRENCY          number of worker processes (default 1)
+# STUDIO_MAX_JOBS          concurrent pipeline jobs per worker (see jobs.py)
+# STUDIO_THREADS_PER_WORKER  OpenCV / ORT threads per worker (default: cores / workers)
+# STUDIO_PROGRESS_DB       SQLite file the workers share operation progress /
+#                          cancellation through (see progress.py)
+# STUDIO_SESSION_DIR       directory the workers share editing sessions through
+#                          (see sessions.py)
+#
+# The app is imported once in the master (preload_app) and workers are forked
+# from it, so everything loaded before the fork is shared copy-on-write:
+# numpy / OpenCV / onnxruntime / rembg code and the OpenCV super-resolution
+# weights. ONNX Runtime sessions (LaMa, rembg) start their thread pools when
+# they are created and threads do not survive fork(), so those are created in
+# each worker by the normal lifespan warm-up instead.
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn_worker.UvicornWorker"
+# STUDIO_PRELOAD_APP=0 turns sharing off (baseline for memory_report.py)
+preload_app = os.environ.get("STUDIO_PRELOAD_APP", "1") != "0"
+# Model loading and 4K inference are slow; don't let the arbiter kill busy workers
+timeout = int(os.environ.get("STUDIO_WORKER_TIMEOUT", "300"))
+graceful_timeout = 30
+
+# With several processes, parallelism comes from the workers: default to one
+# pipeline job per worker and split the cores between their thread pools.
+if workers > 1:
+    os.environ.setdefault("STUDIO_MAX_JOBS", "1")
+    os.environ.setdefault("STUDIO_THREADS_PER_WORKER", str(max(1, (os.cpu_count() or 1) // workers)))
+    # /api/progress and /api/cancel rarely hit the worker running the operation
+    os.environ.setdefault("STUDIO_PROGRESS_DB", os.path.join(tempfile.gettempdir(), f"studio-progress-{bind.rsplit(':', 1)[-1]}.sqlite"))
+    # Same for the refine requests of an editing session
+    os.environ.setdefault("STUDIO_SESSION_DIR", os.path.join(tempfile.gettempdir(), f"studio-sessions-{bind.rsplit(':', 1)[-1]}"))
+
+
+def on_starting(server):
+    if workers > 1 and not os.environ.get("STUDIO_SESSION_DIR"):
+        server.log.warning(
+            "STUDIO_SESSION_DIR is empty with %d workers: session refinements that reach "
+            "another worker get a 404 and fall back to a full run unless routing is sticky", workers
+        )
+    # Operations of a previous run are gone with its workers
+    path = os.environ.get("STUDIO_PROGRESS_DB")
+    if path:
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before any worker forks
+    if not preload_app:
+        return
+    import warmup
+    warmup.prefork_load()
+    # Move everything allocated so far out of the GC's reach, so collections
+    # in the workers don't write to (and thereby un-share) these pages.
+    gc.freeze()
+    server.log.info("Pre-fork model loading finished")
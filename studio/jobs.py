@@ -0,0 +1,83 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+import progress
+from metrics import Gauge, Histogram
+
+# --------------------------------------------------------------------------------
+# Inference Worker Pool
+# --------------------------------------------------------------------------------
+# The pipelines are blocking (OpenCV / ONNX Runtime) and already multi-threaded
+# internally, so running them on the event loop stalls every other request and
+# running too many at once just thrashes the cores. Heavy work goes through
+# run_job(), which bounds concurrency and exposes the backlog as queue depth.
+
+MAX_JOBS = int(os.environ.get("STUDIO_MAX_JOBS", max(1, (os.cpu_count() or 1) // 2)))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_JOBS, thread_name_prefix="studio-job")
+_semaphore = None
+
+JOBS_QUEUED = Gauge("studio_jobs_queued", "Jobs waiting for a free worker slot.")
+JOBS_RUNNING = Gauge("studio_jobs_running", "Jobs currently executing.")
+JOB_WAIT_SECONDS = Histogram("studio_job_queue_wait_seconds", "Time jobs spent waiting for a worker slot.")
+
+# Moving average of recent job run times, used to predict queue wait (routing.py)
+JOB_SECONDS_EWMA_ALPHA = 0.2
+_recent_job_seconds = None
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_JOBS)
+    return _semaphore
+
+
+def estimated_wait(default_job_seconds=5.0):
+    """Rough seconds a job submitted now would wait for a worker slot."""
+    queued, running = JOBS_QUEUED.value(), JOBS_RUNNING.value()
+    if running + queued < MAX_JOBS:
+        return 0.0
+    job_seconds = _recent_job_seconds if _recent_job_seconds is not None else default_job_seconds
+    # Everyone queued ahead of us has to start first; slots free up MAX_JOBS at a time
+    return (queued + 1) / MAX_JOBS * job_seconds
+
+
+def _record_job_seconds(seconds):
+    global _recent_job_seconds
+    if _recent_job_seconds is None:
+        _recent_job_seconds = seconds
+    else:
+        _recent_job_seconds += JOB_SECONDS_EWMA_ALPHA * (seconds - _recent_job_seconds)
+
+
+async def run_job(fn, *args, **kwargs):
+    """Run a blocking pipeline call on the worker pool, preserving contextvars."""
+    semaphore = _get_semaphore()
+    queued_at = time.perf_counter()
+    JOBS_QUEUED.inc()
+    try:
+        await semaphore.acquire()
+    finally:
+        JOBS_QUEUED.dec()
+    JOB_WAIT_SECONDS.observe(time.perf_counter() - queued_at)
+
+    JOBS_RUNNING.inc()
+    try:
+        # Cancelled while waiting in the queue: hand the slot straight back
+        progress.check_cancelled()
+        ctx = contextvars.copy_context()
+        # profiling.run samples / profiles the job when its request is captured
+        call = functools.partial(ctx.run, profiling.run, fn, *args, **kwargs)
+        started_at = time.perf_counter()
+        result = await asyncio.get_running_loop().run_in_executor(_executor, call)
+        _record_job_seconds(time.perf_counter() - started_at)
+        return result
+    finally:
+        JOBS_RUNNING.dec()
+        semaphore.release()
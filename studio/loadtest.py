@@ -0,0 +1,275 @@
+"""
+Load-testing harness for the studio API.
+
+    python loadtest.py --target http://127.0.0.1:8000 \
+        --mix remove-logo=3,upload=1,remove-bg=2,freepik-direct=1,projects=1 \
+        --concurrency 1,2,4,8,16 --duration 30 --out loadtest.json
+
+Runs the request mix at each concurrency level for --duration seconds and
+reports RPS, latency percentiles and error rates per endpoint, plus the
+concurrency at which throughput stops scaling (the saturation point).
+
+With --freepik-stub a local Freepik stand-in (freepik_stub.py) is started so
+/api/freepik resolves and downloads against it instead of the live site.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+STUDIO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(STUDIO_DIR)
+
+from bench import build_corpus, percentile
+import freepik_stub
+
+ENDPOINTS = [
+    "remove-logo",
+    "remove-logo-auto",
+    "upload",
+    "upload-quality",
+    "remove-bg",
+    "freepik",
+    "freepik-direct",
+    "projects",
+    "version",
+]
+
+
+class Inputs:
+    def __init__(self, entries, stub_url):
+        self.images = []
+        for entry in entries:
+            with open(entry["marked"], "rb") as f:
+                marked = f.read()
+            with open(entry["clean"], "rb") as f:
+                clean = f.read()
+            with open(entry["mask"], "rb") as f:
+                mask = f.read()
+            self.images.append({"marked": marked, "clean": clean, "mask": mask})
+        self.stub_url = stub_url
+        self.counter = 0
+
+    def pick(self):
+        self.counter += 1
+        return self.images[self.counter % len(self.images)], self.counter
+
+
+def build_request(name, inputs):
+    """Return (method, path, kwargs) for one request of the given endpoint."""
+    image, n = inputs.pick()
+    if name in ("remove-logo", "remove-logo-auto"):
+        form = aiohttp.FormData()
+        form.add_field("image", image["marked"], filename=f"load_{n}.jpg", content_type="image/jpeg")
+        if name == "remove-logo":
+            form.add_field("mask", image["mask"], filename="mask.png", content_type="image/png")
+        else:
+            form.add_field("auto_detect", "true")
+        return "POST", "/api/remove-logo", {"data": form}
+    if name in ("upload", "upload-quality"):
+        form = aiohttp.FormData()
+        form.add_field("file", image["clean"], filename=f"load_{n}.jpg", content_type="image/jpeg")
+        form.add_field("mode", "quality" if name == "upload-quality" else "fast")
+        return "POST", "/api/upload", {"data": form}
+    if name == "remove-bg":
+        form = aiohttp.FormData()
+        form.add_field("image", image["clean"], filename=f"load_{n}.jpg", content_type="image/jpeg")
+        return "POST", "/api/remove-bg", {"data": form}
+    if name in ("freepik", "freepik-direct"):
+        if not inputs.stub_url:
+            raise ValueError(f"{name} requires --freepik-stub or --freepik-base")
+        if name == "freepik":
+            url = freepik_stub.page_url(inputs.stub_url, n)
+        else:
+            url = freepik_stub.direct_image_url(inputs.stub_url, n)
+        return "POST", "/api/freepik", {"json": {"url": url}}
+    if name == "projects":
+        return "GET", "/api/projects", {}
+    if name == "version":
+        return "GET", "/api/version", {}
+    raise ValueError(f"Unknown endpoint: {name}")
+
+
+async def send(session, target, name, inputs, timeout):
+    method, path, kwargs = build_request(name, inputs)
+    start = time.perf_counter()
+    error = None
+    try:
+        async with session.request(method, target + path, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs) as r:
+            body = await r.read()
+            if r.status != 200:
+                error = f"HTTP {r.status}"
+            elif r.content_type == "application/json":
+                data = json.loads(body)
+                # The API reports failures as {"error": ...} with a 200 status
+                if isinstance(data, dict) and data.get("error"):
+                    error = "api error"
+    except asyncio.TimeoutError:
+        error = "timeout"
+    except aiohttp.ClientError as e:
+        error = type(e).__name__
+    return name, time.perf_counter() - start, error
+
+
+async def run_step(target, mix, concurrency, duration, inputs, timeout, seed):
+    rng = random.Random(seed)
+    names, weights = zip(*mix.items())
+    samples = []
+    deadline = time.perf_counter() + duration
+
+    async def worker(session):
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            samples.append(await send(session, target, name, inputs, timeout))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed, concurrency)
+
+
+def _latency_summary(latencies):
+    return {
+        "p50": percentile(latencies, 50) * 1000,
+        "p90": percentile(latencies, 90) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "max": max(latencies) * 1000,
+    }
+
+
+def summarize(samples, elapsed, concurrency):
+    per_endpoint = {}
+    for name, latency, error in samples:
+        per_endpoint.setdefault(name, []).append((latency, error))
+
+    endpoints = {}
+    for name, rows in sorted(per_endpoint.items()):
+        errors = {}
+        for _, error in rows:
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+        endpoints[name] = {
+            "requests": len(rows),
+            "rps": len(rows) / elapsed,
+            "error_rate": sum(errors.values()) / len(rows),
+            "errors": errors,
+            "latency_ms": _latency_summary([lat for lat, _ in rows]),
+        }
+
+    ok = [lat for _, lat, error in samples if not error]
+    return {
+        "concurrency": concurrency,
+        "duration_s": elapsed,
+        "requests": len(samples),
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "goodput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "error_rate": (len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        "latency_ms": _latency_summary([lat for _, lat, _ in samples]) if samples else None,
+        "endpoints": endpoints,
+    }
+
+
+def find_saturation(steps, min_gain=0.10):
+    """Last concurrency level that still bought >= min_gain more goodput."""
+    best = steps[0]["concurrency"] if steps else None
+    for prev, cur in zip(steps, steps[1:]):
+        if prev["goodput_rps"] and cur["goodput_rps"] / prev["goodput_rps"] - 1 < min_gain:
+            return prev["concurrency"]
+        best = cur["concurrency"]
+    return best
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint '{name}'. Choose from: {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def main_async(args):
+    mix = parse_mix(args.mix)
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    stub_runner = None
+    stub_url = args.freepik_base
+    if args.freepik_stub:
+        stub_runner = await freepik_stub.start_stub(
+            args.stub_host, args.stub_port,
+            page_delay=args.stub_page_delay, cdn_delay=args.stub_cdn_delay, error_rate=args.stub_error_rate,
+        )
+        stub_url = f"http://{args.stub_host}:{args.stub_port}"
+        print(f"[INFO] Freepik stub running at {stub_url}")
+
+    corpus_dir = tempfile.mkdtemp(prefix="studio_load_corpus_")
+    try:
+        corpus = build_corpus(corpus_dir, [args.image_size])
+        inputs = Inputs(corpus["images"][args.image_size], stub_url)
+
+        steps = []
+        for i, concurrency in enumerate(levels):
+            print(f"[INFO] Concurrency {concurrency} for {args.duration}s ...")
+            step = await run_step(args.target, mix, concurrency, args.duration, inputs, args.timeout, args.seed + i)
+            steps.append(step)
+            lat = step["latency_ms"] or {"p50": 0, "p90": 0, "p99": 0}
+            print(f"  {step['rps']:.2f} req/s  goodput {step['goodput_rps']:.2f}/s  "
+                  f"errors {step['error_rate']:.1%}  p50 {lat['p50']:.0f} ms  p90 {lat['p90']:.0f} ms  p99 {lat['p99']:.0f} ms")
+            for name, ep in step["endpoints"].items():
+                print(f"    {name:<18} {ep['requests']:>5} req  {ep['rps']:>6.2f}/s  err {ep['error_rate']:>6.1%}  "
+                      f"p90 {ep['latency_ms']['p90']:>8.0f} ms")
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+        if stub_runner:
+            await stub_runner.cleanup()
+
+    report = {
+        "target": args.target,
+        "mix": mix,
+        "image_size": args.image_size,
+        "steps": steps,
+        "saturation_concurrency": find_saturation(steps),
+    }
+    print(f"[INFO] Throughput saturates at concurrency ~{report['saturation_concurrency']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Saved load-test report to: {args.out}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Studio API load test")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="Base URL of the studio server")
+    parser.add_argument("--mix", default="remove-logo=3,upload=1,remove-bg=2,projects=1",
+                        help=f"Weighted endpoint mix, e.g. remove-logo=3,upload=1. Endpoints: {','.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated concurrency levels to step through")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--image-size", type=int, default=1024, help="Long side of uploaded test images")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the JSON report here")
+    parser.add_argument("--freepik-stub", action="store_true", help="Start the local Freepik stand-in")
+    parser.add_argument("--freepik-base", help="Use an already running stub at this base URL")
+    parser.add_argument("--stub-host", default="127.0.0.1")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--stub-page-delay", type=float, default=0.0)
+    parser.add_argument("--stub-cdn-delay", type=float, default=0.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import json
+
+import cv2
+import numpy as np
+
+# --------------------------------------------------------------------------------
+# Compact Mask Encodings
+# --------------------------------------------------------------------------------
+# Instead of a full-resolution PNG the client can describe the mask as JSON
+# (form field "mask_spec") and it is rasterized straight into the uint8 mask
+# LaMa consumes. All parts are optional and are combined (union):
+#
+# {
+#   "width": 800, "height": 450,          # the client's canvas: coordinate
+#                                         # space of boxes/strokes and an
+#                                         # allowed rle size (default: the image)
+#   "boxes":   [[x0, y0, x1, y1], ...],
+#   "strokes": [{"points": [[x, y], ...], "radius": 12}, ...],
+#   "rle":     {"size": [h, w], "counts": [n0, n1, ...]}
+# }
+#
+# RLE counts are row-major run lengths alternating background / foreground,
+# starting with background (so a mask starting with foreground has n0 = 0).
+# The RLE size must be either the image's own [h, w] or the canvas
+# [height, width]; a canvas-sized grid is scaled to the image with
+# nearest-neighbour, like the rest of the spec. The size is checked before
+# anything is allocated (a canvas grid is at most MAX_RLE_CANVAS_PIXELS), so a
+# few bytes of JSON cannot ask for a huge grid.
+
+MAX_POINTS = 100000
+MAX_BOXES = 1000
+MAX_RLE_RUNS = 4 * 1024 * 1024
+MAX_RLE_CANVAS_PIXELS = 4096 * 4096
+
+
+def parse_mask_spec(text):
+    try:
+        spec = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Invalid mask_spec JSON: {e}")
+    if not isinstance(spec, dict):
+        raise ValueError("mask_spec must be a JSON object")
+    if not any(k in spec for k in ("boxes", "strokes", "rle")):
+        raise ValueError("mask_spec needs at least one of boxes, strokes or rle")
+    return spec
+
+
+def _decode_rle(rle, shape, canvas=None):
+    try:
+        h, w = (int(v) for v in rle["size"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("rle needs 'size': [h, w] and integer 'counts'")
+    on_canvas = canvas is not None and (h, w) == canvas and h * w <= MAX_RLE_CANVAS_PIXELS
+    if (h, w) != tuple(shape[:2]) and not on_canvas:
+        expected = f"the image ({shape[0]}x{shape[1]})"
+        if canvas is not None:
+            expected += f" or the canvas ({canvas[0]}x{canvas[1]})"
+        raise ValueError(f"rle size {h}x{w} does not match {expected}")
+    try:
+        counts = np.asarray(rle["counts"], dtype=np.int64)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        raise ValueError("rle needs 'size': [h, w] and integer 'counts'")
+    # Each run within the grid also keeps the sum below from overflowing
+    if counts.ndim != 1 or len(counts) > MAX_RLE_RUNS or (counts < 0).any() or (counts > h * w).any():
+        raise ValueError("Invalid rle mask")
+    if int(counts.sum()) != h * w:
+        raise ValueError(f"rle counts cover {int(counts.sum())} pixels, expected {h * w}")
+    values = np.zeros(len(counts), np.uint8)
+    values[1::2] = 255
+    grid = np.repeat(values, counts).reshape(h, w)
+    if (h, w) != tuple(shape[:2]):
+        grid = cv2.resize(grid, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+    return grid
+
+
+def decode_mask(spec, shape):
+    """Rasterize a parsed mask_spec into a uint8 mask of the image's height/width."""
+    img_h, img_w = shape[:2]
+    mask = np.zeros((img_h, img_w), np.uint8)
+
+    # Coordinates are given in the client's space (e.g. the 800px canvas)
+    src_w = float(spec.get("width") or img_w)
+    src_h = float(spec.get("height") or img_h)
+    if src_w <= 0 or src_h <= 0:
+        raise ValueError("mask_spec width/height must be positive")
+    sx, sy = img_w / src_w, img_h / src_h
+
+    boxes = spec.get("boxes") or []
+    if len(boxes) > MAX_BOXES:
+        raise ValueError(f"At most {MAX_BOXES} boxes are supported")
+    for box in boxes:
+        try:
+            x0, y0, x1, y1 = (float(v) for v in box)
+        except (TypeError, ValueError):
+            raise ValueError("Each box must be [x0, y0, x1, y1]")
+        cv2.rectangle(
+            mask,
+            (int(round(min(x0, x1) * sx)), int(round(min(y0, y1) * sy))),
+            (int(round(max(x0, x1) * sx)), int(round(max(y0, y1) * sy))),
+            255, thickness=-1
+        )
+
+    strokes = spec.get("strokes") or []
+    if sum(len(s.get("points") or []) for s in strokes if isinstance(s, dict)) > MAX_POINTS:
+        raise ValueError(f"At most {MAX_POINTS} stroke points are supported")
+    # The brush is round, so scale its radius by the mean of both axes
+    radius_scale = (sx + sy) / 2.0
+    for stroke in strokes:
+        try:
+            points = np.asarray(stroke["points"], dtype=np.float64).reshape(-1, 2)
+            radius = float(stroke.get("radius", 10))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError("Each stroke needs 'points': [[x, y], ...] and a numeric 'radius'")
+        if len(points) == 0:
+            continue
+        points = np.round(points * (sx, sy)).astype(np.int32)
+        thickness = max(1, int(round(2 * radius * radius_scale)))
+        if len(points) == 1:
+            cv2.circle(mask, tuple(int(v) for v in points[0]), thickness // 2, 255, thickness=-1)
+        else:
+            # Round caps/joints like the canvas brush (lineCap = 'round')
+            cv2.polylines(mask, [points], isClosed=False, color=255, thickness=thickness)
+            for x, y in (points[0], points[-1]):
+                cv2.circle(mask, (int(x), int(y)), thickness // 2, 255, thickness=-1)
+
+    if spec.get("rle"):
+        canvas = (int(src_h), int(src_w)) if spec.get("width") or spec.get("height") else None
+        cv2.bitwise_or(mask, _decode_rle(spec["rle"], mask.shape, canvas), dst=mask)
+
+    return mask
+
+
+def encode_rle(mask):
+    """Inverse of the rle part of decode_mask (for clients and tests)."""
+    flat = (np.asarray(mask).reshape(-1) > 0).astype(np.int8)
+    changes = np.flatnonzero(np.diff(flat)) + 1
+    bounds = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(bounds).tolist()
+    if flat.size and flat[0]:
+        counts = [0] + counts
+    return {"size": list(mask.shape[:2]), "counts": counts}
@@ -1,11 +1,34 @@
 import cv2
 import numpy as np
 import os
+import threading
 import onnxruntime as ort
 
+import buffers
+import decoding
+import encoding
+from metrics import stage, MODEL_LOADS
+from progress import report
+from runtime import ort_session_options
+
+from logo_remover.masks import decode_mask
+from logo_remover.subjects import protection_mask
+
+# Context kept around the mask box for the unsharp mask (a sigma 3 Gaussian
+# reaches 9 px on 8-bit images)
+COMPOSITE_PAD = 16
+
+# Periodic (tiled) watermark detection: "fft" finds the tile lattice and falls
+# back to Hough lines when there is none, "hough" is the old line detector only
+PERIODIC_DETECTOR = os.environ.get("STUDIO_PERIODIC_DETECTOR", "fft")
+FFT_WORK_SIZE = 512         # long side the lattice is estimated at
+FFT_MIN_PROMINENCE = 0.05   # autocorrelation peak height over its surroundings; clean photos stay below ~0.03
+FFT_TEMPLATE_BINS = 48      # resolution of the folded tile
+
 class LamaInpainter:
     def __init__(self, model_path):
-        self.session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.session = ort.InferenceSession(model_path, sess_options=ort_session_options(), providers=['CPUExecutionProvider'])
+        MODEL_LOADS.inc(model="lama")
         self.input_name_img = self.session.get_inputs()[0].name
         self.input_name_mask = self.session.get_inputs()[1].name
         self.output_name = self.session.get_outputs()[0].name
@@ -29,7 +52,7 @@ class LamaInpainter:
 
         return img_tensor, mask_tensor
 
-    def postprocess(self, result, original_shape):
+    def postprocess(self, result, original_shape, dst=None):
         # Result is (1, 3, 512, 512)
         result = np.squeeze(result, axis=0)
         result = np.transpose(result, (1, 2, 0))
@@ -41,39 +64,47 @@ class LamaInpainter:
             result = result.clip(0, 255).astype(np.uint8)
         
         # Resize back to original dimensions
-        result = cv2.resize(result, (original_shape[1], original_shape[0]), interpolation=cv2.INTER_LANCZOS4)
+        result = cv2.resize(result, (original_shape[1], original_shape[0]), dst=dst, interpolation=cv2.INTER_LANCZOS4)
         
         return result
 
     def inpaint(self, img, mask):
         original_shape = img.shape
         
-        # 1. Prepare RGB version for the AI model
-        if len(original_shape) == 3 and original_shape[2] == 4:
-            img_rgb_input = cv2.cvtColor(img, cv2.COLOR_BGRA2RGB)
-        elif len(original_shape) == 3 and original_shape[2] == 3:
-            img_rgb_input = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        else:
-            img_rgb_input = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
-
-        # 2. Inference (on 512x512)
-        img_pre, mask_pre = self.preprocess(img_rgb_input, mask)
-        outputs = self.session.run([self.output_name], {
-            self.input_name_img: img_pre,
-            self.input_name_mask: mask_pre
-        })
-        
-        # 3. Postprocess and Upscale (RGB)
-        result_rgb = self.postprocess(outputs[0], original_shape)
-        
-        # 4. Professional Sharpening: Apply Unsharp Mask only to the result
-        # This compensates for the upscale blur
-        blur = cv2.GaussianBlur(result_rgb, (0, 0), 3)
-        result_sharp_rgb = cv2.addWeighted(result_rgb, 1.6, blur, -0.6, 0)
-        
+        # Full-size RGB frames (model input, upscaled result) are pooled scratch
+        result_rgb = buffers.take(original_shape[:2] + (3,))
+        try:
+            # 1. Prepare RGB version for the AI model
+            if len(original_shape) == 3 and original_shape[2] == 4:
+                img_rgb_input = cv2.cvtColor(img, cv2.COLOR_BGRA2RGB, dst=result_rgb)
+            elif len(original_shape) == 3 and original_shape[2] == 3:
+                img_rgb_input = cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=result_rgb)
+            else:
+                img_rgb_input = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB, dst=result_rgb)
+
+            # 2. Inference (on 512x512)
+            with stage("lama.preprocess"):
+                img_pre, mask_pre = self.preprocess(img_rgb_input, mask)
+            with stage("lama.run"):
+                outputs = self.session.run([self.output_name], {
+                    self.input_name_img: img_pre,
+                    self.input_name_mask: mask_pre
+                })
+            
+            # 3. Postprocess and Upscale (RGB), into the same frame (the input is no longer needed)
+            with stage("lama.postprocess"):
+                self.postprocess(outputs[0], original_shape, dst=result_rgb)
+            
+            with stage("lama.composite"):
+                return self.composite(img, mask, result_rgb)
+        finally:
+            buffers.give(result_rgb)
+
+    def composite(self, img, mask, result_rgb):
         # 5. BIT-PERFECT SURGICAL REPLACEMENT
         # We start with the ABSOLUTE ORIGINAL image (binary bytes)
         # and only overwrite the pixels within the mask.
+        original_shape = img.shape
         final_result = img.copy()
         
         # Align mask to original resolution
@@ -81,23 +112,41 @@ class LamaInpainter:
             mask_aligned = cv2.resize(mask, (original_shape[1], original_shape[0]), interpolation=cv2.INTER_NEAREST)
         else:
             mask_aligned = mask
-            
+        
         # Binary threshold the mask for surgical precision
         _, mask_bool = cv2.threshold(mask_aligned, 10, 255, cv2.THRESH_BINARY)
+        if mask_bool.ndim == 3:
+            mask_bool = mask_bool.max(axis=2)
         
-        # Convert sharpened result to appropriate format (BGR or BGRA)
-        if len(original_shape) == 3 and original_shape[2] == 4:
-            result_bgr = cv2.cvtColor(result_sharp_rgb, cv2.COLOR_RGB2BGR)
-            # Re-attach original alpha to the replacement pixels
-            replacement = cv2.merge([result_bgr[:,:,0], result_bgr[:,:,1], result_bgr[:,:,2], img[:,:,3]])
-        elif len(original_shape) == 3 and original_shape[2] == 3:
-            replacement = cv2.cvtColor(result_sharp_rgb, cv2.COLOR_RGB2BGR)
-        else:
-            replacement = cv2.cvtColor(result_sharp_rgb, cv2.COLOR_RGB2GRAY)
-
-        # Apply surgical replacement where mask is active
-        # This keeps non-masked pixels bit-for-bit identical to the original
-        final_result[mask_bool > 0] = replacement[mask_bool > 0]
+        # Everything below only touches the mask's bounding box
+        x, y, w, h = cv2.boundingRect(mask_bool)
+        if w == 0 or h == 0:
+            return final_result
+        
+        # 4. Professional Sharpening: Apply Unsharp Mask only to the result
+        # This compensates for the upscale blur. The blur needs COMPOSITE_PAD
+        # pixels of context around the box to match a full-frame pass exactly.
+        H, W = original_shape[:2]
+        px0, py0 = max(0, x - COMPOSITE_PAD), max(0, y - COMPOSITE_PAD)
+        px1, py1 = min(W, x + w + COMPOSITE_PAD), min(H, y + h + COMPOSITE_PAD)
+        region = result_rgb[py0:py1, px0:px1]
+        with buffers.borrowed(region.shape) as (sharp,):
+            cv2.GaussianBlur(region, (0, 0), 3, dst=sharp)
+            cv2.addWeighted(region, 1.6, sharp, -0.6, 0, dst=sharp)
+            sharp = sharp[y - py0:y - py0 + h, x - px0:x - px0 + w]
+            
+            # Convert sharpened result to appropriate format (BGR or BGRA)
+            # and overwrite only where the mask is active. This keeps
+            # non-masked pixels bit-for-bit identical to the original.
+            where = mask_bool[y:y + h, x:x + w] > 0
+            target = final_result[y:y + h, x:x + w]
+            if len(original_shape) == 3 and original_shape[2] == 4:
+                # The original alpha stays on the replacement pixels
+                np.copyto(target[:, :, :3], cv2.cvtColor(sharp, cv2.COLOR_RGB2BGR), where=where[:, :, None])
+            elif len(original_shape) == 3 and original_shape[2] == 3:
+                np.copyto(target, cv2.cvtColor(sharp, cv2.COLOR_RGB2BGR), where=where[:, :, None])
+            else:
+                np.copyto(target, cv2.cvtColor(sharp, cv2.COLOR_RGB2GRAY).reshape(target.shape), where=where.reshape(target.shape))
             
         return final_result
 
@@ -169,24 +218,8 @@ class MultiScaleSegmenter:
         return mask
 
     def protect_subjects(self):
-        # Create a protection mask for faces and high-detail subjects
-        # 1. Face Detection (Haar Cascades)
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        faces = face_cascade.detectMultiScale(self.gray, 1.1, 4)
-        
-        protection = np.zeros_like(self.gray)
-        for (x, y, w, h) in faces:
-            # Expand face region slightly for hair protection
-            cv2.rectangle(protection, (x - w//4, y - h//3), (x + w + w//4, y + h), 255, -1)
-            
-        # 2. High-Frequency Subject Outlines (Canny)
-        # We protect strong structural edges from being blurred
-        edges = cv2.Canny(self.gray, 100, 200)
-        edge_protection = cv2.dilate(edges, np.ones((5,5), np.uint8), iterations=3)
-        
-        # Combine protections
-        final_protection = cv2.bitwise_or(protection, edge_protection)
-        return final_protection
+        # Faces and strong subject outlines the mask must stay out of (subjects.py)
+        return protection_mask(self.gray, self.img_bgr)
 
     def get_periodic_mask(self):
         # Specific detection for the diagonal watermark grid
@@ -218,38 +251,115 @@ class MultiScaleSegmenter:
         
         return periodic_mask
 
+    def _find_lattice(self, energy):
+        # Autocorrelation of the stroke-energy map, via the power spectrum
+        # (Wiener-Khinchin). A tiled watermark repeats the same glyphs on a 2-D
+        # lattice, so its autocorrelation has sharp peaks at the lattice
+        # vectors. The spectrum itself is a poor place to look: text spreads
+        # each tile's energy over many harmonics, while in the autocorrelation
+        # they all add up at the tile offset.
+        h, w = energy.shape
+        dft_h, dft_w = cv2.getOptimalDFTSize(2 * h), cv2.getOptimalDFTSize(2 * w)
+        padded = np.zeros((dft_h, dft_w), np.float32)
+        padded[:h, :w] = energy
+        spectrum = cv2.dft(padded, flags=cv2.DFT_COMPLEX_OUTPUT)
+        power = cv2.magnitude(spectrum[..., 0], spectrum[..., 1]) ** 2
+        ac = cv2.idft(np.dstack([power, np.zeros_like(power)]), flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+        ac = np.fft.fftshift(ac)
+        cy, cx = dft_h // 2, dft_w // 2
+
+        # Only lags up to a third of the image: at least three repeats, and
+        # enough overlap for the estimate to mean something
+        max_y, max_x = h // 3, w // 3
+        ac = ac[cy - max_y:cy + max_y + 1, cx - max_x:cx + max_x + 1]
+        # Normalize by the overlap at each lag, then to 1 at lag 0
+        overlap = np.outer(h - np.abs(np.arange(-max_y, max_y + 1)), w - np.abs(np.arange(-max_x, max_x + 1)))
+        ac = ac / overlap.astype(np.float32)
+        ac /= ac[max_y, max_x] + 1e-12
+
+        # Peaks standing out from their surroundings
+        prominence = ac - cv2.blur(ac, (15, 15))
+        peaks = ac == cv2.dilate(ac, np.ones((5, 5), np.uint8))
+        yy, xx = np.mgrid[-max_y:max_y + 1, -max_x:max_x + 1]
+        # One half-plane (the autocorrelation is symmetric), away from the lag-0 ridge
+        peaks &= (np.hypot(xx, yy) >= 4) & ((yy > 0) | ((yy == 0) & (xx > 0)))
+        peaks &= prominence >= FFT_MIN_PROMINENCE
+        points = np.argwhere(peaks)
+        if len(points) == 0:
+            return None, None
+
+        # The lattice basis: the shortest strong peak, then the shortest one
+        # not parallel to it (a single vector means repeated stripes)
+        best = prominence[peaks].max()
+        vectors = []
+        for py, px in points:
+            if prominence[py, px] < 0.5 * best:
+                continue
+            # Parabolic sub-pixel refinement; the period error adds up across the image
+            dy = self._parabolic(ac[py - 1, px], ac[py, px], ac[py + 1, px]) if 0 < py < ac.shape[0] - 1 else 0.0
+            dx = self._parabolic(ac[py, px - 1], ac[py, px], ac[py, px + 1]) if 0 < px < ac.shape[1] - 1 else 0.0
+            vectors.append(np.array([px - max_x + dx, py - max_y + dy]))
+        vectors.sort(key=lambda v: np.hypot(v[0], v[1]))
+        a1, a2 = vectors[0], None
+        for v in vectors[1:]:
+            cos = abs(np.dot(a1, v)) / (np.hypot(*a1) * np.hypot(*v))
+            if cos < np.cos(np.radians(15)):
+                a2 = v
+                break
+        return a1, a2
+
+    @staticmethod
+    def _parabolic(left, center, right):
+        d = left - 2 * center + right
+        return 0.0 if d == 0 else 0.5 * (left - right) / d
+
     def get_fft_mask(self):
-        # 1. Frequency Domain Analysis to find periodic grids
-        # Resize for speed to find global patterns
-        small = cv2.resize(self.gray, (512, 512))
-        f = np.fft.fft2(small)
-        fshift = np.fft.fftshift(f)
-        magnitude_spectrum = 20 * np.log(np.abs(fshift) + 1e-6)
-        
-        # 2. Find spikes (peaks) in frequency domain
-        # Periodic watermarks appear as regular spikes around the center
-        rows, cols = small.shape
-        crow, ccol = rows // 2, cols // 2
-        
-        # Threshold the spectrum to find peaks
-        _, peaks = cv2.threshold(magnitude_spectrum.astype(np.uint8), 200, 255, cv2.THRESH_BINARY)
-        # Clear the DC component (center)
-        cv2.circle(peaks, (ccol, crow), 10, 0, -1)
-        
-        # 3. If peaks exist, we have a periodic pattern
-        mask_small = np.zeros_like(small)
-        if np.sum(peaks) > 50:
-            # Reconstruct which angles are dominant
-            pts = np.argwhere(peaks > 0)
-            for pt in pts:
-                dy, dx = pt[0] - crow, pt[1] - ccol
-                # This corresponds to a periodic signal in image space
-                # We create a synthetic "signal mask" based on these frequencies
-                # But for simplicity, we'll use this to boost the periodic detector
-                pass 
-        
-        # Return a boost map for the periodic detector
-        return peaks # Just a placeholder signal for now
+        # Tiled stock watermarks (the same text repeated on a slanted grid)
+        # are found from their periodicity instead of line by line: estimate
+        # the tile lattice from the autocorrelation, fold the image onto one
+        # tile so the watermark averages up and the photo averages out, and
+        # stamp that tile back over the whole frame. Returns None when there
+        # is no periodic pattern, so the caller can fall back to Hough.
+        h, w = self.gray.shape
+        s = min(1.0, FFT_WORK_SIZE / max(h, w))
+        small = cv2.resize(self.gray, (max(1, round(w * s)), max(1, round(h * s))), interpolation=cv2.INTER_AREA)
+        small = small.astype(np.float32)
+
+        # 1. Stroke energy: high-pass, rectified and smoothed, zero mean
+        high_pass = small - cv2.GaussianBlur(small, (0, 0), 2)
+        energy = cv2.GaussianBlur(np.abs(high_pass), (0, 0), 1.5)
+        energy -= energy.mean()
+
+        # 2. Lattice from the autocorrelation peaks
+        a1, a2 = self._find_lattice(energy)
+        if a1 is None:
+            return None
+
+        # 3. Fold: lattice coordinates of every pixel, modulo one tile
+        sh, sw = small.shape
+        yy, xx = np.mgrid[0:sh, 0:sw].astype(np.float32)
+        bins = FFT_TEMPLATE_BINS
+        if a2 is not None:
+            basis = np.linalg.inv(np.column_stack([a1, a2])).astype(np.float32)
+            u = (basis[0, 0] * xx + basis[0, 1] * yy) % 1.0
+            v = (basis[1, 0] * xx + basis[1, 1] * yy) % 1.0
+        else:
+            normal = (a1 / np.dot(a1, a1)).astype(np.float32)
+            u = (normal[0] * xx + normal[1] * yy) % 1.0
+            v = np.zeros_like(u)
+        cells = np.minimum((v * bins).astype(np.int32), bins - 1) * bins + np.minimum((u * bins).astype(np.int32), bins - 1)
+        sums = np.bincount(cells.ravel(), weights=high_pass.ravel(), minlength=bins * bins)
+        counts = np.bincount(cells.ravel(), minlength=bins * bins)
+        tile = (sums / np.maximum(counts, 1)).astype(np.float32).reshape(bins, bins)
+
+        # 4. Stamp the tile back at the working size and keep its bright strokes:
+        # above the noise left after averaging, and a fair share of the peak
+        stamped = cv2.remap(tile, u * bins - 0.5, v * bins - 0.5, cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
+        noise = high_pass.std() / np.sqrt(max(1.0, counts.mean()))
+        threshold = max(3 * noise, 0.3 * float(tile.max()))
+        stamped = cv2.resize(stamped, (w, h), interpolation=cv2.INTER_LINEAR)
+        _, mask = cv2.threshold(stamped, threshold, 255, cv2.THRESH_BINARY)
+        return mask.astype(np.uint8)
 
     def refine_mask_bilateral(self, mask):
         # Refine mask to snap to image edges using Bilateral/Guided Filter
@@ -263,11 +373,27 @@ class MultiScaleSegmenter:
 
     def segment(self):
         # 1. Feature Extraction (Multi-Signal)
-        texture = self.get_texture_mask()
-        entropy = self.get_entropy_mask()
-        structural = self.get_structural_mask()
-        periodic = self.get_periodic_mask()
-        protection = self.protect_subjects()
+        report("segment", "Auto-detecting watermark: texture analysis", percent=10)
+        with stage("segment.texture"):
+            texture = self.get_texture_mask()
+        report("segment", "Auto-detecting watermark: gradient entropy", percent=15)
+        with stage("segment.entropy"):
+            entropy = self.get_entropy_mask()
+        report("segment", "Auto-detecting watermark: text structures", percent=20)
+        with stage("segment.structural"):
+            structural = self.get_structural_mask()
+        report("segment", "Auto-detecting watermark: periodic patterns", percent=30)
+        periodic = None
+        if PERIODIC_DETECTOR == "fft":
+            with stage("segment.periodic_fft"):
+                periodic = self.get_fft_mask()
+        if periodic is None:
+            with stage("segment.periodic"):
+                periodic = self.get_periodic_mask()
+        report("segment", "Auto-detecting watermark: protecting subjects", percent=40)
+        with stage("segment.protect"):
+            protection = self.protect_subjects()
+        report("segment", "Auto-detecting watermark: fusing signals", percent=50)
 
         # 2. Logic: Advanced Signal Fusion (VisualGPT Type)
         # Signal 1: High-Confidence Grid (Periodic + Texture)
@@ -280,8 +406,9 @@ class MultiScaleSegmenter:
         watermark_raw = cv2.bitwise_or(grid_signal, text_signal)
         
         # 3. Selective Saliency (Only high-contrast items)
-        saliency = cv2.saliency.StaticSaliencySpectralResidual_create()
-        _, s_map = saliency.computeSaliency(self.gray)
+        with stage("segment.saliency"):
+            saliency = cv2.saliency.StaticSaliencySpectralResidual_create()
+            _, s_map = saliency.computeSaliency(self.gray)
         s_map = (s_map * 255).astype("uint8")
         _, s_thresh = cv2.threshold(s_map, 80, 255, cv2.THRESH_BINARY)
         
@@ -300,7 +427,8 @@ class MultiScaleSegmenter:
         mask_precise = cv2.morphologyEx(mask_precise, cv2.MORPH_CLOSE, k_v)
         
         # 6. Bilateral Edge Snapping
-        mask_final = self.refine_mask_bilateral(mask_precise)
+        with stage("segment.refine"):
+            mask_final = self.refine_mask_bilateral(mask_precise)
         
         # 7. Area Analysis (Noise reduction)
         num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask_final, connectivity=8)
@@ -315,40 +443,138 @@ def auto_detect_mask(img):
     segmenter = MultiScaleSegmenter(img)
     return segmenter.segment()
 
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "lama.onnx")
+
+_inpainter = None
+_inpainter_lock = threading.Lock()
+
+def get_inpainter():
+    """
+    Process-wide LaMa session (ONNX Runtime sessions are safe to share across threads).
+    """
+    global _inpainter
+    if _inpainter is None:
+        with _inpainter_lock:
+            if _inpainter is None:
+                if not os.path.exists(MODEL_PATH):
+                    raise FileNotFoundError(f"Lama model not found at {MODEL_PATH}")
+                with stage("lama.load"):
+                    _inpainter = LamaInpainter(MODEL_PATH)
+    return _inpainter
+
+def warmup():
+    # One tiny inference so ORT finishes its lazy graph/allocator setup now
+    # instead of on the first user request.
+    img = np.zeros((64, 64, 3), np.uint8)
+    mask = np.zeros((64, 64), np.uint8)
+    mask[24:40, 24:40] = 255
+    get_inpainter().inpaint(img, mask)
+
+def prepare_mask(mask):
+    # Strict threshold, then grow slightly so LaMa also covers anti-aliased edges
+    _, mask = cv2.threshold(mask, 15, 255, cv2.THRESH_BINARY)
+    return cv2.dilate(mask, np.ones((5,5), np.uint8), iterations=1)
+
+def save_result(output_path, result):
+    # Format from the extension, tuned parameters from encoding.py
+    return encoding.write(output_path, result)
+
+def clean_image(img, mask="AUTO"):
+    """
+    Watermark removal on an already decoded image. mask is a grayscale array
+    (any resolution, it is aligned to the image) or "AUTO" for auto-detection.
+    """
+    report("load", "Loading model and image...", percent=2)
+    inpainter = get_inpainter()
+
+    if isinstance(mask, str) and mask == "AUTO":
+        with stage("segment"):
+            mask = auto_detect_mask(img)
+
+    mask = prepare_mask(mask)
+
+    print(f"Executing Deep Reconstruction...")
+    report("inpaint", "Executing Deep Reconstruction...", percent=60)
+    return inpainter.inpaint(img, mask)
+
+# --------------------------------------------------------------------------------
+# Region Re-inpainting (interactive refinement)
+# --------------------------------------------------------------------------------
+# A refinement stroke usually covers a small part of the frame. Instead of
+# running LaMa over the whole (already cleaned) image again, only a crop
+# around the new mask is inpainted: the mask bounding box grown by some
+# context so LaMa still sees the surroundings, made roughly square so the
+# 512x512 resize does not distort it. The crop also gets more of LaMa's fixed
+# 512px resolution than the same area would in a full-frame pass.
+REGION_MIN_CONTEXT = 48       # px of context around the mask, at least
+REGION_CONTEXT_RATIO = 0.5    # ... or this fraction of the mask size
+REGION_FULL_FRAME = 0.6       # crops bigger than this share of the frame run full-frame
+
+def mask_region(mask, image_shape):
+    """Crop box (x0, y0, x1, y1) to re-inpaint for mask, or None if it is empty."""
+    points = cv2.findNonZero(mask)
+    if points is None:
+        return None
+    x, y, w, h = cv2.boundingRect(points)
+    img_h, img_w = image_shape[:2]
+
+    margin = max(REGION_MIN_CONTEXT, int(max(w, h) * REGION_CONTEXT_RATIO))
+    side = max(w, h) + 2 * margin
+    cx, cy = x + w / 2.0, y + h / 2.0
+    crop_w, crop_h = min(img_w, side), min(img_h, side)
+    x0 = int(min(max(0, cx - crop_w / 2.0), img_w - crop_w))
+    y0 = int(min(max(0, cy - crop_h / 2.0), img_h - crop_h))
+    x1, y1 = x0 + crop_w, y0 + crop_h
+
+    if (crop_w * crop_h) > REGION_FULL_FRAME * img_w * img_h:
+        return (0, 0, img_w, img_h)
+    return (x0, y0, x1, y1)
+
+def refine_image(base, mask):
+    """
+    Re-inpaint only where mask is set, on top of base (the previous result).
+    Returns (result, box) with box=None when the mask is empty.
+    """
+    inpainter = get_inpainter()
+    if mask.shape[:2] != base.shape[:2]:
+        mask = cv2.resize(mask, (base.shape[1], base.shape[0]), interpolation=cv2.INTER_NEAREST)
+    mask = prepare_mask(mask)
+
+    box = mask_region(mask, base.shape)
+    if box is None:
+        return base, None
+    x0, y0, x1, y1 = box
+
+    print(f"Re-inpainting region {x1 - x0}x{y1 - y0} at ({x0}, {y0})...")
+    report("inpaint", "Re-inpainting refined region...", percent=30)
+    patch = inpainter.inpaint(base[y0:y1, x0:x1], mask[y0:y1, x0:x1])
+
+    # inpaint() only replaces masked pixels, so pasting the whole crop leaves
+    # everything outside the new mask bit-for-bit as it was
+    result = base.copy()
+    result[y0:y1, x0:x1] = patch
+    return result, box
+
 def remove_logo(image_path, mask_path, output_path):
     """
     Highly accurate Watermark Elimination system.
+    mask_path: mask image file, "AUTO", or a parsed mask_spec dict (see masks.py).
     """
     try:
-        model_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(model_dir, "models", "lama.onnx")
-        
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Lama model not found at {model_path}")
-            
-        inpainter = LamaInpainter(model_path)
-        img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        img = decoding.decode(image_path, cv2.IMREAD_UNCHANGED)
         
-        if mask_path == "AUTO":
-            mask = auto_detect_mask(img)
+        if isinstance(mask_path, dict):
+            with stage("mask.rasterize"):
+                mask = decode_mask(mask_path, img.shape)
+        elif mask_path == "AUTO":
+            mask = "AUTO"
         else:
-            mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
-        
-        if img is None or mask is None:
-            raise ValueError("Loading failed.")
+            mask = decoding.decode(mask_path, cv2.IMREAD_GRAYSCALE)
 
-        # Prepare Mask (Strict threshold)
-        _, mask = cv2.threshold(mask, 15, 255, cv2.THRESH_BINARY)
-        mask = cv2.dilate(mask, np.ones((5,5), np.uint8), iterations=1)
+        result = clean_image(img, mask)
 
-        print(f"Executing Deep Reconstruction...")
-        result = inpainter.inpaint(img, mask)
-
-        # Meta-preservation save
-        if output_path.lower().endswith(('.jpg', '.jpeg')):
-             cv2.imwrite(output_path, result, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
-        else:
-             cv2.imwrite(output_path, result)
+        report("encode", "Saving result...", percent=95)
+        save_result(output_path, result)
              
         return output_path
 
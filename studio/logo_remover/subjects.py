@@ -0,0 +1,121 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from metrics import stage, MODEL_LOADS
+from runtime import ort_session_options
+
+# --------------------------------------------------------------------------------
+# Subject Protection
+# --------------------------------------------------------------------------------
+# Auto-detect must not paint over faces or strong subject outlines. This used
+# to build a new CascadeClassifier from XML on every call and run it at full
+# resolution (a 4K photo is hundreds of ms to seconds). Now:
+#   - the detector is loaded once (the cascade once per worker thread, since
+#     CascadeClassifier objects must not be shared between threads)
+#   - faces are detected on a copy downscaled to SUBJECT_DETECT_SIZE with a
+#     coarser scale step and the boxes scaled back. The smallest face found is
+#     ~5% of the long side; smaller ones are background detail (and most of
+#     what the full-resolution pass found were false positives)
+#   - STUDIO_SUBJECT_MODEL can point at a small ONNX face detector instead of
+#     the cascade (UltraFace-style: one NCHW image input of fixed size, outputs
+#     scores [1, N, 2] and normalized x1, y1, x2, y2 boxes [1, N, 4]), run on
+#     the shared ONNX Runtime settings.
+
+SUBJECT_DETECT_SIZE = int(os.environ.get("STUDIO_SUBJECT_DETECT_SIZE", "512"))
+CASCADE_SCALE_STEP = 1.15
+SUBJECT_MODEL = os.environ.get("STUDIO_SUBJECT_MODEL", "")
+SUBJECT_MIN_SCORE = float(os.environ.get("STUDIO_SUBJECT_MIN_SCORE", "0.7"))
+
+CASCADE_PATH = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+
+_local = threading.local()
+_onnx_detector = None
+_onnx_lock = threading.Lock()
+
+
+def get_cascade():
+    cascade = getattr(_local, "cascade", None)
+    if cascade is None:
+        with stage("subjects.load"):
+            cascade = cv2.CascadeClassifier(CASCADE_PATH)
+        if cascade.empty():
+            raise FileNotFoundError(f"Face cascade not found at {CASCADE_PATH}")
+        MODEL_LOADS.inc(model="face_cascade")
+        _local.cascade = cascade
+    return cascade
+
+
+class OnnxFaceDetector:
+    def __init__(self, model_path):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(model_path, sess_options=ort_session_options(), providers=['CPUExecutionProvider'])
+        MODEL_LOADS.inc(model="face_onnx")
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.input_h, self.input_w = inp.shape[2], inp.shape[3]
+
+    def detect(self, img_bgr):
+        h, w = img_bgr.shape[:2]
+        blob = cv2.dnn.blobFromImage(img_bgr, 1 / 128.0, (self.input_w, self.input_h), (127, 127, 127), swapRB=True)
+        scores, boxes = self.session.run(None, {self.input_name: blob})
+        scores, boxes = scores[0, :, 1], boxes[0]
+        keep = scores >= SUBJECT_MIN_SCORE
+        scores, boxes = scores[keep], boxes[keep]
+        # Normalized corners -> pixel x, y, w, h
+        rects = [[int(x1 * w), int(y1 * h), int((x2 - x1) * w), int((y2 - y1) * h)] for x1, y1, x2, y2 in boxes]
+        picked = cv2.dnn.NMSBoxes(rects, scores.tolist(), SUBJECT_MIN_SCORE, 0.3) if rects else []
+        return [rects[i] for i in np.array(picked).flatten()]
+
+
+def get_onnx_detector():
+    global _onnx_detector
+    if _onnx_detector is None:
+        with _onnx_lock:
+            if _onnx_detector is None:
+                if not os.path.exists(SUBJECT_MODEL):
+                    raise FileNotFoundError(f"Subject model not found at {SUBJECT_MODEL}")
+                with stage("subjects.load"):
+                    _onnx_detector = OnnxFaceDetector(SUBJECT_MODEL)
+    return _onnx_detector
+
+
+def detect_faces(img):
+    """Face boxes (x, y, w, h) in img coordinates; img is BGR or grayscale."""
+    h, w = img.shape[:2]
+    s = min(1.0, SUBJECT_DETECT_SIZE / max(h, w))
+    small = img if s == 1.0 else cv2.resize(img, (max(1, round(w * s)), max(1, round(h * s))), interpolation=cv2.INTER_AREA)
+
+    if SUBJECT_MODEL:
+        if small.ndim == 2:
+            small = cv2.cvtColor(small, cv2.COLOR_GRAY2BGR)
+        faces = get_onnx_detector().detect(small)
+    else:
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        faces = get_cascade().detectMultiScale(small, CASCADE_SCALE_STEP, 4)
+    return [(int(x / s), int(y / s), int(fw / s), int(fh / s)) for x, y, fw, fh in faces]
+
+
+def protection_mask(gray, img=None):
+    """
+    255 where the watermark mask must not reach: faces (with room for hair)
+    and strong structural edges. img (BGR) is only needed by the ONNX detector.
+    """
+    protection = np.zeros_like(gray)
+    # 1. Faces
+    with stage("segment.protect.faces"):
+        faces = detect_faces(img if SUBJECT_MODEL and img is not None else gray)
+    for (x, y, w, h) in faces:
+        # Expand face region slightly for hair protection
+        cv2.rectangle(protection, (x - w//4, y - h//3), (x + w + w//4, y + h), 255, -1)
+
+    # 2. High-frequency subject outlines: keep strong edges from being blurred.
+    # Canny stays at full resolution (the outlines must line up); three 5x5
+    # dilations are a single 13x13 one, which OpenCV runs separably.
+    with stage("segment.protect.edges"):
+        edges = cv2.Canny(gray, 100, 200)
+        edge_protection = cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, (13, 13)))
+    return cv2.bitwise_or(protection, edge_protection)
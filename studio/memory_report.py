@@ -0,0 +1,168 @@
+"""
+Resident memory per worker in multi-worker mode.
+
+    python memory_report.py --workers 1,2,4          # launch gunicorn at each size
+    python memory_report.py --workers 1,4 --compare-no-preload
+    python memory_report.py --pid <gunicorn master pid>   # inspect a running server
+
+For every process it reports RSS, PSS (shared pages split between sharers)
+and USS (private pages). The cost of one extra worker is the growth of the
+summed PSS per added worker, which is what the host actually pays.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+STUDIO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(STUDIO_DIR)
+
+from metrics import smaps_rollup
+
+MB = 1024 * 1024
+
+
+def children_of(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    # Kernels without CONFIG_PROC_CHILDREN: scan parent pids instead
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def snapshot(master_pid):
+    processes = {"master": master_pid}
+    for i, pid in enumerate(children_of(master_pid)):
+        processes[f"worker_{i}"] = pid
+
+    report = {}
+    for name, pid in processes.items():
+        rollup = smaps_rollup(pid)
+        if rollup is None:
+            continue
+        report[name] = {
+            "pid": pid,
+            "rss_mb": rollup.get("Rss", 0) / MB,
+            "pss_mb": rollup.get("Pss", 0) / MB,
+            "uss_mb": rollup["Uss"] / MB,
+        }
+    workers = [v for k, v in report.items() if k.startswith("worker_")]
+    totals = {
+        "workers": len(workers),
+        "total_rss_mb": sum(v["rss_mb"] for v in report.values()),
+        "total_pss_mb": sum(v["pss_mb"] for v in report.values()),
+        "mean_worker_uss_mb": sum(w["uss_mb"] for w in workers) / len(workers) if workers else 0.0,
+    }
+    return {"processes": report, "totals": totals}
+
+
+def wait_ready(port, workers, timeout):
+    """Wait until enough consecutive /ready probes succeed to cover every worker."""
+    deadline = time.time() + timeout
+    streak = 0
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5) as r:
+                streak = streak + 1 if r.status == 200 else 0
+        except Exception:
+            streak = 0
+        if streak >= workers * 5:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def measure(workers, port, preload, timeout, settle):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(port), STUDIO_PRELOAD_APP="1" if preload else "0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "server:app"],
+        cwd=STUDIO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_ready(port, workers, timeout):
+            raise RuntimeError(f"server with {workers} worker(s) did not become ready in {timeout}s")
+        time.sleep(settle)
+        return snapshot(proc.pid)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def print_snapshot(label, snap):
+    t = snap["totals"]
+    print(f"{label}: {t['workers']} worker(s)  total PSS {t['total_pss_mb']:.0f} MB  "
+          f"total RSS {t['total_rss_mb']:.0f} MB  mean worker USS {t['mean_worker_uss_mb']:.0f} MB")
+    for name, p in snap["processes"].items():
+        print(f"    {name:<10} pid {p['pid']:<7} RSS {p['rss_mb']:>7.0f} MB  PSS {p['pss_mb']:>7.0f} MB  USS {p['uss_mb']:>7.0f} MB")
+
+
+def per_worker_cost(runs):
+    """Marginal PSS per added worker between the smallest and largest run."""
+    if len(runs) < 2:
+        return None
+    lo, hi = runs[0], runs[-1]
+    added = hi["totals"]["workers"] - lo["totals"]["workers"]
+    if added <= 0:
+        return None
+    return (hi["totals"]["total_pss_mb"] - lo["totals"]["total_pss_mb"]) / added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure resident memory per studio worker")
+    parser.add_argument("--pid", type=int, help="Inspect an already running gunicorn master instead")
+    parser.add_argument("--workers", default="1,2,4", help="Worker counts to launch and measure")
+    parser.add_argument("--port", type=int, default=8601)
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for warm-up")
+    parser.add_argument("--settle", type=float, default=3, help="Seconds to wait after ready before sampling")
+    parser.add_argument("--compare-no-preload", action="store_true", help="Also measure with STUDIO_PRELOAD_APP=0")
+    parser.add_argument("--out", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    if args.pid:
+        snap = snapshot(args.pid)
+        print_snapshot(f"pid {args.pid}", snap)
+        report = {"snapshot": snap}
+    else:
+        counts = sorted(int(w) for w in args.workers.split(","))
+        report = {}
+        modes = [True, False] if args.compare_no_preload else [True]
+        for preload in modes:
+            label = "preload" if preload else "no_preload"
+            runs = []
+            for n in counts:
+                snap = measure(n, args.port, preload, args.timeout, args.settle)
+                print_snapshot(f"[{label}]", snap)
+                runs.append(snap)
+            cost = per_worker_cost(runs)
+            if cost is not None:
+                print(f"[{label}] resident memory per extra worker: {cost:.0f} MB (PSS)")
+            report[label] = {"runs": runs, "per_extra_worker_pss_mb": cost}
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved memory report to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
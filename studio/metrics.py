@@ -0,0 +1,269 @@
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# --------------------------------------------------------------------------------
+# Minimal Prometheus-style metrics registry
+# --------------------------------------------------------------------------------
+# Kept dependency-free so the pipelines can import it from worker processes,
+# the benchmark harness and the CLI without pulling in a metrics client.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+REGISTRY = []
+
+
+def _format_labels(label_names, values, extra=None):
+    pairs = list(zip(label_names, values))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.label_names)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.label_names, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        # Callback gauges are evaluated at scrape time (memory, pool sizes, ...)
+        self._function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                return [(self.name, (), None, self._function())]
+            except Exception:
+                return []
+        return super().samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    out.append((f"{self.name}_bucket", key, [("le", _format_value(bound))], cumulative))
+                out.append((f"{self.name}_sum", key, None, state["sum"]))
+                out.append((f"{self.name}_count", key, None, state["count"]))
+        return out
+
+
+def render():
+    """Prometheus text exposition (version 0.0.4) of every registered metric."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# --------------------------------------------------------------------------------
+# Process Memory
+# --------------------------------------------------------------------------------
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    # ru_maxrss is reported in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def smaps_rollup(pid="self"):
+    """Memory breakdown from /proc/<pid>/smaps_rollup in bytes (Linux only).
+
+    Rss counts shared pages in full for every process mapping them; Pss splits
+    them between the sharers and Uss (private pages) is what a process would
+    free on exit, i.e. the real cost of one more worker.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    fields["Uss"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return fields
+
+
+def _smaps_field(name):
+    def read():
+        rollup = smaps_rollup()
+        if rollup is None:
+            raise OSError("smaps_rollup unavailable")
+        return rollup.get(name, 0)
+    return read
+
+
+# --------------------------------------------------------------------------------
+# Studio Metrics
+# --------------------------------------------------------------------------------
+REQUEST_SECONDS = Histogram(
+    "studio_http_request_duration_seconds",
+    "HTTP request latency by endpoint.",
+    ["method", "endpoint", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "studio_http_requests_in_progress",
+    "HTTP requests currently being served.",
+)
+STAGE_SECONDS = Histogram(
+    "studio_stage_duration_seconds",
+    "Time spent in each pipeline stage.",
+    ["stage"],
+)
+MODEL_LOADS = Counter(
+    "studio_model_loads_total",
+    "Number of times a model was loaded from disk.",
+    ["model"],
+)
+Gauge("studio_process_resident_memory_bytes", "Current resident set size.", function=current_rss_bytes)
+Gauge("studio_process_peak_resident_memory_bytes", "Peak resident set size.", function=peak_rss_bytes)
+Gauge("studio_process_proportional_memory_bytes", "Proportional set size (shared pages split between workers).", function=_smaps_field("Pss"))
+Gauge("studio_process_unique_memory_bytes", "Memory private to this process.", function=_smaps_field("Uss"))
+
+
+# --------------------------------------------------------------------------------
+# Stage Timing
+# --------------------------------------------------------------------------------
+# When a caller (benchmark, profiler, ...) wants the per-stage breakdown of a
+# single operation it opens record_stages(); every stage() inside that context
+# (including work handed to threads via contextvars) is appended to its list.
+_stage_log = ContextVar("studio_stage_log", default=None)
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        log = _stage_log.get()
+        if log is not None:
+            log.append((name, elapsed))
+
+
+@contextmanager
+def record_stages():
+    log = []
+    token = _stage_log.set(log)
+    try:
+        yield log
+    finally:
+        _stage_log.reset(token)
+
+
+def summarize_stages(log):
+    """Collapse a stage log into {stage: total_seconds}."""
+    totals = {}
+    for name, elapsed in log:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return totals
@@ -0,0 +1,163 @@
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import decoding
+import encoding
+import progress
+import routing
+from metrics import stage, Counter
+
+# --------------------------------------------------------------------------------
+# Multi-step Pipelines
+# --------------------------------------------------------------------------------
+# Clean a logo, cut out the subject, upscale: as separate requests every step
+# uploads, decodes, re-encodes (often lossy JPEG) and downloads again. A
+# pipeline runs the whole chain in one worker job on the decoded array and
+# encodes only the final result.
+#
+# steps is a JSON list, applied in order:
+#   [{"op": "remove_logo", "mask_spec": {...}},        # no mask_spec: auto-detect
+#    {"op": "remove_bg", "model": "u2netp"},           # or "auto" (routing.py)
+#    {"op": "enhance", "mode": "fast", "target_width": 3840}]   # mode may be "auto"
+
+MAX_STEPS = int(os.environ.get("STUDIO_PIPELINE_MAX_STEPS", "8"))
+
+PIPELINE_STEPS = Counter("studio_pipeline_steps_total", "Pipeline steps executed.", ["op"])
+
+
+def _remove_logo(img, params, budget_s=None):
+    from logo_remover.remover import clean_image
+    from logo_remover.masks import decode_mask
+
+    mask = "AUTO"
+    if params.get("mask_spec") is not None:
+        with stage("mask.rasterize"):
+            mask = decode_mask(params["mask_spec"], img.shape)
+    return clean_image(img, mask), {}
+
+
+def _remove_bg(img, params, budget_s=None):
+    from bg_remover.remover import cutout_image
+
+    model = params.get("model", "auto")
+    route = None
+    if model == "auto":
+        route = routing.choose("rembg", img.shape[0] * img.shape[1] / 1e6, budget_s, wait_s=0)
+        model = route["model"]
+    return cutout_image(img, model), {"model": model, "routing": route}
+
+
+def _enhance(img, params, budget_s=None):
+    from enhancer.enhance import upscale_image, plan_upscale
+
+    mode = params.get("mode", "fast")
+    target_width = params.get("target_width", 3840)
+    h, w = img.shape[:2]
+    plan = plan_upscale(w, h, target_width)
+    route = routing.choose("sr", plan["cost_mp"], budget_s, ceiling=None if mode == "auto" else f"sr:{mode}", wait_s=0)
+
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        # The SR nets are 3-channel: upscale the colour, resize the matte alongside
+        out = upscale_image(cv2.cvtColor(img, cv2.COLOR_BGRA2BGR), route["model"], target_width,
+                            consume=lambda bgr: cv2.cvtColor(bgr, cv2.COLOR_BGR2BGRA))
+        out[:, :, 3] = cv2.resize(img[:, :, 3], (out.shape[1], out.shape[0]), interpolation=cv2.INTER_LINEAR)
+    else:
+        out = upscale_image(img, route["model"], target_width)
+    return out, {"model": route["model"], "plan": plan, "routing": route}
+
+
+STEPS = {
+    "remove_logo": _remove_logo,
+    "remove_bg": _remove_bg,
+    "enhance": _enhance,
+}
+
+
+def parse_steps(text):
+    """Validate the steps JSON up front, so a bad last step fails before any work."""
+    from logo_remover.masks import parse_mask_spec
+
+    try:
+        steps = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Invalid steps JSON: {e}")
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("steps must be a non-empty JSON list")
+    if len(steps) > MAX_STEPS:
+        raise ValueError(f"At most {MAX_STEPS} steps are supported")
+
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict) or step.get("op") not in STEPS:
+            raise ValueError(f"Step {i + 1}: 'op' must be one of {', '.join(STEPS)}")
+        op = step["op"]
+        if op == "remove_logo" and step.get("mask_spec") is not None:
+            spec = step["mask_spec"]
+            # Same format as the mask_spec form field (a JSON string is accepted too)
+            step["mask_spec"] = parse_mask_spec(spec if isinstance(spec, str) else json.dumps(spec))
+        elif op == "remove_bg":
+            model = step.get("model", "auto")
+            if model != "auto" and f"rembg:{model}" not in routing.FAMILIES["rembg"]:
+                raise ValueError(f"Step {i + 1}: unknown background model '{model}'")
+        elif op == "enhance":
+            from enhancer.enhance import MODELS
+            if step.get("mode", "fast") not in list(MODELS) + ["auto"]:
+                raise ValueError(f"Step {i + 1}: mode must be one of {', '.join(MODELS)} or auto")
+            target_width = step.get("target_width", 3840)
+            if not isinstance(target_width, int) or not 0 < target_width <= 16384:
+                raise ValueError(f"Step {i + 1}: target_width must be an integer between 1 and 16384")
+    return steps
+
+
+def run_pipeline(data, steps, output_format="auto", budget_s=None, accept=None):
+    """
+    Decode data once, apply steps and encode the result. Blocking: run it on
+    the worker pool (jobs.run_job). Returns (encoded bytes, extension, info).
+    output_format "auto" negotiates from accept (the request's Accept header)
+    and falls back to png when the result has transparency, else jpg.
+    """
+    if output_format != "auto":
+        output_format = encoding.normalize(output_format)
+    if output_format == "jpg" and any(step["op"] == "remove_bg" for step in steps):
+        raise ValueError("jpg cannot hold the transparency from remove_bg; use png, webp or avif")
+
+    img = decoding.decode(data, cv2.IMREAD_UNCHANGED)
+    if img.dtype != np.uint8:
+        # 16-bit PNG/TIFF: the pipelines work on 8-bit
+        img = (img / 257).astype(np.uint8)
+    if img.ndim == 3 and img.shape[2] == 4 and img[:, :, 3].min() == 255:
+        # An opaque alpha channel carries nothing
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+
+    # Steps share 5-95% of the progress bar; the encode gets the rest
+    results = []
+    share = 90.0 / len(steps)
+    budget = routing.DEFAULT_BUDGET if budget_s is None else float(budget_s)
+    pipeline_started = time.perf_counter()
+    for i, step in enumerate(steps):
+        progress.check_cancelled()
+        label = f"Step {i + 1}/{len(steps)} ({step['op']})"
+        started = time.perf_counter()
+        # "auto" models are routed against what is left of the budget
+        remaining = max(0.0, budget - (started - pipeline_started))
+        with progress.span(5 + i * share, 5 + (i + 1) * share, label), stage(f"pipeline.{step['op']}"):
+            img, info = STEPS[step["op"]](img, step, remaining)
+        PIPELINE_STEPS.inc(op=step["op"])
+        results.append({"op": step["op"], "seconds": round(time.perf_counter() - started, 3), **info})
+
+    has_alpha = img.ndim == 3 and img.shape[2] == 4
+    output_format = encoding.negotiate(output_format, accept, "png" if has_alpha else "jpg", has_alpha)
+
+    progress.report("encode", "Encoding result...", percent=95)
+    output = encoding.encode(img, output_format)
+    return output, encoding.FORMATS[output_format]["ext"], {
+        "steps": results,
+        "width": img.shape[1],
+        "height": img.shape[0],
+        "format": output_format,
+    }
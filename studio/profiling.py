@@ -0,0 +1,321 @@
+import cProfile
+import hmac
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from metrics import Counter, summarize_stages
+
+# --------------------------------------------------------------------------------
+# Request Profiling
+# --------------------------------------------------------------------------------
+# When one upload is pathologically slow (a noisy texture that makes
+# MultiScaleSegmenter produce thousands of MSER regions, a huge PNG, ...) the
+# stage histograms only say that it was slow, not why. A captured request
+# records:
+#   - its stage() timings (metrics.record_stages)
+#   - the worker threads running its jobs (run_job -> run()), sampled
+#     SAMPLE_HZ times a second into folded stacks, or under cProfile when the
+#     profile was requested
+# Capturing is opt-in:
+#   - a request carrying the admin token in the X-Studio-Profile header is
+#     always captured and kept
+#   - with STUDIO_PROFILE_SLOW_S set, a STUDIO_PROFILE_SAMPLE_RATE fraction of
+#     the POST requests is captured, and kept if it took longer than that
+# Kept captures go into a ring buffer of the last PROFILE_KEEP, tagged with the
+# request, the decoded input sizes and the job parameters, and are listed and
+# downloaded through /api/admin/profiles (X-Studio-Admin-Token header).
+# Tokens are only accepted in headers so they stay out of access logs.
+# Only the job-pool work is profiled; the event loop side of a request
+# (reading the upload, the single-flight wait) shows up in the stages only.
+
+ADMIN_TOKEN = os.environ.get("STUDIO_ADMIN_TOKEN", "")
+SLOW_SECONDS = float(os.environ.get("STUDIO_PROFILE_SLOW_S", "0"))   # 0: no automatic capture
+SAMPLE_RATE = float(os.environ.get("STUDIO_PROFILE_SAMPLE_RATE", "0.1"))
+SAMPLE_HZ = float(os.environ.get("STUDIO_PROFILE_SAMPLE_HZ", "100"))
+PROFILE_KEEP = int(os.environ.get("STUDIO_PROFILE_KEEP", "20"))
+MAX_STACK_DEPTH = 64
+MAX_TAGGED = 8  # inputs / jobs recorded per capture
+
+PROFILES_CAPTURED = Counter(
+    "studio_profiles_captured_total",
+    "Request profiles kept in the ring buffer (requested = admin flag, slow = over the latency threshold).",
+    ["trigger"],
+)
+
+_current = ContextVar("studio_profile_capture", default=None)
+_profiles = OrderedDict()   # id -> entry, oldest first
+_lock = threading.Lock()
+_running = set()            # captures with a job on a worker thread right now
+_wake = threading.Event()
+_sampler = None
+# cProfile must not run twice at once on interpreters where it is
+# process-wide (3.12+); a second requested profile falls back to sampling
+_cprofile_lock = threading.Lock()
+
+
+def _token_ok(value):
+    return bool(ADMIN_TOKEN) and bool(value) and hmac.compare_digest(value.encode(), ADMIN_TOKEN.encode())
+
+
+def is_admin(request):
+    return _token_ok(request.headers.get("x-studio-admin-token"))
+
+
+def _requested(request):
+    return _token_ok(request.headers.get("x-studio-profile"))
+
+
+class Capture:
+    def __init__(self, request, requested):
+        self.id = uuid.uuid4().hex[:12]
+        self.requested = requested
+        self.started = time.perf_counter()
+        self.created_at = time.time()
+        self.request = {
+            "method": request.method,
+            "path": request.url.path,
+            # A token sent in the query by mistake must not end up in the profile
+            "query": {k: v for k, v in request.query_params.items() if k not in ("profile", "token")},
+        }
+        self.inputs = []
+        self.jobs = []
+        self.threads = set()
+        self.samples = {}
+        self.profiler = None
+        if requested and _cprofile_lock.acquire(blocking=False):
+            self.profiler = cProfile.Profile()
+
+
+def begin(request):
+    """A capture for this request, or None if it is not a candidate."""
+    requested = _requested(request)
+    if request.method != "POST" and not requested:
+        return None
+    if not requested and (SLOW_SECONDS <= 0 or random.random() >= SAMPLE_RATE):
+        return None
+    return Capture(request, requested)
+
+
+def activate(capture):
+    return _current.set(capture)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def _describe(value):
+    # Job arguments as they go into the profile: no image bytes / arrays
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if hasattr(value, "shape") and hasattr(value, "dtype"):
+        return f"<array {'x'.join(map(str, value.shape))} {value.dtype}>"
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    return text if len(text) <= 500 else text[:500] + "..."
+
+
+def tag_input(width, height, fmt=None, **extra):
+    """Record a decoded input's size on the current request's capture (decoding.py)."""
+    capture = _current.get()
+    if capture is not None and len(capture.inputs) < MAX_TAGGED:
+        capture.inputs.append({"width": width, "height": height, "format": fmt, **extra})
+
+
+def run(fn, *args, **kwargs):
+    """
+    fn(*args, **kwargs) on a worker thread (jobs.run_job), profiled when the
+    request has a capture.
+    """
+    capture = _current.get()
+    if capture is None:
+        return fn(*args, **kwargs)
+    if len(capture.jobs) < MAX_TAGGED:
+        capture.jobs.append({
+            "fn": f"{getattr(fn, '__module__', '')}.{getattr(fn, '__qualname__', fn)}",
+            "args": [_describe(a) for a in args],
+            "kwargs": {k: _describe(v) for k, v in kwargs.items()},
+        })
+    ident = threading.get_ident()
+    with _lock:
+        capture.threads.add(ident)
+        _running.add(capture)
+    if capture.profiler is None:
+        _ensure_sampler()
+    else:
+        capture.profiler.enable()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        if capture.profiler is not None:
+            capture.profiler.disable()
+        with _lock:
+            capture.threads.discard(ident)
+            if not capture.threads:
+                _running.discard(capture)
+
+
+# --------------------------------------------------------------------------------
+# Stack Sampler
+# --------------------------------------------------------------------------------
+# One daemon thread; it sleeps while no captured job is running. Native code
+# (OpenCV, ONNX Runtime) releases the GIL, so its time is attributed to the
+# Python line that called into it, which is the line worth looking at.
+
+def _frame_label(frame):
+    code = frame.f_code
+    path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{frame.f_lineno})"
+
+
+def _folded_stack(frame):
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        if frame.f_code is run.__code__:
+            # Everything above is thread pool plumbing
+            break
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _sample_loop():
+    interval = 1.0 / SAMPLE_HZ
+    while True:
+        if not _running:
+            _wake.wait()
+            _wake.clear()
+            continue
+        frames = sys._current_frames()
+        with _lock:
+            for capture in _running:
+                if capture.profiler is not None:
+                    continue
+                for ident in capture.threads:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stack = _folded_stack(frame)
+                        capture.samples[stack] = capture.samples.get(stack, 0) + 1
+        del frames
+        time.sleep(interval)
+
+
+def _ensure_sampler():
+    global _sampler
+    if SAMPLE_HZ <= 0:
+        return
+    if _sampler is None:
+        with _lock:
+            if _sampler is None:
+                _sampler = threading.Thread(target=_sample_loop, name="studio-profile-sampler", daemon=True)
+                _sampler.start()
+    _wake.set()
+
+
+# --------------------------------------------------------------------------------
+# Ring Buffer
+# --------------------------------------------------------------------------------
+
+def finish(capture, stage_log, status):
+    """Keep the capture if it was requested or slow; returns its entry or None."""
+    seconds = time.perf_counter() - capture.started
+    if capture.profiler is not None:
+        _cprofile_lock.release()
+    slow = SLOW_SECONDS > 0 and seconds >= SLOW_SECONDS
+    if not (capture.requested or slow):
+        return None
+
+    if capture.profiler is not None:
+        mode = "cprofile"
+        # pstats.Stats(profiler) refuses a profile that recorded nothing (no
+        # job ran), so take the raw stats
+        capture.profiler.create_stats()
+        # The .prof format pstats / snakeviz read (what Stats.dump_stats writes)
+        data = marshal.dumps(capture.profiler.stats)
+    else:
+        mode = "sampled"
+        with _lock:
+            samples = dict(capture.samples)
+        data = "".join(f"{stack} {count}\n" for stack, count in sorted(samples.items(), key=lambda s: -s[1])).encode()
+
+    entry = {
+        "id": capture.id,
+        "created_at": capture.created_at,
+        "trigger": "requested" if capture.requested else "slow",
+        "mode": mode,
+        "seconds": round(seconds, 3),
+        "status": status,
+        "request": capture.request,
+        "inputs": capture.inputs,
+        "jobs": capture.jobs,
+        "stages": {name: round(total, 4) for name, total in summarize_stages(stage_log).items()},
+        "size": len(data),
+    }
+    with _lock:
+        _profiles[capture.id] = (entry, data)
+        while len(_profiles) > PROFILE_KEEP:
+            _profiles.popitem(last=False)
+    PROFILES_CAPTURED.inc(trigger=entry["trigger"])
+    print(f"[INFO] Kept {mode} profile {capture.id} of {capture.request['method']} {capture.request['path']} ({seconds:.1f}s, {entry['trigger']})")
+    return entry
+
+
+def list_profiles():
+    """Entries, newest first."""
+    with _lock:
+        return [entry for entry, _ in reversed(_profiles.values())]
+
+
+def get_profile(profile_id):
+    """(entry, raw data) or None."""
+    with _lock:
+        return _profiles.get(profile_id)
+
+
+def report(entry, data, limit=40):
+    """Human-readable summary of a stored profile."""
+    out = io.StringIO()
+    if entry["mode"] == "cprofile":
+        stats = marshal.loads(data)
+        if not stats:
+            return "No job ran under the profiler\n"
+        stats = pstats.Stats(_StatsSource(stats), stream=out)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    samples = {}
+    for line in data.decode().splitlines():
+        stack, _, count = line.rpartition(" ")
+        samples[stack] = int(count)
+    total = sum(samples.values()) or 1
+    own = {}
+    for stack, count in samples.items():
+        leaf = stack.rsplit(";", 1)[-1]
+        own[leaf] = own.get(leaf, 0) + count
+    out.write(f"{total} samples at {SAMPLE_HZ:g} Hz\n\nHottest lines (self):\n")
+    for leaf, count in sorted(own.items(), key=lambda s: -s[1])[:limit]:
+        out.write(f"  {100.0 * count / total:5.1f}%  {leaf}\n")
+    out.write("\nHottest stacks:\n")
+    for stack, count in sorted(samples.items(), key=lambda s: -s[1])[:limit // 4]:
+        out.write(f"  {100.0 * count / total:5.1f}%  {stack.replace(';', ' > ')}\n")
+    return out.getvalue()
+
+
+class _StatsSource:
+    # pstats.Stats loads from anything with create_stats() / .stats
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
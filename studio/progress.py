@@ -0,0 +1,475 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# --------------------------------------------------------------------------------
+# Operation Progress & Cancellation
+# --------------------------------------------------------------------------------
+# A long-running request can carry a client-chosen op_id. While it runs, the
+# pipelines call report() with the stage they are in; subscribers receive the
+# events over /api/progress/{op_id} (SSE). /api/cancel/{op_id} sets a flag that
+# the next report() / check_cancelled() turns into OperationCancelled, which
+# unwinds the pipeline and frees its worker slot.
+#
+# Operations live in the worker process that handles them. With several
+# workers (gunicorn.conf.py) the progress stream, the status and the cancel
+# request usually land on a different worker than the upload, so there the
+# state also goes to a SQLite file shared by all workers (STUDIO_PROGRESS_DB,
+# see SharedStore): the running worker writes its events and polls the cancel
+# flag, the others read from it. Without it everything stays in memory and
+# subscribers are pushed events directly.
+
+MAX_OPERATIONS = 500
+FINISHED_TTL = 600  # seconds a finished operation stays queryable
+STORE_PATH = os.environ.get("STUDIO_PROGRESS_DB", "")
+# How often a running operation looks for a cancel from another worker, and
+# how often a progress stream looks for new events in the shared store
+CANCEL_POLL_INTERVAL = 0.25
+STREAM_POLL_INTERVAL = 0.2
+
+TERMINAL = ("done", "failed", "cancelled")
+# Repeated events of one stage (download chunks, frames, ...) are coalesced to
+# at most one per interval so a fast loop doesn't flood the subscribers.
+MIN_EVENT_INTERVAL = 0.1
+
+
+class OperationCancelled(BaseException):
+    # BaseException (like asyncio.CancelledError) so the pipelines' broad
+    # "except Exception" handlers don't swallow a cancellation.
+    pass
+
+
+class Operation:
+    def __init__(self, op_id, kind=None):
+        self.id = op_id
+        self.kind = kind
+        self.status = "pending"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []
+        self._cancelled = threading.Event()
+        self._subscribers = []
+        self._followers = []
+        self._lock = threading.Lock()
+        self._cancel_checked_at = 0.0
+        if _store is not None:
+            _store.create(self)
+
+    @property
+    def cancelled(self):
+        if _store is not None and not self._cancelled.is_set():
+            # report() calls this in tight loops; don't hit the file every time
+            now = time.monotonic()
+            if now - self._cancel_checked_at >= CANCEL_POLL_INTERVAL:
+                self._cancel_checked_at = now
+                if _store.cancel_requested(self.id):
+                    self._cancelled.set()
+        return self._cancelled.is_set()
+
+    def start(self, kind=None):
+        self.kind = kind or self.kind
+        self.status = "running"
+        self.started_at = time.time()
+        self._publish({"stage": "started", "message": "Starting..."})
+
+    def emit(self, stage, message=None, percent=None, done=None, total=None):
+        now = time.time()
+        last = self.events[-1] if self.events else None
+        if (last is not None and last["stage"] == stage and now - last["time"] < MIN_EVENT_INTERVAL
+                and not (total and done == total)):
+            return
+        if percent is None and done is not None and total:
+            percent = 100.0 * done / total
+        elapsed = now - (self.started_at or self.created_at)
+        eta = None
+        if percent and 0 < percent < 100:
+            eta = elapsed * (100.0 - percent) / percent
+        self._publish({
+            "stage": stage,
+            "message": message,
+            "percent": round(percent, 1) if percent is not None else None,
+            "done": done,
+            "total": total,
+            "elapsed_s": round(elapsed, 2),
+            "eta_s": round(eta, 1) if eta is not None else None,
+        })
+
+    def cancel(self):
+        self._cancelled.set()
+        if _store is not None:
+            _store.request_cancel(self.id)
+            self.sync()
+        # A queued or pending operation has nobody to notice the flag yet
+        if self.status == "pending":
+            self.finish("cancelled")
+
+    def finish(self, status, error=None):
+        if self.status in TERMINAL:
+            return
+        self.status = status
+        self.finished_at = time.time()
+        event = {"stage": status, "message": error}
+        if status == "done":
+            event["percent"] = 100.0
+        self._publish(event)
+
+    def _publish(self, event):
+        event = {"op_id": self.id, "status": self.status, "time": time.time(), **event}
+        with self._lock:
+            self.events.append(event)
+            subscribers = list(self._subscribers)
+            followers = list(self._followers)
+        if _store is not None:
+            _store.publish(self, event)
+        for loop, queue in subscribers:
+            # Events are produced on worker threads; hand them to each subscriber's loop
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+        for follower in followers:
+            follower._mirror(event)
+
+    def _mirror(self, event):
+        # A leader's progress, re-published as this (coalesced) operation's own;
+        # its start and end are this operation's business (track())
+        if event["stage"] == "started" or event["status"] in TERMINAL or self.status in TERMINAL:
+            return
+        skip = ("op_id", "status", "time")
+        self._publish({**{k: v for k, v in event.items() if k not in skip}, "coalesced": True})
+
+    def subscribe(self):
+        """Returns (history, queue) for an async consumer on the running loop."""
+        queue = asyncio.Queue()
+        with self._lock:
+            history = list(self.events)
+            self._subscribers.append((asyncio.get_running_loop(), queue))
+        return history, queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = [(l, q) for l, q in self._subscribers if q is not queue]
+
+    def sync(self):
+        """Pick up what other workers did to this operation (shared store only)."""
+        row = _store.load(self.id)
+        if row is None:
+            return
+        kind, status, started_at, finished_at, cancelled = row
+        self.kind = kind or self.kind
+        self.status = status
+        self.started_at = started_at
+        self.finished_at = finished_at
+        if cancelled:
+            self._cancelled.set()
+
+    def snapshot(self):
+        if _store is not None:
+            last_event = _store.last_event(self.id)
+        else:
+            last_event = self.events[-1] if self.events else None
+        return {
+            "op_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "last_event": last_event,
+        }
+
+
+# --------------------------------------------------------------------------------
+# Shared Store (multi-worker)
+# --------------------------------------------------------------------------------
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    op_id TEXT PRIMARY KEY,
+    kind TEXT,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    cancelled INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_op ON events (op_id, seq);
+"""
+STORE_PRUNE_INTERVAL = 60
+
+
+class SharedStore:
+    """Operation status, events and cancel flags in a SQLite file on this host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def _connect(self):
+        # gunicorn forks the workers from a master that imported this module:
+        # a connection must never cross fork(), so each process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(STORE_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _write(self, *statements):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+
+    def _read(self, sql, params):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def create(self, op):
+        self._write((
+            "INSERT OR IGNORE INTO operations (op_id, kind, status, created_at) VALUES (?, ?, ?, ?)",
+            (op.id, op.kind, op.status, op.created_at),
+        ))
+
+    def publish(self, op, event):
+        self._write(
+            ("INSERT INTO operations (op_id, kind, status, created_at, started_at, finished_at) "
+             "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (op_id) DO UPDATE SET "
+             "kind = excluded.kind, status = excluded.status, "
+             "started_at = excluded.started_at, finished_at = excluded.finished_at",
+             (op.id, op.kind, op.status, op.created_at, op.started_at, op.finished_at)),
+            ("INSERT INTO events (op_id, status, event) VALUES (?, ?, ?)",
+             (op.id, event["status"], json.dumps(event))),
+        )
+
+    def request_cancel(self, op_id):
+        self._write(("UPDATE operations SET cancelled = 1 WHERE op_id = ?", (op_id,)))
+
+    def cancel_requested(self, op_id):
+        rows = self._read("SELECT cancelled FROM operations WHERE op_id = ?", (op_id,))
+        return bool(rows and rows[0][0])
+
+    def load(self, op_id):
+        rows = self._read(
+            "SELECT kind, status, started_at, finished_at, cancelled FROM operations WHERE op_id = ?", (op_id,)
+        )
+        return rows[0] if rows else None
+
+    def events_after(self, op_id, seq):
+        """[(seq, status, event json)] published after seq."""
+        return self._read(
+            "SELECT seq, status, event FROM events WHERE op_id = ? AND seq > ? ORDER BY seq", (op_id, seq)
+        )
+
+    def last_event(self, op_id):
+        rows = self._read("SELECT event FROM events WHERE op_id = ? ORDER BY seq DESC LIMIT 1", (op_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def prune(self):
+        now = time.time()
+        if now - self._pruned_at < STORE_PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        self._write(
+            ("DELETE FROM operations WHERE finished_at < ? OR op_id NOT IN "
+             "(SELECT op_id FROM operations ORDER BY created_at DESC LIMIT ?)",
+             (now - FINISHED_TTL, MAX_OPERATIONS)),
+            ("DELETE FROM events WHERE op_id NOT IN (SELECT op_id FROM operations)", ()),
+        )
+
+
+_store = SharedStore(STORE_PATH) if STORE_PATH else None
+
+
+_operations = OrderedDict()
+_operations_lock = threading.Lock()
+_current = ContextVar("studio_operation", default=None)
+_span = ContextVar("studio_progress_span", default=None)
+
+
+def _prune():
+    now = time.time()
+    for op_id in list(_operations):
+        op = _operations[op_id]
+        expired = op.finished_at and now - op.finished_at > FINISHED_TTL
+        if expired or len(_operations) > MAX_OPERATIONS:
+            del _operations[op_id]
+    if _store is not None:
+        _store.prune()
+
+
+def get_operation(op_id, create=False):
+    with _operations_lock:
+        op = _operations.get(op_id)
+        # Another worker may have created it
+        known = op is None and _store is not None and _store.load(op_id) is not None
+        if op is None and (create or known):
+            # Subscribers may connect before the request that runs the operation arrives
+            _prune()
+            op = _operations[op_id] = Operation(op_id)
+    if op is not None and _store is not None:
+        op.sync()
+    return op
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def track(op_id, kind):
+    """Bind an operation to the current context for the duration of a request."""
+    if not op_id:
+        yield None
+        return
+    op = get_operation(op_id, create=True)
+    if op.cancelled:
+        op.finish("cancelled")
+        raise OperationCancelled(f"Operation {op_id} was cancelled")
+    op.start(kind)
+    token = _current.set(op)
+    try:
+        yield op
+    except OperationCancelled:
+        op.finish("cancelled")
+        raise
+    except Exception as e:
+        op.finish("failed", str(e))
+        raise
+    else:
+        op.finish("done")
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def follow(leader):
+    """
+    While the current operation waits for work running under another one
+    (a coalesced request, singleflight.py), show the leader's progress on it.
+    """
+    op = _current.get()
+    if op is None or leader is None or op is leader:
+        yield
+        return
+    with leader._lock:
+        leader._followers.append(op)
+        last = leader.events[-1] if leader.events else None
+    if last is not None:
+        op._mirror(last)
+    try:
+        yield
+    finally:
+        with leader._lock:
+            leader._followers = [f for f in leader._followers if f is not op]
+
+
+async def unless_cancelled(awaitable):
+    """
+    Await something the current operation does not run itself (a coalesced
+    request waiting for the leader), but give up as soon as it is cancelled.
+    """
+    op = _current.get()
+    if op is None:
+        return await awaitable
+    future = asyncio.ensure_future(awaitable)
+    while True:
+        done, _ = await asyncio.wait({future}, timeout=CANCEL_POLL_INTERVAL)
+        if done:
+            return future.result()
+        if op.cancelled:
+            future.cancel()
+            raise OperationCancelled(f"Operation {op.id} was cancelled")
+
+
+def check_cancelled():
+    op = _current.get()
+    if op is not None and op.cancelled:
+        raise OperationCancelled(f"Operation {op.id} was cancelled")
+
+
+@contextmanager
+def span(low, high, label=None):
+    """
+    Map the percentages reported inside onto low..high of the operation, and
+    prefix messages with label. Lets a multi-step request (pipeline.py) reuse
+    pipelines that each report 0-100%.
+    """
+    token = _span.set((low, high, label))
+    try:
+        yield
+    finally:
+        _span.reset(token)
+
+
+def report(stage, message=None, percent=None, done=None, total=None):
+    """Emit a progress event for the current operation (no-op outside one)."""
+    op = _current.get()
+    if op is None:
+        return
+    check_cancelled()
+    bounds = _span.get()
+    if bounds is not None:
+        low, high, label = bounds
+        if percent is not None:
+            percent = low + (high - low) * percent / 100.0
+        if label and message:
+            message = f"{label}: {message}"
+    op.emit(stage, message, percent=percent, done=done, total=total)
+
+
+async def event_stream(op, keepalive=15.0):
+    """Server-Sent Events for one operation: history first, then live events."""
+    if _store is not None:
+        async for chunk in _shared_event_stream(op, keepalive):
+            yield chunk
+        return
+    history, queue = op.subscribe()
+    try:
+        for event in history:
+            yield f"data: {json.dumps(event)}\n\n"
+            if event["status"] in TERMINAL:
+                return
+        if op.status in TERMINAL:
+            return
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {json.dumps(event)}\n\n"
+            if event["status"] in TERMINAL:
+                return
+    finally:
+        op.unsubscribe(queue)
+
+
+async def _shared_event_stream(op, keepalive):
+    # The operation may run on any worker: follow its events in the store
+    seq, idle = 0, 0.0
+    while True:
+        rows = await asyncio.to_thread(_store.events_after, op.id, seq)
+        for seq, status, event in rows:
+            yield f"data: {event}\n\n"
+            if status in TERMINAL:
+                return
+        if rows:
+            idle = 0.0
+        elif idle >= keepalive:
+            yield ": keepalive\n\n"
+            idle = 0.0
+        await asyncio.sleep(STREAM_POLL_INTERVAL)
+        idle += STREAM_POLL_INTERVAL
@@ -0,0 +1,125 @@
+import json
+import os
+
+import jobs
+from metrics import Counter
+
+# --------------------------------------------------------------------------------
+# Latency-budget Model Routing
+# --------------------------------------------------------------------------------
+# Each pipeline family has several model variants trading quality for speed.
+# Given the size of the input, a latency budget and how busy the worker pool
+# is, choose() returns the best variant whose predicted latency
+# (queue wait + overhead + per-megapixel cost) fits the budget, degrading to
+# cheaper variants under load instead of letting requests time out.
+#
+# Costs come from model_costs.json, written by `python bench.py calibrate` on
+# the deployment host; the built-in table below is only a rough fallback.
+
+COSTS_PATH = os.environ.get(
+    "STUDIO_MODEL_COSTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_costs.json")
+)
+DEFAULT_BUDGET = float(os.environ.get("STUDIO_LATENCY_BUDGET", "60"))
+
+# Best quality first. Keys match the warm-up names (warmup.py).
+FAMILIES = {
+    # rembg: megapixels of the uploaded image
+    "rembg": ["rembg:isnet-general-use", "rembg:u2net", "rembg:silueta", "rembg:u2netp"],
+    # sr: planned AI work in x4-equivalent input megapixels (enhance.plan_upscale)
+    "sr": ["sr:quality", "sr:fast", "sr:lite"],
+}
+
+# Variants that may be chosen. By default only the warmed-up model
+# (warmup.PRELOAD_MODELS), so routing never triggers a cold load or grows a
+# worker past what warm-up measured. The other rembg models need more memory
+# and are opt-in (add them to STUDIO_PRELOAD_MODELS as well):
+# e.g. STUDIO_ROUTE_REMBG=u2net,silueta,u2netp
+ENABLED = {
+    "rembg": ["rembg:" + m.strip() for m in os.environ.get("STUDIO_ROUTE_REMBG", "u2netp").split(",") if m.strip()],
+    "sr": ["sr:" + m.strip() for m in os.environ.get("STUDIO_ROUTE_SR", "quality,fast,lite").split(",") if m.strip()],
+}
+
+# Rough CPU figures (seconds); replaced by calibration
+DEFAULT_COSTS = {
+    "rembg:isnet-general-use": {"overhead_s": 2.0, "per_mp_s": 0.10},
+    "rembg:u2net": {"overhead_s": 0.8, "per_mp_s": 0.10},
+    "rembg:silueta": {"overhead_s": 0.7, "per_mp_s": 0.10},
+    "rembg:u2netp": {"overhead_s": 0.2, "per_mp_s": 0.10},
+    "sr:quality": {"overhead_s": 0.5, "per_mp_s": 40.0},
+    "sr:fast": {"overhead_s": 0.3, "per_mp_s": 1.2},
+    "sr:lite": {"overhead_s": 0.3, "per_mp_s": 0.6},
+}
+
+ROUTE_DECISIONS = Counter(
+    "studio_route_decisions_total",
+    "Model routing decisions (degraded=1 when the requested model did not fit the budget).",
+    ["family", "model", "degraded"],
+)
+
+
+def load_costs(path=COSTS_PATH):
+    costs = {k: dict(v) for k, v in DEFAULT_COSTS.items()}
+    try:
+        with open(path) as f:
+            calibrated = json.load(f).get("models", {})
+    except FileNotFoundError:
+        return costs, False
+    except (OSError, ValueError) as e:
+        print(f"[WARN] Ignoring model cost table {path}: {e}")
+        return costs, False
+    for name, cost in calibrated.items():
+        costs[name] = {"overhead_s": float(cost["overhead_s"]), "per_mp_s": float(cost["per_mp_s"])}
+    return costs, True
+
+
+COSTS, CALIBRATED = load_costs()
+
+
+def estimate(model, megapixels):
+    cost = COSTS[model]
+    return cost["overhead_s"] + cost["per_mp_s"] * megapixels
+
+
+def choose(family, megapixels, budget_s=None, ceiling=None, record=True, wait_s=None):
+    """
+    Pick a model of `family` for an input of `megapixels`.
+
+    ceiling: the best variant the caller asked for (e.g. the user's "fast"
+    mode); never chosen above it. record=False for dry runs that should not
+    count as decisions. wait_s overrides the predicted queue wait (callers
+    already running on a worker pass 0). Returns a dict describing the decision.
+    """
+    budget = DEFAULT_BUDGET if budget_s is None else float(budget_s)
+    candidates = [m for m in FAMILIES[family] if m in ENABLED[family]] or FAMILIES[family][-1:]
+    if ceiling is not None:
+        if ceiling not in FAMILIES[family]:
+            raise ValueError(f"Unknown {family} model '{ceiling}'")
+        rank = FAMILIES[family].index(ceiling)
+        allowed = [m for m in candidates if FAMILIES[family].index(m) >= rank]
+        # An explicitly requested variant is allowed even if it is not enabled for "auto"
+        candidates = allowed if ceiling in allowed else [ceiling] + allowed
+
+    wait = jobs.estimated_wait() if wait_s is None else wait_s
+    chosen = None
+    for model in candidates:
+        if wait + estimate(model, megapixels) <= budget:
+            chosen = model
+            break
+    # Nothing fits: the cheapest variant is still the best we can do
+    fits = chosen is not None
+    if chosen is None:
+        chosen = candidates[-1]
+
+    degraded = chosen != candidates[0]
+    if record:
+        ROUTE_DECISIONS.inc(family=family, model=chosen, degraded="1" if degraded else "0")
+    return {
+        "model": chosen.split(":", 1)[1],
+        "requested": candidates[0].split(":", 1)[1],
+        "degraded": degraded,
+        "fits_budget": fits,
+        "estimated_s": round(wait + estimate(chosen, megapixels), 2),
+        "queue_wait_s": round(wait, 2),
+        "budget_s": budget,
+        "calibrated": CALIBRATED,
+    }
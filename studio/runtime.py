@@ -0,0 +1,27 @@
+import os
+
+# --------------------------------------------------------------------------------
+# Shared Inference Runtime Settings
+# --------------------------------------------------------------------------------
+# OpenCV and ONNX Runtime each default to one thread per core. That is right for
+# a single process, but N workers x N threads oversubscribes the machine, so in
+# multi-worker mode each worker gets a slice of the cores.
+# STUDIO_THREADS_PER_WORKER=0 keeps the library defaults.
+
+THREADS_PER_WORKER = int(os.environ.get("STUDIO_THREADS_PER_WORKER", "0"))
+
+
+def configure_threads():
+    if THREADS_PER_WORKER > 0:
+        import cv2
+        cv2.setNumThreads(THREADS_PER_WORKER)
+
+
+def ort_session_options():
+    """SessionOptions shared by every ONNX Runtime model in the studio."""
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    if THREADS_PER_WORKER > 0:
+        options.intra_op_num_threads = THREADS_PER_WORKER
+        options.inter_op_num_threads = 1
+    return options
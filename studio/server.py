@@ -1,18 +1,47 @@
+import hashlib
 import os
 import shutil
 import sys
 import asyncio
 import time
 from urllib.parse import urlparse
-from fastapi import FastAPI, File, UploadFile, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, UploadFile, Form, Request
+from fastapi.responses import FileResponse, PlainTextResponse, JSONResponse, StreamingResponse, Response
+from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
 
+# Pipelines and shared helpers live next to this file
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import delivery
+import metrics
+from metrics import stage, record_stages
+from jobs import run_job
+import profiling
+import progress
+import routing
+import runtime
+import singleflight
+from singleflight import fingerprint
+import warmup
+
 # from rembg import remove, new_session # Moved to function for lazy loading
-from PIL import Image
 import io
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    runtime.configure_threads()
+    if warmup.PRELOAD_MODE != "lazy":
+        with stage("warmup.imports"):
+            warmup.import_pipelines()
+    # Load models in the background: liveness (/) answers immediately while
+    # /ready reports 503 until models are loaded and initialized.
+    warmup_task = asyncio.create_task(asyncio.to_thread(warmup.run_warmup))
+    yield
+    if not warmup_task.done():
+        warmup_task.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS for React Frontend
 from fastapi.middleware.cors import CORSMiddleware
@@ -35,12 +64,149 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Mount static files (Frontend)
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Outputs: content-hashed URLs, strong ETags, 304s and Range (delivery.py)
+app.mount("/uploads", delivery.ArtifactFiles(directory="uploads"), name="uploads")
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    metrics.REQUESTS_IN_PROGRESS.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.REQUESTS_IN_PROGRESS.dec()
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method, endpoint=endpoint, status=str(status)
+        )
+
+@app.middleware("http")
+async def capture_profiles(request: Request, call_next):
+    # Stage timings + sampled stacks of the request's jobs, kept when it is
+    # slow or was flagged for profiling (profiling.py)
+    capture = profiling.begin(request)
+    if capture is None:
+        return await call_next(request)
+    status = 500
+    entry = None
+    with record_stages() as stage_log:
+        token = profiling.activate(capture)
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            profiling.deactivate(token)
+            entry = profiling.finish(capture, stage_log, status)
+    if entry:
+        response.headers["X-Studio-Profile-Id"] = entry["id"]
+    return response
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# --------------------------------------------------------------------------------
+# Request Profiles (admin)
+# --------------------------------------------------------------------------------
+# Needs STUDIO_ADMIN_TOKEN, sent as the X-Studio-Admin-Token header.
+# Profile one request by sending the same token as X-Studio-Profile; slow
+# requests are kept if STUDIO_PROFILE_SLOW_S is set. See profiling.py.
+def admin_denied(request):
+    if not profiling.ADMIN_TOKEN:
+        return JSONResponse({"error": "Admin endpoints are disabled (set STUDIO_ADMIN_TOKEN)"}, status_code=404)
+    if not profiling.is_admin(request):
+        return JSONResponse({"error": "Invalid admin token"}, status_code=403)
+    return None
+
+@app.get("/api/admin/profiles")
+def list_profiles(request: Request):
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    return {
+        "slow_threshold_s": profiling.SLOW_SECONDS,
+        "keep": profiling.PROFILE_KEEP,
+        "profiles": profiling.list_profiles()
+    }
+
+@app.get("/api/admin/profiles/{profile_id}")
+def get_profile(request: Request, profile_id: str):
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    found = profiling.get_profile(profile_id)
+    if found is None:
+        return JSONResponse({"error": "Unknown or expired profile"}, status_code=404)
+    entry, data = found
+    return {**entry, "report": profiling.report(entry, data)}
+
+@app.get("/api/admin/profiles/{profile_id}/download")
+def download_profile(request: Request, profile_id: str):
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    found = profiling.get_profile(profile_id)
+    if found is None:
+        return JSONResponse({"error": "Unknown or expired profile"}, status_code=404)
+    entry, data = found
+    # cProfile: pstats / snakeviz .prof; sampled: folded stacks for flamegraph.pl / speedscope
+    ext, media_type = (".prof", "application/octet-stream") if entry["mode"] == "cprofile" else (".folded", "text/plain")
+    return Response(
+        data, media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="profile_{profile_id}{ext}"'}
+    )
+
+# --------------------------------------------------------------------------------
+# Operation Progress (SSE) & Cancellation
+# --------------------------------------------------------------------------------
+# Long-running endpoints accept an optional client-generated op_id; open
+# /api/progress/{op_id} before (or while) posting the work to follow it.
+@app.get("/api/progress/{op_id}")
+async def stream_progress(op_id: str):
+    op = progress.get_operation(op_id, create=True)
+    return StreamingResponse(
+        progress.event_stream(op),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/operations/{op_id}")
+def get_operation_status(op_id: str):
+    op = progress.get_operation(op_id)
+    if op is None:
+        return JSONResponse({"error": "Unknown operation"}, status_code=404)
+    return op.snapshot()
+
+@app.post("/api/cancel/{op_id}")
+def cancel_operation(op_id: str):
+    # Creating it lets a cancel that races ahead of the upload still take effect
+    op = progress.get_operation(op_id, create=True)
+    if op.status in progress.TERMINAL:
+        return JSONResponse(
+            {"error": f"Operation already {op.status}", "op_id": op_id, "status": op.status, "cancel_requested": False},
+            status_code=409
+        )
+    op.cancel()
+    return {"op_id": op_id, "status": op.status, "cancel_requested": True}
 
 @app.get("/")
 def health_check():
     return {"status": "healthy", "version": "1.0.1-freepik-fix"}
 
+@app.get("/ready")
+def readiness_check():
+    status_code = 200 if warmup.STATE["ready"] else 503
+    return JSONResponse(
+        {"status": "ready" if warmup.STATE["ready"] else "warming_up", **warmup.STATE},
+        status_code=status_code
+    )
+
 @app.get("/api/version")
 def get_version():
     return {"version": "1.0.1-freepik-fix", "timestamp": int(time.time())}
@@ -49,68 +215,286 @@ def get_version():
 def read_root():
     return FileResponse("static/index.html")
 
+# Identical requests in flight at the same time share one computation
+# (keyed by input content + parameters, or by URL for Freepik)
+LOGO_FLIGHTS = singleflight.Group("remove-logo")
+UPSCALE_FLIGHTS = singleflight.Group("upscale")
+REMOVE_BG_FLIGHTS = singleflight.Group("remove-bg")
+FREEPIK_FLIGHTS = singleflight.Group("freepik")
+
+def save_upload(upload, path):
+    """Copy an UploadFile to path and return the SHA-256 of its content."""
+    digest = hashlib.sha256()
+    with open(path, "wb") as buffer:
+        for chunk in iter(lambda: upload.file.read(1024 * 1024), b""):
+            digest.update(chunk)
+            buffer.write(chunk)
+    return digest.hexdigest()
+
+def negotiated_ext(request, format, default, has_alpha=False):
+    """
+    Extension of the output format for a request: format ("auto" negotiates
+    from the Accept header), else default. ValueError for an unknown format.
+    """
+    import encoding
+    fmt = encoding.negotiate(format, request.headers.get("accept"), default, has_alpha)
+    return encoding.FORMATS[fmt]["ext"]
+
 @app.post("/api/remove-logo")
 async def remove_logo_endpoint(
+    request: Request,
     image: UploadFile = File(...), 
     mask: UploadFile = File(None),
-    auto_detect: bool = Form(False)
+    auto_detect: bool = Form(False),
+    mask_spec: str = Form(None),
+    format: str = Form("auto"),
+    op_id: str = Form(None)
 ):
     # Save uploaded files with unique names
     timestamp = int(time.time())
     safe_filename = f"{timestamp}_{image.filename}"
     image_path = os.path.join(UPLOAD_DIR, safe_filename)
     
-    with open(image_path, "wb") as buffer:
-        shutil.copyfileobj(image.file, buffer)
+    image_digest = save_upload(image, image_path)
+    # Size and alpha channel up front, so a mask_spec or an output format
+    # that does not fit the image is reported here rather than failing
+    # inside the job as a generic error
+    import decoding
+    try:
+        info = decoding.probe(image_path)
+    except ValueError as e:
+        return {"error": str(e)}
     
-    if auto_detect or mask is None:
+    if mask_spec and not auto_detect:
+        # Compact mask (boxes / strokes / RLE), rasterized at the image size
+        from logo_remover.masks import parse_mask_spec, decode_mask
+        try:
+            mask_path = parse_mask_spec(mask_spec)
+            # Rasterized against the size the job will decode to
+            width, height = decoding.output_size(info)
+            await asyncio.to_thread(decode_mask, mask_path, (height, width))
+        except ValueError as e:
+            return {"error": str(e)}
+        mask_key = mask_path
+    elif auto_detect or mask is None:
         mask_path = "AUTO"
+        mask_key = "AUTO"
         print(f"Auto-detection mode enabled for {safe_filename}")
     else:
         mask_path = os.path.join(UPLOAD_DIR, f"mask_{safe_filename}")
-        with open(mask_path, "wb") as buffer:
-            shutil.copyfileobj(mask.file, buffer)
+        mask_key = save_upload(mask, mask_path)
     
     # Generate output path
-    # Generate output path
-    filename_no_ext, file_extension = os.path.splitext(safe_filename)
-    # Default to .jpg if no extension, otherwise keep original (normalize to lower)
-    ext = file_extension.lower() if file_extension else ".jpg"
+    # The requested / negotiated format, otherwise the input's own (encoding.py)
+    import encoding
+    filename_no_ext = os.path.splitext(safe_filename)[0]
+    try:
+        ext = negotiated_ext(request, format, encoding.same_as(safe_filename), has_alpha=info["alpha"])
+    except ValueError as e:
+        return {"error": str(e)}
     output_filename = f"{filename_no_ext}_cleaned{ext}"
     output_path = os.path.join(UPLOAD_DIR, output_filename)
     
     # Run Logo Removal
     try:
-        print(f"Removing logo from {image_path} using mask {mask_path} -> {output_path}")
+        mask_desc = "mask_spec" if isinstance(mask_path, dict) else mask_path
+        print(f"Removing logo from {image_path} using mask {mask_desc} -> {output_path}")
         
         # Lazy load to save memory on startup
-        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
         from logo_remover.remover import remove_logo
         
-        result = remove_logo(image_path, mask_path, output_path)
-        
-        if result:
+        async def work():
+            result = await run_job(remove_logo, image_path, mask_path, output_path)
+            if not result:
+                return {"error": "Failed to remove logo"}
             return {
                 "original_url": f"/uploads/{safe_filename}",
-                "cleaned_url": f"/uploads/{output_filename}"
+                "cleaned_url": await delivery.artifact_url(output_path)
             }
-        else:
-            return {"error": "Failed to remove logo"}
+        
+        with progress.track(op_id, "remove-logo") as op:
+            response, shared = await LOGO_FLIGHTS.do(
+                fingerprint(image_digest, mask_key, ext), work, retry_on=(progress.OperationCancelled,)
+            )
+            if "error" in response and op:
+                op.finish("failed", response["error"])
+        if shared:
+            print(f"Coalesced with an identical in-flight logo removal")
+        return response
             
+    except progress.OperationCancelled:
+        print(f"Logo removal cancelled: {op_id}")
+        return {"error": "Operation cancelled", "cancelled": True}
     except Exception as e:
         print(f"Error during logo removal: {e}")
         return {"error": str(e)}
 
+# --------------------------------------------------------------------------------
+# Interactive Editing Sessions (logo remover refine loop)
+# --------------------------------------------------------------------------------
+# POST /api/sessions                 image (+ mask / auto_detect): first full run
+# POST /api/sessions/{id}/refine     mask only: re-inpaint just the new strokes
+# GET / DELETE /api/sessions/{id}
+import sessions
+
+def decode_upload(data, flags):
+    import decoding
+    return decoding.decode(data, flags)
+
+def session_mask(mask_data, spec, shape):
+    # A compact mask_spec is rasterized straight at the image size; a mask
+    # upload is decoded in memory (refine_image aligns it if it is smaller)
+    import cv2
+    if spec is not None:
+        from logo_remover.masks import decode_mask
+        with stage("mask.rasterize"):
+            return decode_mask(spec, shape)
+    return decode_upload(mask_data, cv2.IMREAD_GRAYSCALE)
+
+def session_output(session):
+    import encoding
+    stem = os.path.splitext(session.name)[0]
+    ext = encoding.FORMATS[encoding.same_as(session.name)]["ext"]
+    suffix = "_cleaned" if session.revision == 0 else f"_cleaned_r{session.revision}"
+    return f"{stem}{suffix}{ext}"
+
+@app.post("/api/sessions")
+async def create_edit_session(
+    image: UploadFile = File(...),
+    mask: UploadFile = File(None),
+    auto_detect: bool = Form(False),
+    mask_spec: str = Form(None),
+    op_id: str = Form(None)
+):
+    import cv2
+    from logo_remover.masks import parse_mask_spec
+    from logo_remover.remover import clean_image, save_result
+
+    try:
+        timestamp = int(time.time())
+        safe_filename = f"{timestamp}_{image.filename}"
+        image_data = await image.read()
+        with open(os.path.join(UPLOAD_DIR, safe_filename), "wb") as buffer:
+            buffer.write(image_data)
+        spec = parse_mask_spec(mask_spec) if (mask_spec and not auto_detect) else None
+        mask_data = None if (auto_detect or mask is None) else await mask.read()
+        use_auto = spec is None and mask_data is None
+
+        def start():
+            img = decode_upload(image_data, cv2.IMREAD_UNCHANGED)
+            mask_img = "AUTO" if use_auto else session_mask(mask_data, spec, img.shape)
+            session = sessions.create_session(img, safe_filename)
+            try:
+                with session.lock:
+                    result = clean_image(img, mask_img)
+                    output_filename = session_output(session)
+                    progress.report("encode", "Saving result...", percent=95)
+                    save_result(os.path.join(UPLOAD_DIR, output_filename), result)
+                    session.update(result)
+            except BaseException:
+                # Also on cancellation: don't leave a session with no result behind
+                sessions.delete_session(session.id)
+                raise
+            return session, output_filename
+
+        with progress.track(op_id, "session"):
+            session, output_filename = await run_job(start)
+
+        return {
+            **session.info(),
+            "original_url": f"/uploads/{safe_filename}",
+            "cleaned_url": await delivery.artifact_url(os.path.join(UPLOAD_DIR, output_filename))
+        }
+    except progress.OperationCancelled:
+        return {"error": "Operation cancelled", "cancelled": True}
+    except Exception as e:
+        print(f"Error creating editing session: {e}")
+        return {"error": str(e)}
+
+@app.post("/api/sessions/{session_id}/refine")
+async def refine_edit_session(
+    session_id: str,
+    mask: UploadFile = File(None),
+    mask_spec: str = Form(None),
+    op_id: str = Form(None)
+):
+    from logo_remover.masks import parse_mask_spec
+    from logo_remover.remover import refine_image, save_result
+
+    session = sessions.get_session(session_id)
+    if session is None:
+        return JSONResponse({"error": "Session not found or expired"}, status_code=404)
+
+    try:
+        spec = parse_mask_spec(mask_spec) if mask_spec else None
+        if spec is None and mask is None:
+            return {"error": "Send a mask image or a mask_spec"}
+        mask_data = None if spec is not None else await mask.read()
+
+        def refine():
+            mask_img = session_mask(mask_data, spec, session.image.shape)
+            with session.lock:
+                result, box = refine_image(session.result, mask_img)
+                if box is None:
+                    return None, None
+                output_filename = session_output(session)
+                progress.report("encode", "Saving result...", percent=95)
+                save_result(os.path.join(UPLOAD_DIR, output_filename), result)
+                session.update(result)
+            return output_filename, box
+
+        with progress.track(op_id, "refine"):
+            output_filename, box = await run_job(refine)
+
+        if output_filename is None:
+            return {"error": "Mask is empty"}
+        return {
+            **session.info(),
+            "original_url": f"/uploads/{session.name}",
+            "cleaned_url": await delivery.artifact_url(os.path.join(UPLOAD_DIR, output_filename)),
+            "region": dict(zip(("x0", "y0", "x1", "y1"), box))
+        }
+    except progress.OperationCancelled:
+        return {"error": "Operation cancelled", "cancelled": True}
+    except Exception as e:
+        print(f"Error refining session {session_id}: {e}")
+        return {"error": str(e)}
+
+@app.get("/api/sessions/{session_id}")
+def get_edit_session(session_id: str):
+    session = sessions.get_session(session_id)
+    if session is None:
+        return JSONResponse({"error": "Session not found or expired"}, status_code=404)
+    return session.info()
+
+@app.delete("/api/sessions/{session_id}")
+def delete_edit_session(session_id: str):
+    if not sessions.delete_session(session_id):
+        return JSONResponse({"error": "Session not found or expired"}, status_code=404)
+    return {"message": f"Closed session {session_id}"}
+
 @app.post("/api/upload")
-async def upload_image(file: UploadFile = File(...), mode: str = Form("fast")):
-    # Save uploaded file
+async def upload_image(
+    request: Request,
+    file: UploadFile = File(...),
+    mode: str = Form("fast"),
+    target_width: int = Form(3840),
+    budget_s: float = Form(None),
+    format: str = Form("auto"),
+    op_id: str = Form(None)
+):
+    # Read the upload; it is written to disk by whichever request ends up
+    # running the enhancement (an identical request in flight may share it)
     file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    file_data = await file.read()
     
-    # Generate output path
+    # Generate output path (jpg unless requested / negotiated otherwise)
     filename_no_ext = os.path.splitext(file.filename)[0]
-    output_filename = f"{filename_no_ext}_enhanced.jpg"
+    try:
+        ext = negotiated_ext(request, format, "jpg")
+    except ValueError as e:
+        return {"error": str(e)}
+    output_filename = f"{filename_no_ext}_enhanced{ext}"
     output_path = os.path.join(UPLOAD_DIR, output_filename)
     
     # Run Enhancement
@@ -118,19 +502,84 @@ async def upload_image(file: UploadFile = File(...), mode: str = Form("fast")):
         print(f"Enhancing {file_path} -> {output_path} (Mode: {mode})")
         
         # Lazy load to save memory on startup
-        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-        from enhancer.enhance import premium_ai_upscale
+        from enhancer.enhance import premium_ai_upscale, plan_upscale, MODELS
+        import decoding
         
-        premium_ai_upscale(file_path, output_path, mode=mode)
+        # The requested mode is the best model we may use ("auto": any);
+        # routing degrades to a cheaper one if it would not fit the budget
+        if mode != "auto" and mode not in MODELS:
+            mode = "fast"
+        # Header only: the size the enhancer will decode at (decoding.py),
+        # and an early ImageTooLarge before anything is written
+        width, height = decoding.output_size(decoding.probe(file_data), min_width=target_width)
+        plan = plan_upscale(width, height, target_width)
+        route = routing.choose(
+            "sr", plan["cost_mp"], budget_s,
+            ceiling=None if mode == "auto" else f"sr:{mode}"
+        )
+        if route["degraded"]:
+            print(f"[INFO] Routing: {route['requested']} -> {route['model']} (estimated {route['estimated_s']}s, budget {route['budget_s']}s)")
         
-        return {
-            "original_url": f"/uploads/{file.filename}",
-            "enhanced_url": f"/uploads/{output_filename}"
-        }
+        async def work():
+            with open(file_path, "wb") as buffer:
+                buffer.write(file_data)
+            result = await run_job(premium_ai_upscale, file_path, output_path, mode=route["model"], target_width=target_width)
+            if not result:
+                return {"error": "Failed to enhance image"}
+            return {
+                "original_url": f"/uploads/{file.filename}",
+                "enhanced_url": await delivery.artifact_url(output_path),
+                "model": route["model"]
+            }
+        
+        with progress.track(op_id, "upscale") as op:
+            response, shared = await UPSCALE_FLIGHTS.do(
+                fingerprint(hashlib.sha256(file_data).digest(), route["model"], target_width, ext), work,
+                retry_on=(progress.OperationCancelled,)
+            )
+            if "error" in response and op:
+                op.finish("failed", response["error"])
+        
+        return {**response, "plan": plan, "routing": route, "coalesced": shared}
+    except progress.OperationCancelled:
+        print(f"Enhancement cancelled: {op_id}")
+        return {"error": "Operation cancelled", "cancelled": True}
     except Exception as e:
         print(f"Error during enhancement: {e}")
         return {"error": str(e)}
 
+@app.post("/api/upload/plan")
+async def plan_upload(
+    file: UploadFile = File(None),
+    width: int = Form(None),
+    height: int = Form(None),
+    mode: str = Form("fast"),
+    target_width: int = Form(3840),
+    budget_s: float = Form(None)
+):
+    # Dry run of /api/upload: which passes would run and what they would cost.
+    # Give either the image (only its header is read) or its width/height.
+    try:
+        from enhancer.enhance import plan_upscale, MODELS
+        import decoding
+        
+        if file is not None:
+            width, height = decoding.output_size(decoding.probe(file.file), min_width=target_width)
+        if not width or not height or width <= 0 or height <= 0 or target_width <= 0:
+            return {"error": "Provide an image or a positive width and height"}
+        if mode != "auto" and mode not in MODELS:
+            mode = "fast"
+        
+        plan = plan_upscale(width, height, target_width)
+        route = routing.choose(
+            "sr", plan["cost_mp"], budget_s,
+            ceiling=None if mode == "auto" else f"sr:{mode}", record=False
+        )
+        return {"plan": plan, "routing": route, "estimated_s": route["estimated_s"]}
+    except Exception as e:
+        print(f"Error planning enhancement: {e}")
+        return {"error": str(e)}
+
 # --------------------------------------------------------------------------------
 # Freepik Downloader Endpoint
 # --------------------------------------------------------------------------------
@@ -140,30 +589,70 @@ from pydantic import BaseModel
 
 class FreepikRequest(BaseModel):
     url: str
+    op_id: str = None
+
+def canonical_url(url):
+    # Same page regardless of scheme/host case, surrounding spaces or #fragment
+    parsed = urlparse(url.strip())
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), fragment="").geturl()
 
 @app.post("/api/freepik")
 async def freepik_download(request: FreepikRequest):
     try:
-        url = request.url
+        with progress.track(request.op_id, "freepik") as op:
+            # One browser per URL: concurrent requests for the same link share it
+            result, shared = await FREEPIK_FLIGHTS.do(
+                canonical_url(request.url), _freepik_download, request.url.strip(),
+                retry_on=(progress.OperationCancelled,)
+            )
+            if "error" in result and op:
+                op.finish("failed", result["error"])
+            return result
+    except progress.OperationCancelled:
+        print(f"[INFO] Freepik download cancelled: {request.op_id}")
+        return {"error": "Operation cancelled", "cancelled": True}
+
+def is_direct_image_link(u):
+    path = urlparse(u).path.lower()
+    return any(path.endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.webp', '.gif'])
+
+async def resolve_freepik_image(url):
+    """High-res image URL for a Freepik page (or the URL itself if it is an image); None if blocked."""
+    # Lazy load Freepik logic to prevent startup crashes
+    from Freepik_img import resolve_with_browser
+
+    # 1. Resolve High-Res URL using Browser (Blocking, run in thread)
+    # But first check if it's already a direct image
+    if is_direct_image_link(url):
+        return url
+    progress.report("resolve", "Resolving high-res image URL...", percent=5)
+    with stage("freepik.resolve"):
+        image_url = await asyncio.to_thread(resolve_with_browser, url)
+    if not image_url or image_url == url:
+        return None
+    return image_url
+
+def fetch_image(image_url, out):
+    # Stream the image into the file object out
+    from Freepik_img import HEADERS
+    with requests.get(image_url, headers=HEADERS, stream=True) as r:
+        r.raise_for_status()
+        total = int(r.headers.get("Content-Length") or 0) or None
+        received = 0
+        for chunk in r.iter_content(chunk_size=8192):
+            out.write(chunk)
+            received += len(chunk)
+            # Also the cancellation point between chunks
+            progress.report("download", "Downloading high-res image...",
+                            percent=50 + 50 * received / total if total else None,
+                            done=received, total=total)
+
+async def _freepik_download(url):
+    try:
         print(f"[INFO] Received Freepik URL: {url}")
         
-        # Lazy load Freepik logic to prevent startup crashes
-        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-        from Freepik_img import resolve_with_browser
-
-        # 1. Resolve High-Res URL using Browser (Blocking, run in thread)
-        # But first check if it's already a direct image
-        def is_direct_image_link(u):
-            from urllib.parse import urlparse
-            path = urlparse(u).path.lower()
-            return any(path.endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.webp', '.gif'])
-
-        if is_direct_image_link(url):
-            image_url = url
-        else:
-            image_url = await asyncio.to_thread(resolve_with_browser, url)
-        
-        if not image_url or (image_url == url and not is_direct_image_link(url)):
+        image_url = await resolve_freepik_image(url)
+        if not image_url:
              # Check if we can get more info (this would require refactoring resolve_with_browser to return dict)
              return {"error": "Failed to resolve high-res image. The server might be blocked by Freepik or Cloudflare. Please try a different URL."}
 
@@ -191,12 +680,12 @@ async def freepik_download(request: FreepikRequest):
 
         output_path = os.path.join(UPLOAD_DIR, filename)
 
-        from Freepik_img import HEADERS
-        with requests.get(image_url, headers=HEADERS, stream=True) as r:
-            r.raise_for_status()
+        def download():
             with open(output_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+                fetch_image(image_url, f)
+
+        with stage("freepik.download"):
+            await asyncio.to_thread(download)
         
         print(f"[SUCCESS] Saved to: {output_path}")
 
@@ -262,41 +751,170 @@ async def delete_all_projects():
         return {"error": str(e)}
 
 @app.post("/api/remove-bg")
-async def remove_background(image: UploadFile = File(...)):
+async def remove_background(
+    request: Request,
+    image: UploadFile = File(...),
+    format: str = Form("png"),
+    model: str = Form("auto"),
+    budget_s: float = Form(None),
+    op_id: str = Form(None)
+):
     try:
         # Save uploaded image
         filename = f"{int(time.time())}_{image.filename}"
         input_path = os.path.join(UPLOAD_DIR, filename)
         
+        input_data = await image.read()
         with open(input_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-            
-        # Process with rembg
-        with open(input_path, "rb") as f:
-            input_data = f.read()
+            buffer.write(input_data)
             
         # Lazy load rembg
-        from rembg import remove, new_session
+        from bg_remover.remover import remove_background as remove_bg, OUTPUT_FORMATS
+        import decoding
         
-        # Use lightweight model for memory efficiency
-        model_name = "u2netp"
-        session = new_session(model_name)
-        output_data = remove(input_data, session=session)
+        import encoding
         
-        # Save as PNG to preserve transparency
-        output_filename = f"{os.path.splitext(filename)[0]}_no_bg.png"
-        output_path = os.path.join(UPLOAD_DIR, output_filename)
+        # png / webp / avif keep transparency; "mask" returns only the alpha
+        # matte; "auto" negotiates from the Accept header (png otherwise)
+        output = format.lower()
+        if output == "auto":
+            output = encoding.negotiate(output, request.headers.get("accept"), "png", has_alpha=True)
+        if output not in OUTPUT_FORMATS:
+            return {"error": f"Unknown format '{format}' (use auto or one of {', '.join(OUTPUT_FORMATS)})"}
+        
+        width, height = decoding.output_size(decoding.probe(input_data))
+        megapixels = width * height / 1e6
+        route = routing.choose(
+            "rembg", megapixels, budget_s,
+            ceiling=None if model == "auto" else f"rembg:{model}"
+        )
         
-        with open(output_path, "wb") as f:
-            f.write(output_data)
+        async def work():
+            output_data = await run_job(remove_bg, input_data, route["model"], output=output)
             
+            suffix = "_mask" if output == "mask" else "_no_bg"
+            output_filename = f"{os.path.splitext(filename)[0]}{suffix}{OUTPUT_FORMATS[output][0]}"
+            output_path = os.path.join(UPLOAD_DIR, output_filename)
+            
+            delivery.write_artifact(output_path, output_data)
+            return {
+                "original_url": f"/uploads/{filename}",
+                "cleaned_url": await delivery.artifact_url(output_path),
+                "filename": output_filename,
+                "model": route["model"]
+            }
+        
+        with progress.track(op_id, "remove-bg") as op:
+            response, shared = await REMOVE_BG_FLIGHTS.do(
+                fingerprint(hashlib.sha256(input_data).digest(), route["model"], output), work,
+                retry_on=(progress.OperationCancelled,)
+            )
+            if "error" in response and op:
+                op.finish("failed", response["error"])
+            
+        return {**response, "routing": route, "coalesced": shared}
+    except progress.OperationCancelled:
+        print(f"[INFO] Background removal cancelled: {op_id}")
+        return {"error": "Operation cancelled", "cancelled": True}
+    except Exception as e:
+        print(f"[ERROR] BG Removal Error: {e}")
+        return {"error": str(e)}
+
+@app.post("/api/remove-video-bg")
+async def remove_video_bg(video: UploadFile = File(...), format: str = Form("webm"), op_id: str = Form(None)):
+    try:
+        filename = f"{int(time.time())}_{video.filename}"
+        input_path = os.path.join(UPLOAD_DIR, filename)
+        with open(input_path, "wb") as buffer:
+            shutil.copyfileobj(video.file, buffer)
+
+        # .webm / .mov keep the alpha channel, .mp4 gets a black background
+        ext = format.lower().lstrip(".")
+        if ext not in ("webm", "mov", "mp4", "gif"):
+            ext = "webm"
+        output_filename = f"{os.path.splitext(filename)[0]}_no_bg.{ext}"
+        output_path = os.path.join(UPLOAD_DIR, output_filename)
+
+        # Lazy load moviepy + rembg
+        from video_remover.remove_video import remove_video_background
+
+        with progress.track(op_id, "remove-video-bg") as op:
+            result = await run_job(remove_video_background, input_path, output_path)
+            if not result and op:
+                op.finish("failed", "Failed to process video")
+
+        if not result:
+            return {"error": "Failed to process video"}
         return {
             "original_url": f"/uploads/{filename}",
-            "cleaned_url": f"/uploads/{output_filename}",
+            "cleaned_url": await delivery.artifact_url(output_path),
             "filename": output_filename
         }
+    except progress.OperationCancelled:
+        print(f"[INFO] Video background removal cancelled: {op_id}")
+        return {"error": "Operation cancelled", "cancelled": True}
     except Exception as e:
-        print(f"[ERROR] BG Removal Error: {e}")
+        print(f"[ERROR] Video BG Removal Error: {e}")
+        return {"error": str(e)}
+
+# --------------------------------------------------------------------------------
+# Multi-step Pipeline
+# --------------------------------------------------------------------------------
+# One request for a chain like Freepik -> remove logo -> remove background ->
+# enhance: the image stays decoded in memory between steps (pipeline.py).
+@app.post("/api/pipeline")
+async def run_pipeline(
+    request: Request,
+    steps: str = Form(...),
+    image: UploadFile = File(None),
+    url: str = Form(None),
+    format: str = Form("auto"),
+    budget_s: float = Form(None),
+    op_id: str = Form(None)
+):
+    try:
+        import pipeline
+        
+        # Validate everything before downloading or running anything
+        step_list = pipeline.parse_steps(steps)
+        if (image is None) == (not url):
+            return {"error": "Provide either an image or a url"}
+        
+        with progress.track(op_id, "pipeline") as op:
+            if image is not None:
+                data = await image.read()
+                name = os.path.basename(image.filename or "image")
+            else:
+                # Freepik page or direct image link, downloaded into memory
+                with progress.span(0, 5, "Download"):
+                    image_url = await resolve_freepik_image(url.strip())
+                    if not image_url:
+                        error = "Failed to resolve high-res image. The server might be blocked by Freepik or Cloudflare. Please try a different URL."
+                        if op:
+                            op.finish("failed", error)
+                        return {"error": error}
+                    buffer = io.BytesIO()
+                    with stage("freepik.download"):
+                        await asyncio.to_thread(fetch_image, image_url, buffer)
+                data = buffer.getvalue()
+                name = os.path.basename(urlparse(image_url).path) or "freepik.jpg"
+            
+            output_data, ext, info = await run_job(
+                pipeline.run_pipeline, data, step_list, format.lower(), budget_s, request.headers.get("accept")
+            )
+        
+        output_filename = f"{int(time.time())}_{os.path.splitext(name)[0]}_pipeline{ext}"
+        output_path = delivery.write_artifact(os.path.join(UPLOAD_DIR, output_filename), output_data)
+        return {
+            "result_url": await delivery.artifact_url(output_path),
+            "filename": output_filename,
+            **info
+        }
+    except progress.OperationCancelled:
+        print(f"[INFO] Pipeline cancelled: {op_id}")
+        return {"error": "Operation cancelled", "cancelled": True}
+    except Exception as e:
+        print(f"[ERROR] Pipeline Error: {e}")
         return {"error": str(e)}
 
 if __name__ == "__main__":
@@ -0,0 +1,297 @@
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import Counter, Gauge
+
+# --------------------------------------------------------------------------------
+# Editing Sessions
+# --------------------------------------------------------------------------------
+# Interactive logo removal is a loop: clean, look, paint a bit more, clean
+# again. A session keeps the decoded original and the latest result in memory
+# so a refinement only has to upload the new mask and re-inpaint its region.
+#
+# Sessions live in the memory of the worker process that uses them. With
+# several workers (gunicorn.conf.py) a refinement usually lands on another
+# worker than the last one, so there every session is also written to
+# STUDIO_SESSION_DIR (SharedSessions): the original, the latest result and its
+# revision. A worker that does not have a session, or has an older revision,
+# loads it from there, and a file lock runs the refinements of one session one
+# at a time across workers. Without the directory a refinement on another
+# worker gets a 404 and the client falls back to a full run; the miss rate is
+# studio_edit_session_lookups_total{outcome="miss"}.
+
+MAX_SESSIONS = int(os.environ.get("STUDIO_MAX_SESSIONS", "16"))
+SESSION_TTL = int(os.environ.get("STUDIO_SESSION_TTL", "1800"))  # seconds idle
+SESSION_MEMORY_MB = int(os.environ.get("STUDIO_SESSION_MEMORY_MB", "1024"))  # per worker, and on disk
+SESSION_DIR = os.environ.get("STUDIO_SESSION_DIR", "")
+SESSION_ID = re.compile(r"[0-9a-f]{32}")
+
+SESSION_LOOKUPS = Counter(
+    "studio_edit_session_lookups_total",
+    "Editing session lookups (hit = in this worker, loaded = from STUDIO_SESSION_DIR, miss = not found / expired).",
+    ["outcome"],
+)
+
+
+class EditSession:
+    def __init__(self, session_id, image, name, created_at=None):
+        self.id = session_id
+        self.image = image        # decoded original, never modified
+        self.result = image       # latest cleaned version
+        self.name = name          # uploaded file name (stem/extension for outputs)
+        self.revision = 0
+        self.created_at = created_at or time.time()
+        self.last_used = self.created_at
+        self.lock = _SessionLock(self)
+
+    @property
+    def nbytes(self):
+        if self.result is self.image:
+            return self.image.nbytes
+        return self.image.nbytes + self.result.nbytes
+
+    def update(self, result):
+        self.result = result
+        self.revision += 1
+        self.last_used = time.time()
+        if _store is not None:
+            _store.save_result(self)
+
+    def info(self):
+        h, w = self.image.shape[:2]
+        return {
+            "session_id": self.id,
+            "width": w,
+            "height": h,
+            "revision": self.revision,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+            "expires_in": max(0, int(self.last_used + SESSION_TTL - time.time())),
+        }
+
+
+class _SessionLock:
+    # Refinements build on each other: run them one at a time per session, in
+    # this worker (threading.Lock) and across workers (flock in SESSION_DIR)
+    def __init__(self, session):
+        self.session = session
+        self._lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if _store is not None:
+            try:
+                self._file = _store.lock(self.session.id)
+                # Another worker may have refined it since this one loaded it
+                _store.refresh(self.session)
+            except BaseException:
+                self.__exit__()
+                raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            # Closing the file releases the flock
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+# --------------------------------------------------------------------------------
+# Shared Session Directory (multi-worker)
+# --------------------------------------------------------------------------------
+# <SESSION_DIR>/<session id>/
+#   original.npy, result.npy (from revision 1), meta.json (mtime = last used),
+#   lock (flock target)
+
+class SharedSessions:
+    """Sessions as files in a directory that all workers on the host use."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, session_id, name=""):
+        return os.path.join(self.root, session_id, name)
+
+    def _replace(self, path, write):
+        # Readers on other workers never see a half-written file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+
+    def _write_meta(self, session):
+        meta = {"name": session.name, "revision": session.revision, "created_at": session.created_at}
+        self._replace(self._path(session.id, "meta.json"), lambda f: f.write(json.dumps(meta).encode()))
+
+    def create(self, session):
+        os.makedirs(self._path(session.id), exist_ok=True)
+        self._replace(self._path(session.id, "original.npy"), lambda f: np.save(f, session.image))
+        self._write_meta(session)
+
+    def save_result(self, session):
+        self._replace(self._path(session.id, "result.npy"), lambda f: np.save(f, session.result))
+        self._write_meta(session)
+
+    def meta(self, session_id):
+        try:
+            with open(self._path(session_id, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load(self, session_id):
+        meta = self.meta(session_id)
+        if meta is None:
+            return None
+        image = np.load(self._path(session_id, "original.npy"))
+        session = EditSession(session_id, image, meta["name"], meta["created_at"])
+        self.refresh(session, meta)
+        return session
+
+    def refresh(self, session, meta=None):
+        """Bring a session up to the latest revision written by any worker."""
+        meta = meta or self.meta(session.id)
+        if meta is None:
+            raise ValueError("Session not found or expired")
+        # Only forward: a refinement of this worker may be writing a newer one
+        if meta["revision"] > session.revision:
+            session.result = np.load(self._path(session.id, "result.npy"))
+            session.revision = meta["revision"]
+
+    def touch(self, session_id):
+        try:
+            os.utime(self._path(session_id, "meta.json"))
+        except FileNotFoundError:
+            pass
+
+    def lock(self, session_id):
+        try:
+            f = open(self._path(session_id, "lock"), "a")
+        except FileNotFoundError:
+            raise ValueError("Session not found or expired")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def delete(self, session_id):
+        existed = os.path.isdir(self._path(session_id))
+        shutil.rmtree(self._path(session_id), ignore_errors=True)
+        return existed
+
+    def prune(self):
+        # Same policy as _evict(): idle ones first, then least recently used
+        # until both limits hold (never the newest)
+        entries = []
+        for session_id in os.listdir(self.root):
+            path = self._path(session_id)
+            try:
+                meta = os.path.join(path, "meta.json")
+                used = os.stat(meta if os.path.exists(meta) else path).st_mtime
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+            except FileNotFoundError:
+                continue
+            entries.append((used, session_id, size))
+        entries.sort()
+        now = time.time()
+        total = sum(size for _, _, size in entries)
+        budget = SESSION_MEMORY_MB * 1024 * 1024
+        left = len(entries)
+        for used, session_id, size in entries[:-1]:
+            if now - used > SESSION_TTL or left > MAX_SESSIONS or total > budget:
+                shutil.rmtree(self._path(session_id), ignore_errors=True)
+                total -= size
+                left -= 1
+
+
+_store = None
+if SESSION_DIR:
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    _store = SharedSessions(SESSION_DIR)
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def _memory_used():
+    return sum(s.nbytes for s in _sessions.values())
+
+
+def _evict():
+    # Idle ones first, then least recently used until both limits hold
+    now = time.time()
+    for session_id in list(_sessions):
+        if now - _sessions[session_id].last_used > SESSION_TTL:
+            del _sessions[session_id]
+    budget = SESSION_MEMORY_MB * 1024 * 1024
+    # (never the one just created, even if it alone is over the budget)
+    while len(_sessions) > 1 and (len(_sessions) > MAX_SESSIONS or _memory_used() > budget):
+        session_id, _ = _sessions.popitem(last=False)
+        print(f"[INFO] Evicted editing session {session_id}")
+
+
+def create_session(image, name):
+    session = EditSession(uuid.uuid4().hex, image, name)
+    if _store is not None:
+        _store.prune()
+        _store.create(session)
+    with _sessions_lock:
+        _sessions[session.id] = session
+        _evict()
+    return session
+
+
+def get_session(session_id):
+    if not SESSION_ID.fullmatch(session_id or ""):
+        SESSION_LOOKUPS.inc(outcome="miss")
+        return None
+    with _sessions_lock:
+        _evict()
+        session = _sessions.get(session_id)
+        if session is not None:
+            _sessions.move_to_end(session_id)
+    outcome = "hit"
+    if _store is not None:
+        meta = _store.meta(session_id)
+        if meta is None:
+            # Closed or expired through another worker
+            with _sessions_lock:
+                _sessions.pop(session_id, None)
+            session = None
+        elif session is None:
+            session = _store.load(session_id)
+            outcome = "loaded"
+            with _sessions_lock:
+                session = _sessions.setdefault(session_id, session)
+                _evict()
+        else:
+            _store.refresh(session, meta)
+        if session is not None:
+            _store.touch(session_id)
+    if session is None:
+        SESSION_LOOKUPS.inc(outcome="miss")
+        return None
+    SESSION_LOOKUPS.inc(outcome=outcome)
+    session.last_used = time.time()
+    return session
+
+
+def delete_session(session_id):
+    with _sessions_lock:
+        deleted = _sessions.pop(session_id, None) is not None
+    if _store is not None and SESSION_ID.fullmatch(session_id or ""):
+        deleted = _store.delete(session_id) or deleted
+    return deleted
+
+
+SESSIONS_OPEN = Gauge("studio_edit_sessions", "Open interactive editing sessions.", function=lambda: len(_sessions))
+SESSIONS_BYTES = Gauge("studio_edit_session_bytes", "Image memory held by editing sessions.", function=lambda: _memory_used())
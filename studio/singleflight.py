@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+import json
+import time
+
+import progress
+from metrics import Counter
+
+# --------------------------------------------------------------------------------
+# Single-flight Request Coalescing
+# --------------------------------------------------------------------------------
+# Double-submits and many users pasting the same Freepik link used to start
+# the same work several times in parallel (a Chrome per call, duplicate
+# inference). A Group runs one computation per key at a time: the first
+# caller (leader) starts it, callers arriving while it is in flight await the
+# same result. Nothing is cached once the computation has finished.
+# A coalesced caller's operation (progress.py) mirrors the leader's progress,
+# and cancelling it only stops that caller from waiting: the work goes on for
+# the others.
+#
+# All bookkeeping happens on the event loop, so no locks are needed.
+
+COALESCED = Counter(
+    "studio_singleflight_requests_total",
+    "Requests by single-flight outcome (leader ran the work, coalesced awaited it).",
+    ["group", "outcome"],
+)
+SAVED_SECONDS = Counter(
+    "studio_singleflight_saved_seconds_total",
+    "Compute time not spent thanks to coalescing (work duration x coalesced callers).",
+    ["group"],
+)
+
+
+def fingerprint(*parts):
+    """Stable key from bytes / str / JSON-serializable parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            data = bytes(part)
+        elif isinstance(part, str):
+            data = part.encode()
+        else:
+            data = json.dumps(part, sort_keys=True, default=str).encode()
+        # Length prefix so ("ab", "c") and ("a", "bc") differ
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class _Call:
+    def __init__(self, task, op):
+        self.task = task
+        self.op = op  # the leader's operation, if it has one
+        self.followers = 0
+        self.started_at = time.perf_counter()
+
+
+class Group:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, fn, *args, retry_on=(), **kwargs):
+        """
+        Run `await fn(*args, **kwargs)` once per key at a time.
+
+        Returns (result, shared) where shared is True for coalesced callers.
+        The work runs in its own task (with the leader's context), so one
+        caller going away does not cancel it for the others. If the shared
+        work fails with an exception in retry_on (e.g. the leader cancelled
+        its own operation), followers start over instead of inheriting it.
+        """
+        while True:
+            call = self._calls.get(key)
+            if call is None:
+                COALESCED.inc(group=self.name, outcome="leader")
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                call = self._calls[key] = _Call(task, progress.current())
+                task.add_done_callback(lambda t, key=key, call=call: self._finished(key, call))
+                return await asyncio.shield(task), False
+
+            call.followers += 1
+            COALESCED.inc(group=self.name, outcome="coalesced")
+            try:
+                with progress.follow(call.op):
+                    return await progress.unless_cancelled(asyncio.shield(call.task)), True
+            except retry_on:
+                own = progress.current()
+                if own is not None and own.cancelled:
+                    # This caller was cancelled, not the leader
+                    raise
+                continue
+
+    def _finished(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if call.followers and not call.task.cancelled() and call.task.exception() is None:
+            SAVED_SECONDS.inc(call.followers * (time.perf_counter() - call.started_at), group=self.name)
@@ -66,12 +66,15 @@ async function handleUpload(file) {
     formData.append('mode', mode);
 
     const controller = createController(); // Create new signal
+    formData.append('op_id', watchProgress(loadingModeText));
 
     try {
         const response = await fetch('/upload', { method: 'POST', body: formData, signal: controller.signal });
         const data = await response.json();
 
         clearInterval(timerInterval); // Stop timer
+        stopProgress();
+        currentOpId = null;
 
         if (data.error) throw new Error(data.error);
 
@@ -162,6 +165,8 @@ document.getElementById('reset-btn').addEventListener('click', () => {
 // CANCELLATION LOGIC
 // ==========================================
 let currentController = null;
+let currentOpId = null;
+let progressSource = null;
 
 function createController() {
     if (currentController) currentController.abort();
@@ -169,7 +174,45 @@ function createController() {
     return currentController;
 }
 
+// Live progress: the server streams stage / percent / ETA for the operation
+// tagged with this id (Server-Sent Events).
+function watchProgress(textElement) {
+    stopProgress();
+    currentOpId = (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID()
+        : Date.now().toString(36) + Math.random().toString(36).slice(2);
+
+    progressSource = new EventSource('/progress/' + currentOpId);
+    progressSource.onmessage = (e) => {
+        const event = JSON.parse(e.data);
+        if (['done', 'failed', 'cancelled'].includes(event.status)) {
+            stopProgress();
+            return;
+        }
+        if (!event.message) return;
+        let text = event.message;
+        if (event.percent != null) text += ` ${Math.round(event.percent)}%`;
+        if (event.eta_s != null) text += ` (about ${Math.ceil(event.eta_s)}s left)`;
+        textElement.textContent = text;
+    };
+    progressSource.onerror = () => stopProgress(); // Progress is optional, the request still completes
+    return currentOpId;
+}
+
+function stopProgress() {
+    if (progressSource) {
+        progressSource.close();
+        progressSource = null;
+    }
+}
+
 function cancelProcessing() {
+    if (currentOpId) {
+        // Aborting the fetch alone leaves the job running on the server
+        fetch('/cancel/' + currentOpId, { method: 'POST' }).catch(() => {});
+        currentOpId = null;
+    }
+    stopProgress();
     if (currentController) {
         currentController.abort();
         currentController = null;
@@ -242,6 +285,7 @@ let currentQueueIndex = -1;
 let originalImage = new Image();
 let isDrawing = false;
 let currentFile = null;
+let removerSessionId = null; // Server-side editing session for the refine loop
 
 // Remover Upload Handling
 removerUploadArea.addEventListener('click', () => removerFileInput.click());
@@ -279,6 +323,7 @@ function selectQueueItem(index) {
     
     currentQueueIndex = index;
     currentFile = removerQueue[index];
+    removerSessionId = null;
     
     // Highlight active
     document.querySelectorAll('.queue-item').forEach((el, i) => {
@@ -333,11 +378,13 @@ function drawBaseImage() {
 // Drawing Logic
 function startDraw(e) {
     isDrawing = true;
+    maskStrokes.push({ radius: brushSizeInput.value / 2, points: [] });
     draw(e);
 }
 function stopDraw() {
     isDrawing = false;
     ctx.beginPath(); // Reset path
+    maskCtx.beginPath(); // Don't join the next stroke to this one
 }
 function draw(e) {
     if (!isDrawing) return;
@@ -371,7 +418,13 @@ function draw(e) {
 const maskCanvas = document.createElement('canvas');
 const maskCtx = maskCanvas.getContext('2d');
 
+// The strokes are also kept as polylines: sent as a compact mask_spec they
+// are a few KB instead of a full-size PNG, and the server rasterizes them at
+// the image's real resolution.
+let maskStrokes = [];
+
 function initMaskCanvas() {
+    maskStrokes = [];
     maskCanvas.width = canvas.width;
     maskCanvas.height = canvas.height;
     maskCtx.fillStyle = 'black';
@@ -387,6 +440,9 @@ initRemover = function(file) {
 }
 
 function drawMaskOnHiddenCanvas(x, y) {
+    if (maskStrokes.length) {
+        maskStrokes[maskStrokes.length - 1].points.push([Math.round(x * 10) / 10, Math.round(y * 10) / 10]);
+    }
     maskCtx.lineWidth = brushSizeInput.value;
     maskCtx.lineTo(x, y);
     maskCtx.stroke();
@@ -436,45 +492,71 @@ removeBtn.addEventListener('click', async () => {
         return;
     }
 
-    // 1. Get Mask Blob
-    maskCanvas.toBlob(async (maskBlob) => {
-        removerLoading.classList.remove('hidden');
-        canvasContainer.classList.add('hidden');
-        removerQueueContainer.classList.add('hidden'); // Hide queue during process
+    // 1. Describe the mask (strokes in canvas coordinates)
+    const maskSpec = JSON.stringify({
+        width: maskCanvas.width,
+        height: maskCanvas.height,
+        strokes: maskStrokes.filter(s => s.points.length)
+    });
 
-        const formData = new FormData();
-        formData.append('image', currentFile);
-        formData.append('mask', maskBlob, 'mask.png');
+    removerLoading.classList.remove('hidden');
+    canvasContainer.classList.add('hidden');
+    removerQueueContainer.classList.add('hidden'); // Hide queue during process
 
-        const controller = createController();
+    const controller = createController();
+    const opId = watchProgress(document.getElementById('remover-progress-text'));
 
-        try {
-            const response = await fetch('/remove-logo', { method: 'POST', body: formData, signal: controller.signal });
-            const data = await response.json();
+    try {
+        let data = null;
+
+        // Refining: the server still has the image and the last result,
+        // so only the new strokes are sent and only their region is redone
+        if (removerSessionId) {
+            const refineData = new FormData();
+            refineData.append('mask_spec', maskSpec);
+            refineData.append('op_id', opId);
+            const response = await fetch(`/sessions/${removerSessionId}/refine`, { method: 'POST', body: refineData, signal: controller.signal });
+            if (response.status === 404) {
+                removerSessionId = null; // Expired: fall back to a full run below
+            } else {
+                data = await response.json();
+            }
+        }
 
-            if (data.error) throw new Error(data.error);
+        if (!data) {
+            const formData = new FormData();
+            formData.append('image', currentFile);
+            formData.append('mask_spec', maskSpec);
+            formData.append('op_id', opId);
+            const response = await fetch('/sessions', { method: 'POST', body: formData, signal: controller.signal });
+            data = await response.json();
+            removerSessionId = data.session_id || null;
+        }
+        stopProgress();
+        currentOpId = null;
 
-            removerImgResult.src = data.cleaned_url;
-            document.getElementById('remover-img-original').src = originalImage.src; // Set original for comparison
-            
-            document.getElementById('remover-download-btn').href = data.cleaned_url;
+        if (data.error) throw new Error(data.error);
 
-            removerLoading.classList.add('hidden');
-            removerResult.classList.remove('hidden');
-            
-            // Adjust slider after images are visible
-            setTimeout(() => removerSlider.adjust(), 100);
-            
-            showToast("Object removed successfully! ✨", "info");
-        } catch (error) {
-            if (error.name === 'AbortError') {
-                console.log('Removal cancelled');
-                return;
-            }
-            showToast('Error: ' + error.message, "error");
-            location.reload();
+        removerImgResult.src = data.cleaned_url;
+        document.getElementById('remover-img-original').src = originalImage.src; // Set original for comparison
+        
+        document.getElementById('remover-download-btn').href = data.cleaned_url;
+
+        removerLoading.classList.add('hidden');
+        removerResult.classList.remove('hidden');
+        
+        // Adjust slider after images are visible
+        setTimeout(() => removerSlider.adjust(), 100);
+        
+        showToast("Object removed successfully! ✨", "info");
+    } catch (error) {
+        if (error.name === 'AbortError') {
+            console.log('Removal cancelled');
+            return;
         }
-    });
+        showToast('Error: ' + error.message, "error");
+        location.reload();
+    }
 });
 
 
@@ -485,6 +567,8 @@ function resetRemover() {
     cancelProcessing();
     
     // Clear State
+    if (removerSessionId) fetch(`/sessions/${removerSessionId}`, { method: 'DELETE' }).catch(() => {});
+    removerSessionId = null;
     currentFile = null;
     removerQueue = [];
     currentQueueIndex = -1;
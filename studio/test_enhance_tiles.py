@@ -0,0 +1,56 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from enhancer import enhance
+
+
+class BoxNet:
+    # Stand-in for a cv2.dnn_superres net whose receptive field reaches
+    # `radius` input pixels: a (2 * radius + 1) box blur, then a x`scale` resize
+    def __init__(self, radius, scale=4):
+        self.radius, self.scale = radius, scale
+
+    def upsample(self, img):
+        k = 2 * self.radius + 1
+        blurred = cv2.blur(img.astype(np.float32), (k, k), borderType=cv2.BORDER_REFLECT)
+        h, w = img.shape[:2]
+        return cv2.resize(blurred, (w * self.scale, h * self.scale), interpolation=cv2.INTER_NEAREST)
+
+
+def _image(size=160):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+
+
+def test_pad_covering_the_receptive_field_matches_a_full_pass():
+    img = _image()
+    net = BoxNet(radius=12)
+    full = net.upsample(img)
+    tiled = enhance.upsample_tiled(net, img, 4, tile=64, pad=12, out=np.empty_like(full))
+    assert np.array_equal(tiled, full)
+    # A pad short of the receptive field leaves seams
+    seams = enhance.upsample_tiled(net, img, 4, tile=64, pad=4, out=np.empty_like(full))
+    assert not np.array_equal(seams, full)
+
+
+@pytest.mark.parametrize("mode", list(enhance.MODELS))
+def test_tiled_matches_untiled(mode):
+    # Only a model that is already on disk: get_superres would download it
+    filename, _ = enhance.MODELS[mode]["files"][4]
+    model_path = os.path.join(os.path.dirname(enhance.__file__), filename)
+    if not enhance.is_valid_model(model_path):
+        pytest.skip(f"{mode} x4 model not available locally")
+    sr = cv2.dnn_superres.DnnSuperResImpl_create()
+    sr.readModel(model_path)
+    sr.setModel(enhance.MODELS[mode]["name"], 4)
+    img = cv2.GaussianBlur(_image(), (0, 0), 2)
+    _, pad = enhance.tile_settings(mode)
+    full = sr.upsample(img)
+    # Small tiles so the 160 px input really is split
+    tiled = enhance.upsample_tiled(sr, img, 4, tile=64, pad=pad)
+    diff = np.abs(tiled.astype(np.int16) - full.astype(np.int16))
+    # Different tile sizes may round differently in the last bit
+    assert diff.max() <= 2, f"{mode}: tiled output differs by up to {diff.max()}"
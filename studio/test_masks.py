@@ -0,0 +1,50 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from logo_remover.masks import decode_mask, encode_rle
+
+
+def test_rle_round_trip():
+    mask = np.zeros((40, 60), np.uint8)
+    mask[0, 0] = 255          # foreground first: counts start with 0
+    mask[10:20, 5:50] = 255
+    mask[-1, -3:] = 255
+    assert (decode_mask({"rle": encode_rle(mask)}, mask.shape) == mask).all()
+
+
+def test_oversized_rle_is_rejected_before_allocating():
+    # ~40 bytes of JSON asking for a 20000x20000 grid against a 100x100 image
+    spec = {"rle": {"size": [20000, 20000], "counts": [0, 400000000]}}
+    tracemalloc.start()
+    try:
+        with pytest.raises(ValueError, match="does not match the image"):
+            decode_mask(spec, (100, 100, 3))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 1024 * 1024
+
+
+def test_rle_runs_larger_than_the_image_are_rejected():
+    # Runs that wrap the int64 sum around to exactly h * w
+    spec = {"rle": {"size": [100, 100], "counts": [2 ** 62, 2 ** 62, 2 ** 62, 2 ** 62 + 10000]}}
+    with pytest.raises(ValueError, match="Invalid rle mask"):
+        decode_mask(spec, (100, 100))
+
+
+def test_rle_on_the_canvas_is_scaled_to_the_image():
+    canvas = np.zeros((45, 80), np.uint8)
+    canvas[10:20, 40:60] = 255
+    spec = {"width": 80, "height": 45, "rle": encode_rle(canvas)}
+    mask = decode_mask(spec, (90, 160, 3))
+    assert mask.shape == (90, 160)
+    assert (mask[20:40, 80:120] == 255).all()
+    assert mask.sum() == 255 * 20 * 40
+
+
+def test_rle_of_another_size_names_both_allowed_sizes():
+    spec = {"width": 80, "height": 45, "rle": {"size": [40, 80], "counts": [3200]}}
+    with pytest.raises(ValueError, match=r"the image \(90x160\) or the canvas \(45x80\)"):
+        decode_mask(spec, (90, 160))
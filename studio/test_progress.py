@@ -0,0 +1,136 @@
+import asyncio
+import json
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+import progress
+
+
+@pytest.fixture
+def shared_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress, "_store", progress.SharedStore(str(tmp_path / "progress.sqlite")))
+    monkeypatch.setattr(progress, "_operations", progress.OrderedDict())
+
+
+def _worker(op_id, steps, results):
+    # Stands in for the gunicorn worker that received the upload
+    try:
+        with progress.track(op_id, "test"):
+            for i in range(steps):
+                progress.report("work", f"step {i}", percent=100.0 * i / steps)
+                time.sleep(0.12)  # > MIN_EVENT_INTERVAL, so no event is coalesced away
+        results.put("done")
+    except progress.OperationCancelled:
+        results.put("cancelled")
+
+
+def _start(op_id, steps):
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_worker, args=(op_id, steps, results))
+    proc.start()
+    return proc, results
+
+
+def _wait_for_status(op_id, status, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        op = progress.get_operation(op_id)
+        if op is not None and op.status == status:
+            return op
+        time.sleep(0.05)
+    raise AssertionError(f"{op_id} never became {status}")
+
+
+def test_cancel_reaches_the_worker_running_the_operation(shared_store):
+    proc, results = _start("op-cancel", steps=200)
+    try:
+        _wait_for_status("op-cancel", "running")
+        progress.get_operation("op-cancel", create=True).cancel()
+        assert results.get(timeout=10) == "cancelled"
+    finally:
+        proc.join(10)
+    op = _wait_for_status("op-cancel", "cancelled")
+    assert op.snapshot()["last_event"]["stage"] == "cancelled"
+
+
+def test_progress_streams_from_another_worker(shared_store):
+    # Subscribed before the upload arrives, as the client does
+    op = progress.get_operation("op-stream", create=True)
+    proc, results = _start("op-stream", steps=5)
+
+    async def collect():
+        return [json.loads(chunk[len("data: "):]) async for chunk in progress.event_stream(op, keepalive=30)]
+
+    try:
+        events = asyncio.run(asyncio.wait_for(collect(), 20))
+        assert results.get(timeout=10) == "done"
+    finally:
+        proc.join(10)
+    assert [e["stage"] for e in events] == ["started"] + ["work"] * 5 + ["done"]
+    assert events[-1]["percent"] == 100.0
+
+
+def _coalesced_pair(leader_steps):
+    # Two requests for the same work: the second one is coalesced
+    import singleflight
+    group = singleflight.Group("test")
+    gate = threading.Event()
+
+    def job():
+        for i in range(leader_steps):
+            progress.report("work", f"step {i}", percent=100.0 * i / leader_steps)
+            time.sleep(0.12)
+        gate.wait(5)
+        return "result"
+
+    async def work():
+        return await asyncio.to_thread(job)
+
+    async def request(op_id):
+        try:
+            with progress.track(op_id, "test"):
+                return await group.do("key", work, retry_on=(progress.OperationCancelled,))
+        except progress.OperationCancelled:
+            return "cancelled"
+
+    return request, gate
+
+
+def test_coalesced_request_mirrors_the_leaders_progress():
+    request, gate = _coalesced_pair(leader_steps=3)
+
+    async def main():
+        leader = asyncio.ensure_future(request("lead-1"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(request("follow-1"))
+        await asyncio.sleep(0.5)
+        gate.set()
+        return await leader, await follower
+
+    assert asyncio.run(main()) == (("result", False), ("result", True))
+    events = progress.get_operation("follow-1").events
+    mirrored = [e for e in events if e.get("coalesced")]
+    assert [e["stage"] for e in mirrored] and all(e["stage"] == "work" for e in mirrored)
+    assert events[-1]["status"] == "done"
+
+
+def test_cancelling_a_coalesced_request_leaves_the_leader_running():
+    request, gate = _coalesced_pair(leader_steps=1)
+
+    async def main():
+        leader = asyncio.ensure_future(request("lead-2"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(request("follow-2"))
+        await asyncio.sleep(0.1)
+        progress.get_operation("follow-2").cancel()
+        cancelled = await asyncio.wait_for(follower, 2)
+        gate.set()
+        return cancelled, await leader
+
+    assert asyncio.run(main()) == ("cancelled", ("result", False))
+    assert progress.get_operation("follow-2").status == "cancelled"
+    assert progress.get_operation("lead-2").status == "done"
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import sessions
+
+
+@pytest.fixture
+def shared_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "_store", sessions.SharedSessions(str(tmp_path)))
+    monkeypatch.setattr(sessions, "_sessions", sessions.OrderedDict())
+
+
+def _other_worker(monkeypatch):
+    # A worker that has never seen the session in memory
+    monkeypatch.setattr(sessions, "_sessions", sessions.OrderedDict())
+
+
+def test_refine_on_another_worker_sees_the_latest_result(shared_dir, monkeypatch):
+    image = np.zeros((20, 30, 3), np.uint8)
+    first = sessions.create_session(image, "photo.png")
+    with first.lock:
+        first.update(image + 1)
+
+    _other_worker(monkeypatch)
+    second = sessions.get_session(first.id)
+    assert second is not first and second.name == "photo.png"
+    assert second.revision == 1 and (second.result == 1).all()
+    with second.lock:
+        second.update(second.result + 1)
+
+    # The first worker's copy catches up when it next uses the session
+    with first.lock:
+        assert first.revision == 2 and (first.result == 2).all()
+
+
+def test_closing_on_another_worker_closes_everywhere(shared_dir, monkeypatch):
+    session = sessions.create_session(np.zeros((4, 4), np.uint8), "a.png")
+    cached = dict(sessions._sessions)
+    _other_worker(monkeypatch)
+    assert sessions.delete_session(session.id)
+    monkeypatch.setattr(sessions, "_sessions", sessions.OrderedDict(cached))
+    assert sessions.get_session(session.id) is None
+
+
+def test_session_ids_cannot_leave_the_directory(shared_dir):
+    assert sessions.get_session("../../etc") is None
+    assert not sessions.delete_session("..")
@@ -1,10 +1,17 @@
 import os
+import sys
 from rembg import remove
 from moviepy.editor import VideoFileClip
 
 import numpy as np
 from PIL import Image
 
+# Allow running this file directly as well as importing it from the server
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bg_remover.remover import get_session
+from progress import report
+
 def remove_video_background(input_path, output_path):
     # Check if input file exists
     if not os.path.exists(input_path):
@@ -12,6 +19,7 @@ def remove_video_background(input_path, output_path):
         return
 
     print(f"Processing video: {input_path}")
+    report("load", f"Processing video: {os.path.basename(input_path)}", percent=0)
     
     # Load the video
     try:
@@ -20,6 +28,11 @@ def remove_video_background(input_path, output_path):
         print(f"Error loading video: {e}")
         return
 
+    # One session for the whole clip instead of reloading the model per frame
+    session = get_session("u2net")
+    total_frames = max(1, int(clip.fps * clip.duration))
+    frames_done = [0]
+
     # function to process each frame
     def process_frame(frame):
         # frame is a numpy array (Height, Width, 3)
@@ -28,7 +41,12 @@ def remove_video_background(input_path, output_path):
         pil_image = Image.fromarray(frame)
         
         # Remove background
-        result_image = remove(pil_image)
+        result_image = remove(pil_image, session=session)
+
+        frames_done[0] += 1
+        report("frames", f"Removing background (frame {frames_done[0]}/{total_frames})",
+               percent=min(99.0, 100.0 * frames_done[0] / total_frames),
+               done=frames_done[0], total=total_frames)
         
         # Convert back to numpy array
         # The result will be RGBA, so we preserve the alpha channel
@@ -59,17 +77,23 @@ def remove_video_background(input_path, output_path):
         codec = 'prores_ks' # supports alpha
     elif ext.lower() == '.gif':
         processed_clip.write_gif(output_path)
-        return
+        return output_path
 
     # If we want transparency in video, we need to set write_videofile params correctly
-    if codec in ['libvpx', 'prores_ks']:
+    # MP4 / MOV: move the index (moov atom) to the front so players can start
+    # from the first Range requests instead of needing the end of the file
+    faststart = ['-movflags', '+faststart']
+    if codec == 'libvpx':
          processed_clip.write_videofile(output_path, codec=codec, audio_codec='libvorbis')
+    elif codec == 'prores_ks':
+         processed_clip.write_videofile(output_path, codec=codec, audio_codec='libvorbis', ffmpeg_params=faststart)
     else:
         # Default fallback for mp4 (no transparency usually supported in standard players, background becomes black)
         # We can compose it dynamically over a color if needed, but raw removal is requested.
-        processed_clip.write_videofile(output_path, codec='libx264', audio_codec='aac')
+        processed_clip.write_videofile(output_path, codec='libx264', audio_codec='aac', ffmpeg_params=faststart)
 
     print(f"Done! Saved to {output_path}")
+    return output_path
 
 if __name__ == "__main__":
     # Example usage
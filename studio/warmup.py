@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+from metrics import Gauge, stage
+
+# --------------------------------------------------------------------------------
+# Startup Warm-up & Readiness
+# --------------------------------------------------------------------------------
+# STUDIO_PRELOAD=eager (default): import the pipelines, verify/download and load
+#   the models listed in STUDIO_PRELOAD_MODELS and run one dummy inference each,
+#   so ORT / OpenCV lazy initialization happens before the first user request.
+#   /ready answers 503 until this has finished.
+# STUDIO_PRELOAD=lazy: load nothing up front (low-memory hosts); models load on
+#   first use as before and /ready is immediately true.
+
+PRELOAD_MODE = os.environ.get("STUDIO_PRELOAD", "eager").lower()
+PRELOAD_MODELS = [
+    m.strip() for m in os.environ.get("STUDIO_PRELOAD_MODELS", "lama,sr:lite,sr:fast,sr:quality,rembg:u2netp").split(",")
+    if m.strip()
+]
+
+STATE = {
+    "mode": PRELOAD_MODE,
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "models": {name: "pending" for name in PRELOAD_MODELS},
+}
+_lock = threading.Lock()
+
+Gauge("studio_ready", "1 once startup warm-up has finished.", function=lambda: 1 if STATE["ready"] else 0)
+
+
+def _warm_one(name):
+    kind, _, variant = name.partition(":")
+    if kind == "lama":
+        from logo_remover import remover
+        remover.warmup()
+    elif kind == "sr":
+        from enhancer import enhance
+        enhance.warmup(variant or "fast")
+    elif kind == "rembg":
+        from bg_remover import remover
+        remover.warmup(variant or remover.DEFAULT_MODEL)
+    else:
+        raise ValueError(f"Unknown model '{name}'")
+
+
+def import_pipelines():
+    # Import the heavy modules (numpy, cv2, onnxruntime, rembg) once, up front.
+    # Call this from the main thread: rembg's native dependencies leave
+    # interpreter shutdown hanging when first imported from a worker thread.
+    import logo_remover.remover
+    import enhancer.enhance
+    import bg_remover.remover
+    import Freepik_img
+
+
+def prefork_load():
+    """Load what is safe to share across fork() (see gunicorn.conf.py).
+
+    Only the OpenCV super-resolution nets qualify: their weights are plain
+    memory and no forward pass runs here, so OpenCV's thread pool does not
+    exist yet. The dummy inference still happens per worker in run_warmup().
+    """
+    import_pipelines()
+    if PRELOAD_MODE == "lazy":
+        return
+    from enhancer import enhance
+    for name in PRELOAD_MODELS:
+        kind, _, variant = name.partition(":")
+        if kind == "sr":
+            try:
+                for scale in enhance.SR_PRELOAD_SCALES:
+                    enhance.get_superres(variant or "fast", scale)
+            except Exception as e:
+                print(f"[WARN] Pre-fork load failed for {name}: {e}")
+
+
+def run_warmup():
+    """Blocking warm-up. Model failures are recorded, not raised, so one
+    missing model does not keep the other pipelines out of service."""
+    with _lock:
+        if STATE["ready"]:
+            return STATE
+        STATE["started_at"] = time.time()
+
+        if PRELOAD_MODE == "lazy":
+            print("[INFO] Lazy preload mode: models load on first use")
+            STATE["models"] = {name: "lazy" for name in PRELOAD_MODELS}
+        else:
+            for name in PRELOAD_MODELS:
+                print(f"[INFO] Warming up {name}...")
+                try:
+                    with stage(f"warmup.{name}"):
+                        _warm_one(name)
+                    STATE["models"][name] = "ready"
+                except Exception as e:
+                    STATE["models"][name] = f"failed: {e}"
+                    print(f"[ERROR] Warm-up failed for {name}: {e}")
+
+        STATE["finished_at"] = time.time()
+        STATE["ready"] = True
+        print(f"[INFO] Warm-up finished in {STATE['finished_at'] - STATE['started_at']:.1f}s")
+        return STATE